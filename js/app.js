@@ -312,6 +312,7 @@ const app = (() => {
     const map = {
       rascunho:   '<span class="badge badge-muted">Rascunho</span>',
       agendado:   '<span class="badge badge-yellow">Agendado</span>',
+      publicando: '<span class="badge badge-blue">A publicar</span>',
       publicado:  '<span class="badge badge-green">Publicado</span>',
       erro:       '<span class="badge badge-red">Erro</span>',
     };
@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+"""
+bench_publish.py — Benchmark offline do publish.py contra servidores simulados
+
+Arranca servidores HTTP locais que imitam a Graph API (Instagram/Facebook),
+a TikTok Content Posting API, o upload resumível do YouTube, o PostgREST do
+Supabase e um CDN de media, com latência, jitter, taxa de erros e throttling
+configuráveis. Para cada tamanho de fila corre publish.main() num processo
+novo (modo drain + claim) e mede:
+
+  • posts por segundo (posts tratados / duração do main)
+  • p50/p95/p99 da duração das chamadas aos publishers, por plataforma
+  • pico de memória (RSS) do processo
+
+Os resultados vão para um JSON (--output) para comparar commits:
+
+  python scripts/bench_publish.py --output bench-base.json
+  git checkout outra-branch
+  python scripts/bench_publish.py --output bench-novo.json --compare bench-base.json
+
+Uso:
+  python scripts/bench_publish.py                           # filas de 10, 100, 1000, 10000
+  python scripts/bench_publish.py --sizes 10 100 --latency-ms 80 --jitter-ms 40 \\
+      --error-rate 0.02 --throttle-rpm 3000
+  python scripts/bench_publish.py --sizes 5000 --fixture fixture.json   # fila de gen_workload.py
+
+Os limites de ritmo do publish.py (PUBLISH_RATE_*) ficam desligados por
+omissão — com os valores de produção mediriam só o rate limiter; use
+--publish-rate para os incluir. Requer o pacote supabase (como o publish.py).
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import importlib.util
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import gen_workload
+
+SCRIPT_DIR    = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+PLATFORMS     = ('instagram', 'tiktok', 'facebook', 'youtube')
+
+# Hosts das APIs reais → serviço simulado
+API_HOSTS = {
+    'graph.facebook.com':  'graph',
+    'open.tiktokapis.com': 'tiktok',
+    'www.googleapis.com':  'youtube',
+}
+
+
+def percentile(values: list, pct: float) -> float:
+    """Percentil por interpolação linear (0 se não houver valores)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank    = (len(ordered) - 1) * pct / 100
+    low     = int(rank)
+    high    = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+# ── Servidores simulados ──────────────────────────────────────
+
+class Behaviour:
+    """Latência (± jitter), taxa de erros 503 e throttling (429) de um serviço simulado."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, throttle_rpm: float = 0, seed: int = 0):
+        self.latency  = latency_ms / 1000
+        self.jitter   = jitter_ms / 1000
+        self.errors   = error_rate
+        self.rpm      = throttle_rpm
+        self._tokens  = throttle_rpm
+        self._updated = time.monotonic()
+        self._random  = random.Random(seed)
+        self._lock    = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0
+        return max(0.0, self.latency + jitter)
+
+    def fail(self) -> bool:
+        if not self.errors:
+            return False
+        with self._lock:
+            return self._random.random() < self.errors
+
+    def take(self):
+        """Consome um pedido do balde. Devolve (permitido, uso em %)."""
+        if not self.rpm:
+            return True, 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens  = min(self.rpm, self._tokens + (now - self._updated) * self.rpm / 60)
+            self._updated = now
+            allowed = self._tokens >= 1
+            if allowed:
+                self._tokens -= 1
+            return allowed, round(100 * (1 - self._tokens / self.rpm))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, como as APIs reais
+
+    def setup(self):
+        super().setup()
+        # Cabeçalhos e corpo vão em writes separados: sem TCP_NODELAY, o Nagle
+        # e o ACK atrasado do cliente somam ~40 ms a cada resposta
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        server  = self.server
+        length  = int(self.headers.get('Content-Length') or 0)
+        body    = self.rfile.read(length) if length else b''
+        parts   = urlsplit(self.path)
+        query   = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+
+        time.sleep(server.behaviour.delay())
+        allowed, usage = server.behaviour.take()
+        if not allowed:
+            status, headers, payload = 429, {'Retry-After': '1'}, {'error': {'message': 'throttled'}}
+        elif server.behaviour.fail():
+            status, headers, payload = 503, {}, {'error': {'message': 'unavailable'}}
+        else:
+            status, headers, payload = server.app(self.command, parts.path, query, self.headers, body)
+        if server.usage_header and server.behaviour.rpm:
+            headers.setdefault(server.usage_header, json.dumps({'call_count': usage}))
+
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        headers.setdefault('Content-Type', 'application/json')
+        headers.setdefault('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+
+class StubServer(ThreadingHTTPServer):
+    """Servidor HTTP numa thread: `app(method, path, query, headers, body)` → (status, headers, payload)."""
+
+    daemon_threads     = True
+    request_queue_size = 256
+
+    def __init__(self, app, behaviour: Behaviour = None, usage_header: str = None):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.app          = app
+        self.behaviour    = behaviour or Behaviour()
+        self.usage_header = usage_header
+        self._thread      = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ProcessingClock:
+    """IDs que ficam prontos `seconds` depois de criados (Reels, publish_id TikTok)."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._ready  = {}
+        self._lock   = threading.Lock()
+        self._next   = 0
+
+    def create(self, prefix: str) -> str:
+        with self._lock:
+            self._next += 1
+            key = f'{prefix}{self._next}'
+            self._ready[key] = time.monotonic() + self.seconds
+        return key
+
+    def ready(self, key: str) -> bool:
+        return time.monotonic() >= self._ready.get(key, 0)
+
+
+class GraphApp:
+    """Graph API v19.0: /me, containers do Instagram (Reels com processamento) e Facebook."""
+
+    IG_USER_ID = '17841400000000001'
+
+    def __init__(self, processing: float):
+        self.containers = ProcessingClock(processing)
+
+    def __call__(self, method, path, query, headers, body):
+        form = {k: v[-1] for k, v in parse_qs(body.decode()).items()} if body else {}
+        path = path.rstrip('/')
+        if method == 'GET' and path.endswith('/me'):
+            return 200, {}, {'id': self.IG_USER_ID}
+        if method == 'GET' and path == '/v19.0' and 'ids' in query:
+            return 200, {}, {
+                cid: {'status_code': 'FINISHED' if self.containers.ready(cid) else 'IN_PROGRESS'}
+                for cid in query['ids'].split(',')
+            }
+        if method == 'POST' and path.endswith('/media'):
+            reels = form.get('media_type') == 'REELS'
+            cid = self.containers.create('1790') if reels else f'1790{random.randrange(10**9)}'
+            return 200, {}, {'id': cid}
+        if method == 'POST' and path.endswith(('/media_publish', '/photos', '/feed')):
+            return 200, {}, {'id': f'1800{random.randrange(10**12)}'}
+        return 404, {}, {'error': {'message': f'{method} {path} não simulado'}}
+
+
+class TikTokApp:
+    """Content Posting API v2: init de vídeo/foto, status/fetch e creator_info."""
+
+    def __init__(self, processing: float):
+        self.publishes = ProcessingClock(processing)
+
+    def __call__(self, method, path, query, headers, body):
+        ok = {'code': 'ok', 'message': ''}
+        if path.endswith(('/video/init/', '/content/init/')):
+            return 200, {}, {'data': {'publish_id': self.publishes.create('v_pub_')}, 'error': ok}
+        if path.endswith('/status/fetch/'):
+            publish_id = json.loads(body or b'{}').get('publish_id', '')
+            if self.publishes.ready(publish_id):
+                data = {'status': 'PUBLISH_COMPLETE', 'publicaly_available_post_id': [publish_id[6:]]}
+            else:
+                data = {'status': 'PROCESSING_DOWNLOAD'}
+            return 200, {}, {'data': data, 'error': ok}
+        if path.endswith('/creator_info/query/'):
+            return 200, {}, {'data': {'creator_username': 'bench'}, 'error': ok}
+        return 404, {}, {'error': {'code': 'not_found', 'message': path}}
+
+
+class YouTubeApp:
+    """Upload resumível: sessão no POST, blocos por PUT com Content-Range (308 até ao fim)."""
+
+    def __init__(self):
+        self.sessions = {}   # upload_id → [recebidos, total]
+        self._lock    = threading.Lock()
+        self._next    = 0
+
+    def __call__(self, method, path, query, headers, body):
+        if method == 'POST':
+            with self._lock:
+                self._next += 1
+                upload_id = str(self._next)
+                total = headers.get('X-Upload-Content-Length')
+                self.sessions[upload_id] = [0, int(total) if total else None]
+            location = f'https://www.googleapis.com/upload/youtube/v3/videos?uploadType=resumable&upload_id={upload_id}'
+            return 200, {'Location': location}, {}
+        if method != 'PUT':
+            return 405, {}, {}
+
+        session = self.sessions.get(query.get('upload_id'))
+        if session is None:
+            return 404, {}, {'error': {'message': 'sessão desconhecida'}}
+        rng = headers.get('Content-Range', '')[len('bytes '):]
+        span, _, total = rng.partition('/')
+        with self._lock:
+            if span != '*':
+                start = int(span.split('-')[0])
+                if start == session[0]:
+                    session[0] += len(body)
+            if total.isdigit():
+                session[1] = int(total)
+            received, size = session
+        if size is not None and received >= size:
+            return 200, {}, {'id': f"yt{query['upload_id']}"}
+        return 308, ({'Range': f'bytes=0-{received - 1}'} if received else {}), b''
+
+
+class MediaApp:
+    """CDN de media: /image/<n>.jpg e /video/<n>.mp4 com HEAD, Range e Content-Length."""
+
+    def __init__(self, image_bytes: int, video_bytes: int):
+        self.payloads = {'image': (b'\xff' * image_bytes, 'image/jpeg'),
+                         'video': (b'\x00' * video_bytes, 'video/mp4')}
+
+    def __call__(self, method, path, query, headers, body):
+        kind = path.strip('/').split('/')[0]
+        if kind not in self.payloads:
+            return 404, {}, b''
+        data, content_type = self.payloads[kind]
+        rng = headers.get('Range', '')
+        if rng.startswith('bytes='):
+            start, _, end = rng[len('bytes='):].partition('-')
+            end = int(end) if end else len(data) - 1
+            return 206, {'Content-Type': content_type,
+                         'Content-Range': f'bytes {start}-{end}/{len(data)}'}, data[int(start):end + 1]
+        return 200, {'Content-Type': content_type}, data
+
+
+class PostgrestApp:
+    """
+    PostgREST do Supabase reduzido ao que o publish.py usa em drain + claim:
+    rpc/claim_due_posts tira posts da fila e os PATCH e upserts a posts
+    registam o status final de cada um. Inserts e upserts devolvem as
+    linhas recebidas.
+    """
+
+    def __init__(self):
+        self._queue   = deque()
+        self.statuses = {}
+        self._lock    = threading.Lock()
+
+    def load(self, posts: list):
+        with self._lock:
+            self._queue   = deque(posts)
+            self.statuses = {}
+
+    def __call__(self, method, path, query, headers, body):
+        table = path.rsplit('/', 1)[-1]
+        if method == 'POST' and path.endswith('/rpc/claim_due_posts'):
+            limit = json.loads(body or b'{}').get('p_limit', 20)
+            with self._lock:
+                page = [self._queue.popleft() for _ in range(min(limit, len(self._queue)))]
+            return 200, {}, page
+        if method == 'POST' and '/rpc/' in path:
+            return 200, {}, []
+        if method == 'PATCH' and table == 'posts':
+            status = json.loads(body or b'{}').get('status')
+            ids    = query.get('id', '')
+            if ids.startswith('in.('):
+                ids = [i.strip('"') for i in ids[len('in.('):-1].split(',')]
+            else:
+                ids = [ids[len('eq.'):]]
+            with self._lock:
+                for post_id in ids:
+                    if status:
+                        self.statuses[post_id] = status
+            return 200, {}, []
+        if method == 'POST':
+            rows = json.loads(body or b'[]')
+            rows = rows if isinstance(rows, list) else [rows]
+            if table == 'posts':
+                with self._lock:
+                    for row in rows:
+                        self.statuses[row['id']] = row['status']
+            return 201, {}, rows
+        return 200, {}, []
+
+
+# ── Fila de posts ─────────────────────────────────────────────
+
+MEDIA_KINDS = {'imagem_url': 'image', 'video_url': 'video'}
+
+
+def queue_posts(size: int, media_url: str, seed: int = 1, fixture: dict = None) -> list:
+    """
+    Fila de até `size` posts: gerada por gen_workload (--due-only, mesma seed =
+    mesma fila) ou os posts 'agendado' de um fixture JSON. Os URLs de media
+    passam a apontar para o CDN simulado.
+    """
+    if fixture:
+        posts = [dict(p) for p in fixture.get('posts', []) if p.get('status', 'agendado') == 'agendado'][:size]
+    else:
+        now   = datetime.now(timezone.utc)
+        data  = gen_workload.generate(seed, counts={'posts': size}, now=now, due_only=True)
+        posts = gen_workload.to_json(data, now)['posts']
+    for post in posts:
+        for field, kind in MEDIA_KINDS.items():
+            if post.get(field):
+                post[field] = f"{media_url}/{kind}/{post[field].rsplit('/', 1)[-1]}"
+    posts.sort(key=lambda p: (p.get('agendado_para') or '', p['id']))
+    return posts
+
+
+# ── Processo de medição (publish.main) ────────────────────────
+
+def _install_stub_routes(pub, routes: dict):
+    """Monta no pub.http um adapter que reescreve os hosts das APIs para os servidores simulados."""
+    from requests.adapters import HTTPAdapter
+
+    class StubRouter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            target = routes.get(parts.hostname)
+            if target:
+                request.url = f"{target}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+            return super().send(request, **kwargs)
+
+    adapter = StubRouter(pool_connections=8, pool_maxsize=pub.MAX_WORKERS)
+    pub.http.mount('https://', adapter)
+    pub.http.mount('http://', adapter)
+
+
+def run_worker(config: dict) -> dict:
+    """Corre publish.main() com o ambiente de `config` e devolve as medições (processo filho)."""
+    import logging
+    import resource
+
+    spec = importlib.util.spec_from_file_location('publish', os.path.join(SCRIPT_DIR, 'publish.py'))
+    pub  = importlib.util.module_from_spec(spec)
+    sys.modules['publish'] = pub
+    spec.loader.exec_module(pub)
+    logging.getLogger().setLevel(config['log_level'])
+    _install_stub_routes(pub, config['routes'])
+
+    samples = defaultdict(list)
+
+    def timed(platform, publisher):
+        def call(post):
+            started = time.perf_counter()
+            try:
+                return publisher(post)
+            finally:
+                samples[platform].append(time.perf_counter() - started)
+        return call
+
+    for platform, publisher in list(pub.PUBLISHERS.items()):
+        pub.PUBLISHERS[platform] = timed(platform, publisher)
+
+    started = time.perf_counter()
+    try:
+        pub.main()
+        code = 0
+    except SystemExit as e:
+        code = e.code or 0
+    elapsed = time.perf_counter() - started
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024   # bytes no macOS, KiB no Linux
+    return {
+        'exit_code':       code,
+        'elapsed_seconds': round(elapsed, 3),
+        'peak_rss_mb':     round(rss_mb, 1),
+        'latency_ms': {
+            platform: {
+                'calls': len(values),
+                'p50':   round(percentile(values, 50) * 1000, 1),
+                'p95':   round(percentile(values, 95) * 1000, 1),
+                'p99':   round(percentile(values, 99) * 1000, 1),
+            } for platform, values in sorted(samples.items())
+        },
+        'http_requests': sum(c['value'] for c in pub.metrics.to_dict()['counters']
+                             if c['name'] == 'http_requests_total'),
+    }
+
+
+def worker_env(args, db_url: str) -> dict:
+    """Ambiente do publish.py no processo de medição."""
+    env = dict(os.environ,
+               SUPABASE_URL=db_url,
+               SUPABASE_KEY='bench-key',
+               INSTAGRAM_TOKEN='bench-instagram',
+               TIKTOK_TOKEN='bench-tiktok',
+               FACEBOOK_TOKEN='bench-facebook',
+               YOUTUBE_TOKEN='bench-youtube',
+               DRY_RUN='false',
+               PUBLISH_DRAIN='true',
+               PUBLISH_CLAIM='true',
+               PUBLISH_DRAIN_BUDGET='86400',
+               PUBLISH_RUN_BUDGET='0',
+               PUBLISH_PAGE_SIZE=str(args.page_size),
+               PUBLISH_MAX_WORKERS=str(args.workers),
+               PUBLISH_RETRY_BASE='0.05',
+               PUBLISH_PREFLIGHT='true' if args.preflight else 'false',
+               MEDIA_CACHE_MB='0',
+               IG_ID_CACHE_FILE='',
+               IG_CONTAINER_POLL_SECONDS=str(args.poll_seconds),
+               TIKTOK_STATUS_POLL_SECONDS=str(args.poll_seconds),
+               TIKTOK_STATUS_MAX_INTERVAL=str(args.poll_seconds),
+               TIKTOK_STATUS_WAIT='60',
+               YOUTUBE_CHUNK_MB='0.25')
+    for name in ('METRICS_DIR', 'TRACE_FILE'):
+        env.pop(name, None)
+    for scope in (*PLATFORMS, 'tiktok_status'):
+        env[f'PUBLISH_RATE_{scope.upper()}'] = str(args.publish_rate or 10 ** 6)
+    return env
+
+
+# ── Orquestração ──────────────────────────────────────────────
+
+def start_stubs(args) -> dict:
+    def behaviour(offset):
+        return Behaviour(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rpm,
+                         seed=args.seed + offset)
+
+    processing = args.processing_ms / 1000
+    return {
+        'graph':     StubServer(GraphApp(processing), behaviour(1), usage_header='X-App-Usage').start(),
+        'tiktok':    StubServer(TikTokApp(processing), behaviour(2)).start(),
+        'youtube':   StubServer(YouTubeApp(), behaviour(3)).start(),
+        'postgrest': StubServer(PostgrestApp(), Behaviour(args.db_latency_ms)).start(),
+        'media':     StubServer(MediaApp(args.image_kb * 1024, args.video_kb * 1024)).start(),
+    }
+
+
+def run_size(size: int, args, stubs: dict, fixture: dict = None) -> dict:
+    db    = stubs['postgrest'].app
+    posts = queue_posts(size, stubs['media'].url, args.seed, fixture)
+    db.load(posts)
+    config = {
+        'log_level': args.log_level,
+        'routes':    {host: stubs[service].url for host, service in API_HOSTS.items()},
+    }
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config)],
+        env=worker_env(args, stubs['postgrest'].url), capture_output=True, text=True,
+    )
+    if proc.returncode or not proc.stdout.strip():
+        raise RuntimeError(f"run com {size} posts falhou:\n{proc.stderr[-2000:]}")
+    result   = json.loads(proc.stdout.strip().splitlines()[-1])
+    outcomes = defaultdict(int)
+    for status in db.statuses.values():
+        outcomes[status] += 1
+    handled = sum(outcomes.values())
+    result.update({
+        'posts':            len(posts),
+        'outcomes':         dict(outcomes),
+        'posts_per_second': round(handled / result['elapsed_seconds'], 2) if result['elapsed_seconds'] else 0,
+    })
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(report: dict, baseline: dict = None):
+    base = {r['posts']: r for r in (baseline or {}).get('results', [])}
+    print(f"{'posts':>7} {'posts/s':>9} {'duração':>9} {'RSS MB':>7}  p50/p95/p99 ms por plataforma")
+    for r in report['results']:
+        latency = '  '.join(f"{p[:2]} {v['p50']:.0f}/{v['p95']:.0f}/{v['p99']:.0f}"
+                            for p, v in r['latency_ms'].items())
+        line = f"{r['posts']:>7} {r['posts_per_second']:>9.1f} {r['elapsed_seconds']:>8.1f}s {r['peak_rss_mb']:>7.1f}  {latency}"
+        prev = base.get(r['posts'])
+        if prev and prev.get('posts_per_second'):
+            change = 100 * (r['posts_per_second'] / prev['posts_per_second'] - 1)
+            line += f"  ({change:+.1f}% posts/s vs {baseline.get('commit') or 'base'})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do publish.py contra APIs simuladas")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Tamanhos das filas de posts (default: 10 100 1000 10000)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Latência das APIs simuladas')
+    parser.add_argument('--jitter-ms', type=float, default=10, help='Variação aleatória da latência (±)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracção de respostas 503 (0–1)')
+    parser.add_argument('--throttle-rpm', type=float, default=0,
+                        help='Pedidos/minuto por API antes de responder 429 (0 = sem limite)')
+    parser.add_argument('--db-latency-ms', type=float, default=5, help='Latência do PostgREST simulado')
+    parser.add_argument('--processing-ms', type=float, default=500,
+                        help='Tempo de processamento de Reels e publish_id TikTok')
+    parser.add_argument('--image-kb', type=int, default=200, help='Tamanho das imagens servidas')
+    parser.add_argument('--video-kb', type=int, default=1024, help='Tamanho dos vídeos servidos')
+    parser.add_argument('--workers', type=int, default=8, help='PUBLISH_MAX_WORKERS')
+    parser.add_argument('--page-size', type=int, default=100, help='PUBLISH_PAGE_SIZE')
+    parser.add_argument('--poll-seconds', type=float, default=0.2,
+                        help='Intervalo de consulta de Reels e estado TikTok')
+    parser.add_argument('--publish-rate', type=float, default=0,
+                        help='PUBLISH_RATE_* por plataforma (0 = sem limite)')
+    parser.add_argument('--no-preflight', dest='preflight', action='store_false',
+                        help='Desliga a validação prévia dos media')
+    parser.add_argument('--seed', type=int, default=1, help='Seed da fila sintética e dos erros')
+    parser.add_argument('--fixture', help="JSON de gen_workload.py (usa os seus posts 'agendado')")
+    parser.add_argument('--log-level', default='WARNING', help='Nível de log do publish.py')
+    parser.add_argument('--output', help='Ficheiro JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma run anterior para comparar posts/s')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    fixture = None
+    if args.fixture:
+        with open(args.fixture, encoding='utf-8') as f:
+            fixture = json.load(f)
+
+    stubs = start_stubs(args)
+    try:
+        results = []
+        for size in args.sizes:
+            print(f"A correr {size} posts…", file=sys.stderr)
+            results.append(run_size(size, args, stubs, fixture))
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    report = {
+        'commit':     git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python':     sys.version.split()[0],
+        'config':     {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'worker')},
+        'results':    results,
+    }
+    print_results(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados em {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
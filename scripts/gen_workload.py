@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+gen_workload.py — Gerador de dados sintéticos para benchmarks e testes de carga
+
+Gera avatares, campanhas, posts, contas_bancarias e levantamentos coerentes
+com supabase/schema.sql e as migrações (mesmas colunas, checks e chaves
+estrangeiras), de forma reprodutível: a mesma --seed e o mesmo --now dão
+exactamente o mesmo resultado.
+
+Distribuições:
+  • avatares com 2–4 plataformas (Instagram e TikTok mais frequentes)
+  • posts por avatar com cauda longa (Zipf) e campanhas com backlog em atraso
+  • mistura de imagem e vídeo (mais vídeo em avatares com YouTube)
+  • agendado_para concentrado em horários nobres e em minutos redondos,
+    com uma parte já em atraso (minutos a horas)
+  • levantamentos com montantes log-normais e a mistura de estados do Stripe
+
+Saída:
+  --format sql  — INSERTs em lote (on conflict do nothing) para correr depois
+                  do schema, das migrações e do supabase/seed.sql; as datas são
+                  relativas a now() no momento do load
+  --format json — fixture {tabela: [linhas]} com datas absolutas (relativas a --now)
+
+Uso:
+  python scripts/gen_workload.py --scale 100 --output supabase/load.sql
+  python scripts/gen_workload.py --posts 10000 --due-only --format json -o fixture.json
+  psql "$SUPABASE_DB_URL" -f supabase/load.sql
+
+--scale 1 corresponde ao volume actual (BASE_COUNTS); --avatares, --posts,
+--contas e --levantamentos fixam contagens individuais.
+"""
+import sys
+import json
+import math
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+# Volume actual de produção, multiplicado por --scale
+BASE_COUNTS = {
+    'avatares':         12,
+    'campanhas':        6,
+    'posts':            400,
+    'contas_bancarias': 15,
+    'levantamentos':    120,
+}
+TABLES = tuple(BASE_COUNTS)   # ordem das chaves estrangeiras
+
+DEFAULT_MEDIA_URL = 'https://cdn.example.com/avatarstudio'
+MAX_ATTEMPTS      = 5   # PUBLISH_MAX_ATTEMPTS por omissão (posts em 'erro')
+SQL_BATCH         = 500
+
+PLATFORM_WEIGHTS = {'instagram': 0.9, 'tiktok': 0.75, 'facebook': 0.45, 'youtube': 0.4}
+# Plataformas que aceitam cada tipo de media (ver PLATFORM_MEDIA em publish.py)
+MEDIA_PLATFORMS = {
+    'imagem': ('instagram', 'tiktok', 'facebook'),
+    'video':  ('instagram', 'tiktok', 'youtube'),
+}
+
+NICHOS = {
+    'fitness':     ('💪', ['#fitness', '#treino', '#saude', '#motivacao']),
+    'culinária':   ('🍳', ['#receitas', '#comida', '#cozinha', '#foodie']),
+    'viagens':     ('✈️', ['#viagens', '#travel', '#portugal', '#ferias']),
+    'tecnologia':  ('💻', ['#tech', '#gadgets', '#ia', '#programacao']),
+    'moda':        ('👗', ['#moda', '#ootd', '#estilo', '#tendencias']),
+    'finanças':    ('📈', ['#financas', '#investimento', '#poupanca', '#dinheiro']),
+    'gaming':      ('🎮', ['#gaming', '#gamer', '#twitch', '#esports']),
+    'beleza':      ('💄', ['#beleza', '#makeup', '#skincare', '#beauty']),
+}
+NOMES = ['Luna', 'Kai', 'Maya', 'Leo', 'Nova', 'Iris', 'Tomás', 'Bia', 'Rui', 'Sofia',
+         'Duarte', 'Inês', 'Vasco', 'Clara', 'Gil', 'Marta']
+OBJETIVOS = ['reconhecimento', 'trafego', 'leads', 'conversoes', 'engagement']
+
+# Horários nobres (hora UTC, peso) e minutos em que as pessoas agendam
+PRIME_SLOTS   = [(8, 1), (9, 2), (12, 3), (13, 2), (18, 3), (19, 4), (20, 4), (21, 3), (22, 1)]
+SLOT_MINUTES  = [(0, 6), (30, 3), (15, 1), (45, 1)]
+
+BANCOS = [('Caixa Geral de Depósitos', 'CGDIPTPL', '0035'),
+          ('Millennium BCP',           'BCOMPTPL', '0033'),
+          ('Novo Banco',               'BESCPTPL', '0007'),
+          ('Santander Totta',          'TOTAPTPL', '0018'),
+          ('BPI',                      'BBPIPTPL', '0010')]
+LEVANTAMENTO_STATUS = [('paid', 70), ('pending', 12), ('in_transit', 5),
+                       ('manual', 5), ('failed', 5), ('canceled', 3)]
+ERROS = ['Tempo de processamento esgotado', 'HTTP 400: media inválido',
+         'Token expirado (OAuthException)', 'Sem plataformas com sucesso']
+
+
+class Rel:
+    """Instante relativo à hora de referência (now() no SQL, --now no JSON)."""
+
+    __slots__ = ('seconds', 'date')
+
+    def __init__(self, seconds: float, date: bool = False):
+        self.seconds = int(seconds)
+        self.date    = date
+
+
+class Generator:
+    """Gera as linhas de todas as tabelas com um random.Random(seed) próprio."""
+
+    def __init__(self, seed: int, now: datetime, media_url: str = DEFAULT_MEDIA_URL,
+                 due_only: bool = False):
+        self.rng       = random.Random(seed)
+        self.now       = now
+        self.media_url = media_url.rstrip('/')
+        self.due_only  = due_only
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def weighted(self, pairs):
+        values, weights = zip(*pairs)
+        return self.rng.choices(values, weights)[0]
+
+    def token(self, prefix: str, size: int) -> str:
+        alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+        return prefix + ''.join(self.rng.choice(alphabet) for _ in range(size))
+
+    # ── Tempos ────────────────────────────────────────────────
+
+    def slot(self, days_ahead: int) -> Rel:
+        """Horário nobre daqui a `days_ahead` dias (>= agora)."""
+        day  = (self.now + timedelta(days=days_ahead)).replace(hour=0, minute=0, second=0, microsecond=0)
+        when = day.replace(hour=self.weighted(PRIME_SLOTS), minute=self.weighted(SLOT_MINUTES))
+        if when <= self.now:
+            when += timedelta(days=1)
+        return Rel((when - self.now).total_seconds())
+
+    def overdue(self, backlog: bool = False) -> Rel:
+        """Atraso típico (exponencial, média 45 min) ou de backlog de campanha (até 6 h)."""
+        late = self.rng.uniform(60, 6 * 3600) if backlog else min(self.rng.expovariate(1 / 2700), 12 * 3600)
+        return Rel(-max(30, late))
+
+    def past(self, max_days: float) -> Rel:
+        return Rel(-self.rng.uniform(3600, max_days * 86400))
+
+    # ── Tabelas ───────────────────────────────────────────────
+
+    def avatares(self, count: int) -> list:
+        rows = []
+        for i in range(count):
+            nicho, (emoji, _) = self.rng.choice(list(NICHOS.items()))
+            k = self.weighted([(2, 35), (3, 40), (4, 25)])
+            platforms = []
+            pool = dict(PLATFORM_WEIGHTS)
+            while len(platforms) < k:
+                choice = self.weighted(pool.items())
+                platforms.append(choice)
+                del pool[choice]
+            rows.append({
+                'id':          self.uuid(),
+                'nome':        f"{self.rng.choice(NOMES)} {nicho.capitalize()} {i + 1}",
+                'nicho':       nicho,
+                'emoji':       emoji,
+                'prompt_base': f"Criador de conteúdo de {nicho}, tom próximo e positivo.",
+                'plataformas': sorted(platforms),
+                'ativo':       self.rng.random() > 0.05,
+            })
+        return rows
+
+    def campanhas(self, count: int, avatares: list) -> list:
+        rows = []
+        for i in range(count):
+            avatar = self.rng.choice(avatares)
+            start  = self.rng.randint(-20, 5)
+            rows.append({
+                'id':           self.uuid(),
+                'nome':         f"Campanha {i + 1} — {avatar['nicho']}",
+                'objetivo':     self.rng.choice(OBJETIVOS),
+                'avatar_id':    avatar['id'],
+                'plataformas':  avatar['plataformas'],
+                'budget_total': round(self.rng.uniform(100, 5000), 2),
+                'data_inicio':  Rel(start * 86400, date=True),
+                'data_fim':     Rel((start + self.rng.randint(7, 45)) * 86400, date=True),
+                'status':       'ativa' if start <= 0 else 'planeamento',
+            })
+        return rows
+
+    def posts(self, count: int, avatares: list, campanhas: list) -> list:
+        if not count:
+            return []
+        # Cauda longa: poucos avatares concentram a maior parte dos posts
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(len(avatares))]
+        self.rng.shuffle(weights)
+        by_avatar = {}
+        for campanha in campanhas:
+            by_avatar.setdefault(campanha['avatar_id'], []).append(campanha)
+        # Uma em cada três campanhas tem o backlog em atraso
+        backlog = {c['id'] for c in campanhas if self.rng.random() < 1 / 3}
+
+        rows = []
+        for i in range(count):
+            avatar   = self.rng.choices(avatares, weights)[0]
+            campanha = None
+            if by_avatar.get(avatar['id']) and self.rng.random() < 0.4:
+                campanha = self.rng.choice(by_avatar[avatar['id']])
+
+            p_video = 0.5 if 'youtube' in avatar['plataformas'] else 0.25
+            tipo    = 'video' if self.rng.random() < p_video else 'imagem'
+            allowed = [p for p in avatar['plataformas'] if p in MEDIA_PLATFORMS[tipo]]
+            if not allowed:
+                tipo    = 'imagem' if tipo == 'video' else 'video'
+                allowed = [p for p in avatar['plataformas'] if p in MEDIA_PLATFORMS[tipo]]
+            platforms = sorted(self.rng.sample(allowed, self.rng.randint(1, len(allowed))))
+
+            status = 'agendado' if self.due_only else self.weighted(
+                [('agendado', 55), ('publicado', 30), ('rascunho', 10), ('erro', 5)])
+            row = {
+                'id':            self.uuid(),
+                'avatar_id':     avatar['id'],
+                'campanha_id':   campanha['id'] if campanha else None,
+                'legenda':       f"{avatar['nicho'].capitalize()}: ideia #{i + 1} para hoje",
+                'hashtags':      ' '.join(self.rng.sample(NICHOS[avatar['nicho']][1], 3)),
+                'imagem_url':    f"{self.media_url}/image/{i}.jpg" if tipo == 'imagem' else None,
+                'video_url':     f"{self.media_url}/video/{i}.mp4" if tipo == 'video' else None,
+                'tipo_conteudo': tipo,
+                'plataformas':   platforms,
+                'status':        status,
+                'tentativas':    0,
+            }
+            if status == 'agendado':
+                late = self.due_only or self.rng.random() < 0.3 or (campanha and campanha['id'] in backlog)
+                if late:
+                    row['agendado_para'] = self.overdue(backlog=bool(campanha and campanha['id'] in backlog))
+                else:
+                    row['agendado_para'] = self.slot(min(int(self.rng.expovariate(1 / 2)), 13))
+            elif status == 'publicado':
+                row['agendado_para'] = self.past(30)
+                row['publicado_em']  = Rel(row['agendado_para'].seconds + self.rng.randint(5, 300))
+            elif status == 'erro':
+                row['agendado_para'] = self.past(7)
+                row['tentativas']    = MAX_ATTEMPTS
+                row['error_msg']     = f"{self.rng.choice(ERROS)} ({MAX_ATTEMPTS} tentativas)"
+            rows.append(row)
+        return rows
+
+    def iban(self, bank_code: str) -> str:
+        """IBAN português (PT50-style) com dígitos de controlo mod-97 válidos."""
+        bban    = bank_code + ''.join(str(self.rng.randint(0, 9)) for _ in range(17))
+        numeric = int(bban + '2529' + '00')   # P=25, T=29
+        return f"PT{98 - numeric % 97:02d}{bban}"
+
+    def contas_bancarias(self, count: int, avatares: list) -> list:
+        rows = []
+        for _ in range(count):
+            avatar = self.rng.choice(avatares)
+            banco, bic, code = self.rng.choice(BANCOS)
+            rows.append({
+                'id':                         self.uuid(),
+                'avatar_id':                  avatar['id'],
+                'titular':                    avatar['nome'],
+                'banco':                      banco,
+                'iban':                       self.iban(code),
+                'bic':                        bic,
+                'country':                    'PT',
+                'currency':                   'eur',
+                'stripe_account_id':          self.token('acct_', 16),
+                'stripe_external_account_id': self.token('ba_', 24),
+                'auto_daily_payout':          self.rng.random() < 0.3,
+            })
+        return rows
+
+    def levantamentos(self, count: int, contas: list) -> list:
+        if not contas:
+            return []
+        rows = []
+        for _ in range(count):
+            conta  = self.rng.choice(contas)
+            status = self.weighted(LEVANTAMENTO_STATUS)
+            auto   = conta['auto_daily_payout'] and self.rng.random() < 0.5
+            rows.append({
+                'id':                self.uuid(),
+                'avatar_id':         conta['avatar_id'],
+                'conta_bancaria_id': conta['id'],
+                'montante':          max(100, int(self.rng.lognormvariate(math.log(5000), 0.9))),
+                'moeda':             'eur',
+                'status':            status,
+                'stripe_payout_id':  self.token('po_', 24) if status in ('paid', 'in_transit') else None,
+                'descricao':         'Payout automático diário' if auto else 'Levantamento manual',
+                'auto_created':      auto,
+                'criado_em':         Rel(-self.rng.uniform(60, 2 * 86400)) if status == 'pending' else self.past(90),
+            })
+        return rows
+
+
+def generate(seed: int = 1, scale: float = 1.0, counts: dict = None, now: datetime = None,
+             media_url: str = DEFAULT_MEDIA_URL, due_only: bool = False) -> dict:
+    """
+    {tabela: [linhas]} para BASE_COUNTS × scale (ou `counts` por tabela).
+    Os instantes ficam como Rel — ver to_json() e to_sql().
+    """
+    totals = {table: max(0, round(base * scale)) for table, base in BASE_COUNTS.items()}
+    totals.update(counts or {})
+    totals['avatares'] = max(1, totals['avatares'])
+    gen = Generator(seed, now or datetime.now(timezone.utc), media_url, due_only)
+
+    avatares  = gen.avatares(totals['avatares'])
+    campanhas = gen.campanhas(totals['campanhas'], avatares)
+    contas    = gen.contas_bancarias(totals['contas_bancarias'], avatares)
+    return {
+        'avatares':         avatares,
+        'campanhas':        campanhas,
+        'posts':            gen.posts(totals['posts'], avatares, campanhas),
+        'contas_bancarias': contas,
+        'levantamentos':    gen.levantamentos(totals['levantamentos'], contas),
+    }
+
+
+def _json_value(value, now: datetime):
+    if isinstance(value, Rel):
+        when = now + timedelta(seconds=value.seconds)
+        return when.date().isoformat() if value.date else when.isoformat()
+    return value
+
+
+def to_json(data: dict, now: datetime) -> dict:
+    """Linhas com datas absolutas (ISO 8601) relativas a `now`."""
+    return {table: [{k: _json_value(v, now) for k, v in row.items()} for row in rows]
+            for table, rows in data.items()}
+
+
+def _sql_value(value, now_sql: str) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, Rel):
+        expr = f"{now_sql} + interval '{value.seconds} seconds'"
+        return f"({expr})::date" if value.date else f"({expr})"
+    if isinstance(value, list):
+        if not value:
+            return "'{}'::text[]"
+        return 'array[' + ', '.join(_sql_value(v, now_sql) for v in value) + ']'
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def to_sql(data: dict, header: str = '', now: datetime = None) -> str:
+    """
+    INSERTs em lote por tabela (ordem das FKs) numa transacção. Sem `now`,
+    as datas são relativas a now() no momento do load.
+    """
+    now_sql = f"'{now.isoformat()}'::timestamptz" if now else 'now()'
+    lines   = [header.rstrip(), 'begin;', ''] if header else ['begin;', '']
+    for table in TABLES:
+        rows = data.get(table) or []
+        if not rows:
+            continue
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        for i in range(0, len(rows), SQL_BATCH):
+            batch = rows[i:i + SQL_BATCH]
+            lines.append(f"insert into {table} ({', '.join(columns)}) values")
+            values = ['  (' + ', '.join(_sql_value(row.get(c), now_sql) for c in columns) + ')'
+                      for row in batch]
+            lines.append(',\n'.join(values))
+            lines.append('on conflict (id) do nothing;')
+            lines.append('')
+    lines.append('commit;')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos reprodutíveis para o Supabase")
+    parser.add_argument('--seed', type=int, default=1, help='Seed (mesma seed + --now = mesmo resultado)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplicador de BASE_COUNTS (volume actual)')
+    for table, flag in (('avatares', '--avatares'), ('posts', '--posts'), ('campanhas', '--campanhas'),
+                        ('contas_bancarias', '--contas'), ('levantamentos', '--levantamentos')):
+        parser.add_argument(flag, type=int, dest=table, help=f'Número de linhas de {table}')
+    parser.add_argument('--due-only', action='store_true',
+                        help="Todos os posts 'agendado' e em atraso (fila para drain/benchmark)")
+    parser.add_argument('--media-url', default=DEFAULT_MEDIA_URL, help='Prefixo dos URLs de imagem/vídeo')
+    parser.add_argument('--now', help='Hora de referência ISO 8601 (default: agora, ao minuto)')
+    parser.add_argument('--format', choices=('sql', 'json'), default='sql')
+    parser.add_argument('-o', '--output', help='Ficheiro de saída (default: stdout)')
+    args = parser.parse_args()
+
+    if args.now:
+        now = datetime.fromisoformat(args.now)
+        now = now if now.tzinfo else now.replace(tzinfo=timezone.utc)
+    else:
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    counts = {t: getattr(args, t) for t in TABLES if getattr(args, t) is not None}
+    data   = generate(args.seed, args.scale, counts, now, args.media_url, args.due_only)
+    summary = ', '.join(f"{len(rows)} {table}" for table, rows in data.items())
+
+    if args.format == 'json':
+        fixture = {'meta': {'seed': args.seed, 'scale': args.scale, 'now': now.isoformat()}}
+        fixture.update(to_json(data, now))
+        output = json.dumps(fixture, ensure_ascii=False, indent=1) + '\n'
+    else:
+        header = (f"-- Dados sintéticos gerados por scripts/gen_workload.py\n"
+                  f"-- seed={args.seed} scale={args.scale} — {summary}\n"
+                  f"-- Carregar depois do schema, das migrações e do supabase/seed.sql")
+        # Sem --now, as datas acompanham o momento do load (posts em atraso continuam em atraso)
+        output = to_sql(data, header, now if args.now else None)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output)
+    print(f"Gerado: {summary}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,89 +3,1566 @@
 AvatarStudio — Script de publicação automática
 Corre via GitHub Actions a cada hora para publicar posts agendados.
 
+Uso:
+  python scripts/publish.py                 # uma run (cron)
+  python scripts/publish.py --daemon        # processo contínuo: acorda no
+                                            # próximo agendado_para
+  python scripts/publish.py --import-report # tempo de arranque (python -X importtime)
+
 Variáveis de ambiente necessárias (GitHub Secrets):
   GEMINI_API_KEY, SUPABASE_URL, SUPABASE_KEY,
   INSTAGRAM_TOKEN, TIKTOK_TOKEN, FACEBOOK_TOKEN, YOUTUBE_TOKEN
+
+Opcionais:
+  PUBLISH_MAX_WORKERS        — máximo de publicações em paralelo (default 8)
+  PUBLISH_LIMIT_<PLATAFORMA> — máximo em paralelo por plataforma, ex.
+                               PUBLISH_LIMIT_YOUTUBE=2 (defaults em PLATFORM_LIMITS)
+  YOUTUBE_CHUNK_MB           — tamanho de cada bloco do upload YouTube (default 8)
+  IG_ID_CACHE_FILE           — ficheiro para guardar o IG user ID entre runs
+  IG_ID_CACHE_TTL            — validade desse ficheiro em segundos (default 86400)
+  IG_CONTAINER_POLL_SECONDS  — intervalo entre consultas aos containers de Reels (default 10)
+  IG_CONTAINER_TIMEOUT       — espera máxima pelo processamento de um Reel (default 600)
+  MEDIA_CACHE_DIR            — directório da cache de media descarregados (default: tmp do
+                               sistema); persistido entre runs evita novos downloads
+  MEDIA_CACHE_MB             — tamanho máximo da cache de media (default 2048; 0 desliga);
+                               media maior que isto é enviado sem ficar na cache
+  METRICS_DIR                — directório para publish.prom/publish.json com as métricas
+                               da run (latências, contadores, fases); sem ela, não exporta
+  TRACE_FILE                 — ficheiro OTLP/JSON com os spans da run (run → post →
+                               plataforma → pedido HTTP), uma linha por run/ciclo
+  PUBLISH_PREFLIGHT          — 'false' desliga a validação prévia dos media (HEAD)
+  TIKTOK_STATUS_POLL_SECONDS — intervalo inicial entre consultas a cada publish_id (default 10)
+  TIKTOK_STATUS_MAX_INTERVAL — tecto do intervalo, que cresce a cada consulta sem estado
+                               final (default 120)
+  TIKTOK_STATUS_WORKERS      — consultas de estado TikTok em paralelo (default 4)
+  TIKTOK_STATUS_WAIT         — espera no fim da run por publish_id pendentes (default 120)
+  PUBLISH_FLUSH_ROWS         — escritas em buffer antes de gravar na BD (default 50)
+  PUBLISH_FLUSH_SECONDS      — intervalo máximo entre gravações na BD (default 5)
+  PUBLISH_DRAIN              — 'true' para esvaziar a fila em páginas (backlog)
+  PUBLISH_DRAIN_BUDGET       — tempo máximo do modo drain em segundos (default 600)
+  PUBLISH_PAGE_SIZE          — posts por página no modo drain (default 100)
+  PUBLISH_SLOT_GRACE         — segundos depois de agendado_para em que um post ainda vai
+                               a tempo do slot e passa à frente do backlog (default 900)
+  PUBLISH_FAIR_CAMPAIGN      — 'true' para alternar também entre as campanhas de cada avatar
+  PUBLISH_CLAIM              — 'true' para reservar posts com claim_due_posts()
+                               (permite vários publicadores em paralelo)
+  PUBLISH_LEASE_SECONDS      — duração da reserva de cada post (default 1800)
+  PUBLISH_WORKER_ID          — ID deste worker nas reservas (default host-pid-aleatório)
+  PUBLISH_POLL_SECONDS       — espera máxima entre consultas no modo daemon (default 60)
+  SUPABASE_DB_URL            — ligação Postgres directa para LISTEN posts_agendados no
+                               modo daemon (requer psycopg2; sem ela, só polling)
+  PUBLISH_LISTEN_POLL_SECONDS — espera máxima com o LISTEN activo (default 600)
+  PUBLISH_RETRY_ATTEMPTS     — novas tentativas por pedido HTTP transitório (default 3)
+  PUBLISH_RETRY_BASE         — base do backoff exponencial em segundos (default 1)
+  PUBLISH_RETRY_MAX_DELAY    — espera máxima entre tentativas/Retry-After (default 60)
+  PUBLISH_BREAKER_THRESHOLD  — falhas transitórias seguidas que abrem o circuito (default 5)
+  PUBLISH_BREAKER_COOLDOWN   — segundos com o circuito aberto (default 900)
+  PUBLISH_RATE_<PLATAFORMA>  — pedidos por minuto por token, ex. PUBLISH_RATE_TIKTOK=20
+                               (defaults em RATE_LIMITS; abranda com os headers de uso);
+                               PUBLISH_RATE_TIKTOK_STATUS para as consultas de estado
+  PUBLISH_MAX_ATTEMPTS       — runs a tentar um post antes de o dar como 'erro' (default 5)
+  PUBLISH_RETRY_QUEUE_BASE   — espera antes da 1.ª nova tentativa, em segundos (default 300);
+                               duplica a cada tentativa, até 6 horas
+  PUBLISH_RUN_BUDGET         — prazo da run em segundos (default 660; 0 desliga): só começa
+                               publicações cujo custo estimado ainda cabe no tempo que resta
+  PUBLISH_CHECKPOINT_GRACE   — espera pelas chamadas em curso depois do prazo ou de
+                               SIGTERM/SIGINT antes de gravar o estado e sair (default 5)
 """
 import os
 import sys
+import json
+import time
+import random
+import argparse
+import uuid
+import socket
+import hashlib
+import select
+import signal
 import logging
+import tempfile
+import threading
+import statistics
 import requests
-from datetime import datetime, timezone
-from supabase import create_client
+from requests.adapters import HTTPAdapter
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from telemetry import Metrics, Tracer, SPAN_KIND_CLIENT, endpoint_label
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 log = logging.getLogger(__name__)
 
+metrics = Metrics('publish')
+tracer  = Tracer('publish')
+
 # ── Config ────────────────────────────────────────────────────
-SUPABASE_URL  = os.environ['SUPABASE_URL']
-SUPABASE_KEY  = os.environ['SUPABASE_KEY']
+SUPABASE_URL  = os.environ.get('SUPABASE_URL', '')
+SUPABASE_KEY  = os.environ.get('SUPABASE_KEY', '')
 INSTAGRAM_TOKEN = os.environ.get('INSTAGRAM_TOKEN', '')
 TIKTOK_TOKEN    = os.environ.get('TIKTOK_TOKEN', '')
 FACEBOOK_TOKEN  = os.environ.get('FACEBOOK_TOKEN', '')
 YOUTUBE_TOKEN   = os.environ.get('YOUTUBE_TOKEN', '')
 DRY_RUN         = os.environ.get('DRY_RUN', 'false').lower() == 'true'
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Concorrência: limite global de chamadas em curso e limite por plataforma
+MAX_WORKERS = max(1, int(os.environ.get('PUBLISH_MAX_WORKERS', '8')))
+PLATFORM_LIMITS = {
+    platform: max(1, int(os.environ.get(f'PUBLISH_LIMIT_{platform.upper()}', default)))
+    for platform, default in (
+        ('instagram', 4),
+        ('tiktok',    4),
+        ('facebook',  4),
+        ('youtube',   2),   # uploads pesados — poucos em paralelo
+    )
+}
+
+# Upload YouTube por blocos: a API exige múltiplos de 256 KiB
+YOUTUBE_CHUNK_UNIT    = 256 * 1024
+YOUTUBE_CHUNK_SIZE    = max(1, int(float(os.environ.get('YOUTUBE_CHUNK_MB', '8')) * 4)) * YOUTUBE_CHUNK_UNIT
+YOUTUBE_CHUNK_TIMEOUT = 120
+YOUTUBE_CHUNK_RETRIES = 5
+# Sessões resumíveis expiram ao fim de uma semana do lado do YouTube
+YOUTUBE_SESSION_MAX_AGE = timedelta(days=6)
+
+IG_ID_CACHE_FILE = os.environ.get('IG_ID_CACHE_FILE', '')
+IG_ID_CACHE_TTL  = int(os.environ.get('IG_ID_CACHE_TTL', '86400'))
+
+# Reels: o Instagram processa o container antes de aceitar o media_publish
+IG_CONTAINER_POLL_SECONDS = float(os.environ.get('IG_CONTAINER_POLL_SECONDS', '10'))
+IG_CONTAINER_TIMEOUT      = float(os.environ.get('IG_CONTAINER_TIMEOUT', '600'))
+IG_CONTAINER_BATCH        = 50   # IDs por pedido ?ids= à Graph API
+
+# Cache em disco dos media descarregados (endereçada por SHA-256, LRU)
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'publish-media-cache')
+MEDIA_CACHE_MB  = max(0, int(os.environ.get('MEDIA_CACHE_MB', '2048')))
+
+# Validação prévia dos media (HEAD/Range) contra os limites de cada plataforma
+PREFLIGHT         = os.environ.get('PUBLISH_PREFLIGHT', 'true').lower() == 'true'
+PREFLIGHT_TIMEOUT = (5, 10)
+MB = 1024 * 1024
+# (plataforma, tipo) → (Content-Types aceites — None = qualquer do tipo, tamanho máximo)
+MEDIA_LIMITS = {
+    ('instagram', 'image'): ({'image/jpeg'}, 8 * MB),
+    ('instagram', 'video'): ({'video/mp4', 'video/quicktime'}, 1024 * MB),
+    ('facebook',  'image'): ({'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/tiff'}, 10 * MB),
+    ('tiktok',    'image'): ({'image/jpeg', 'image/webp'}, 20 * MB),
+    ('tiktok',    'video'): ({'video/mp4', 'video/webm', 'video/quicktime'}, 4096 * MB),
+    ('youtube',   'video'): (None, 256 * 1024 * MB),
+}
+# Media que cada publisher usa, por ordem de preferência
+PLATFORM_MEDIA = {
+    'instagram': ('video', 'image'),
+    'tiktok':    ('video', 'image'),
+    'facebook':  ('image',),
+    'youtube':   ('video',),
+}
+
+# Acompanhamento do estado das publicações TikTok (publish_id → post final)
+TIKTOK_STATUS_URL          = 'https://open.tiktokapis.com/v2/post/publish/status/fetch/'
+TIKTOK_CREATOR_URL         = 'https://open.tiktokapis.com/v2/post/publish/creator_info/query/'
+TIKTOK_STATUS_POLL_SECONDS = float(os.environ.get('TIKTOK_STATUS_POLL_SECONDS', '10'))
+TIKTOK_STATUS_MAX_INTERVAL = float(os.environ.get('TIKTOK_STATUS_MAX_INTERVAL', '120'))
+TIKTOK_STATUS_BACKOFF      = 1.5   # o intervalo de cada publish_id cresce 1,5× por consulta
+TIKTOK_STATUS_WORKERS      = max(1, int(os.environ.get('TIKTOK_STATUS_WORKERS', '4')))
+TIKTOK_STATUS_WAIT         = float(os.environ.get('TIKTOK_STATUS_WAIT', '120'))
+TIKTOK_STATUS_MAX_AGE      = timedelta(days=1)   # publish_id antigos deixam de ser consultados
+
+# Write-behind dos resultados (publicados + status dos posts)
+FLUSH_ROWS    = max(1, int(os.environ.get('PUBLISH_FLUSH_ROWS', '50')))
+FLUSH_SECONDS = float(os.environ.get('PUBLISH_FLUSH_SECONDS', '5'))
+
+# Modo drain: paginar a fila até ficar vazia ou esgotar o orçamento de tempo
+DRAIN_MODE      = os.environ.get('PUBLISH_DRAIN', 'false').lower() == 'true'
+DRAIN_BUDGET    = float(os.environ.get('PUBLISH_DRAIN_BUDGET', '600'))
+DRAIN_PAGE_SIZE = max(1, int(os.environ.get('PUBLISH_PAGE_SIZE', '100')))
+
+# Reserva atómica de posts (ver migração claim_due_posts)
+CLAIM_MODE    = os.environ.get('PUBLISH_CLAIM', 'false').lower() == 'true'
+LEASE_SECONDS = int(os.environ.get('PUBLISH_LEASE_SECONDS', '1800'))
+WORKER_ID     = (os.environ.get('PUBLISH_WORKER_ID')
+                 or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}')
+
+DUE_POSTS_LIMIT      = 20   # posts por consulta numa run normal
+DAEMON_POLL_SECONDS  = float(os.environ.get('PUBLISH_POLL_SECONDS', '60'))
+
+# Escalonamento: prioridade, posts a tempo do slot e rotação entre avatares
+SLOT_GRACE       = float(os.environ.get('PUBLISH_SLOT_GRACE', '900'))
+FAIR_BY_CAMPAIGN = os.environ.get('PUBLISH_FAIR_CAMPAIGN', 'false').lower() == 'true'
+
+# Change feed (LISTEN/NOTIFY) para o daemon acordar quando há posts agendados
+SUPABASE_DB_URL      = os.environ.get('SUPABASE_DB_URL', '')
+NOTIFY_CHANNEL       = 'posts_agendados'
+LISTEN_POLL_SECONDS  = float(os.environ.get('PUBLISH_LISTEN_POLL_SECONDS', '600'))
+LISTEN_RETRY_SECONDS = 60
+
+# Retry de pedidos HTTP e circuit breaker por plataforma
+RETRY_ATTEMPTS    = max(0, int(os.environ.get('PUBLISH_RETRY_ATTEMPTS', '3')))
+RETRY_BASE        = float(os.environ.get('PUBLISH_RETRY_BASE', '1'))
+RETRY_MAX_DELAY   = float(os.environ.get('PUBLISH_RETRY_MAX_DELAY', '60'))
+BREAKER_THRESHOLD = max(1, int(os.environ.get('PUBLISH_BREAKER_THRESHOLD', '5')))
+BREAKER_COOLDOWN  = float(os.environ.get('PUBLISH_BREAKER_COOLDOWN', '900'))
+
+# Ritmo por plataforma e token (pedidos/minuto), ajustado pelos headers de uso
+RATE_LIMITS = {
+    platform: max(1.0, float(os.environ.get(f'PUBLISH_RATE_{platform.upper()}', default)))
+    for platform, default in (
+        ('instagram', 60),
+        ('tiktok',    20),
+        ('facebook',  60),
+        ('youtube',   30),
+        # status/fetch tem limite próprio no TikTok: bucket à parte para não gastar os inits
+        ('tiktok_status', 30),
+    )
+}
+RATE_SLOWDOWN_PCT  = 75    # uso reportado a partir do qual o ritmo baixa
+RATE_STOP_PCT      = 95    # uso a partir do qual os pedidos param até recuperar
+RATE_MIN_FACTOR    = 0.1   # fracção mínima do ritmo perto do limite
+RATE_PAUSE_SECONDS = 60    # pausa quando a plataforma não diz quando recupera
+
+# Fila de novas tentativas entre runs (posts.tentativas / proxima_tentativa_em)
+MAX_ATTEMPTS       = max(1, int(os.environ.get('PUBLISH_MAX_ATTEMPTS', '5')))
+RETRY_QUEUE_BASE   = float(os.environ.get('PUBLISH_RETRY_QUEUE_BASE', '300'))
+RETRY_QUEUE_MAX    = 6 * 3600
+
+# Prazo da run (o workflow mata o job aos 15 minutos) e custo estimado de cada publicação
+RUN_BUDGET        = float(os.environ.get('PUBLISH_RUN_BUDGET', '660'))
+CHECKPOINT_GRACE  = float(os.environ.get('PUBLISH_CHECKPOINT_GRACE', '5'))
+COST_HISTORY_ROWS = 500   # durações lidas de post_plataformas
+COST_MIN_SAMPLES  = 5     # abaixo disto, DEFAULT_JOB_COSTS
+DEFAULT_JOB_COSTS = {     # plataforma → (segundos base, segundos por MB de media)
+    'instagram': (20, 0.5),
+    'tiktok':    (10, 0.2),
+    'facebook':  (5,  0.2),
+    'youtube':   (15, 1.0),
+}
+RESUMABLE_PLATFORMS = {'youtube'}   # uploads que param entre blocos e retomam noutra run
+
+
+class LazyClient:
+    """
+    Cliente Supabase criado no primeiro uso. Importar publish.py (--help,
+    --import-report, testes) não carrega o supabase-py nem lê as credenciais.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock   = threading.Lock()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if not SUPABASE_URL or not SUPABASE_KEY:
+                        raise RuntimeError("SUPABASE_URL e SUPABASE_KEY são obrigatórios")
+                    from supabase import create_client   # import pesado: só quando é preciso
+                    self._client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+supabase = LazyClient()
+
+
+# ── HTTP ──────────────────────────────────────────────────────
+
+HTTP_TIMEOUT = (10, 30)   # (ligação, leitura) em segundos
+
+# Hosts de API com endpoint próprio nas métricas (o resto conta como 'media')
+API_HOSTS = {'graph.facebook.com', 'open.tiktokapis.com', 'www.googleapis.com'}
+
+TRANSIENT_STATUS  = {408, 425, 429, 500, 502, 503, 504}
+IDEMPOTENT        = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+# POST não é idempotente (ex.: media_publish): só repete quando o pedido
+# de certeza não foi processado
+POST_RETRY_STATUS = {429, 503}
+
+
+def parse_retry_after(value) -> float:
+    """Segundos pedidos num header Retry-After (número ou data HTTP); None se inválido."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Classifica falhas HTTP em transitórias/permanentes e calcula o backoff com jitter."""
+
+    def __init__(self, attempts: int = RETRY_ATTEMPTS, base: float = RETRY_BASE,
+                 max_delay: float = RETRY_MAX_DELAY):
+        self.attempts  = attempts
+        self.base      = base
+        self.max_delay = max_delay
+
+    @staticmethod
+    def transient_error(method: str, exc: Exception) -> bool:
+        if method.upper() in IDEMPOTENT:
+            return isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                                    requests.exceptions.ChunkedEncodingError))
+        return isinstance(exc, requests.exceptions.ConnectTimeout)
+
+    @staticmethod
+    def transient_response(method: str, resp) -> bool:
+        statuses = TRANSIENT_STATUS if method.upper() in IDEMPOTENT else POST_RETRY_STATUS
+        return resp.status_code in statuses
+
+    @staticmethod
+    def permanent_response(resp) -> bool:
+        """4xx que nenhuma nova tentativa resolve (pedido inválido, token, media recusado)."""
+        return 400 <= resp.status_code < 500 and resp.status_code not in TRANSIENT_STATUS
+
+    @classmethod
+    def permanent_error(cls, exc: Exception) -> bool:
+        response = getattr(exc, 'response', None)
+        return isinstance(exc, requests.HTTPError) and response is not None and cls.permanent_response(response)
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """Espera antes da tentativa `attempt` (0 = primeira repetição): full jitter."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuito por plataforma: abre após `threshold` falhas transitórias seguidas
+    e fica aberto `cooldown` segundos (numa run do cron, o resto da run). Depois
+    deixa passar uma chamada de teste; um sucesso volta a fechá-lo.
+    """
+
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.name      = name
+        self.threshold = threshold
+        self.cooldown  = cooldown
+        self.failures  = 0
+        self.opened_at = None
+        self._lock     = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = None                     # meio-aberto: uma tentativa
+                self.failures  = self.threshold - 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures  = 0
+            self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Regista uma falha transitória; devolve True se o circuito abriu agora."""
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                log.error(f"{self.name}: {self.failures} falhas transitórias seguidas — "
+                          f"circuito aberto durante {self.cooldown:.0f}s")
+                return True
+            return False
+
+
+breakers = {platform: CircuitBreaker(platform) for platform in PLATFORM_LIMITS}
+
+# Plataforma do publisher a correr nesta thread (para o circuit breaker)
+_publish_context = threading.local()
+
+
+def current_breaker(url: str):
+    """
+    Circuit breaker do pedido em curso: só pedidos à API da plataforma do
+    publisher. Downloads e HEADs de media (CDN) e consultas com rate_scope
+    próprio (ex.: estado TikTok) não abrem o circuito da publicação.
+    """
+    if getattr(_publish_context, 'rate_scope', None) or urlsplit(url).hostname not in API_HOSTS:
+        return None
+    return breakers.get(getattr(_publish_context, 'platform', None))
+
+
+class RateLimitExceeded(requests.RequestException):
+    """O limite de pedidos obrigaria a esperar mais do que o permitido."""
+
+
+class RateLimiter:
+    """
+    Token bucket por (plataforma, token): `rate` pedidos por minuto, com
+    rajadas até um minuto de pedidos. observe_usage() ajusta o ritmo ao uso
+    reportado pela plataforma — abranda a partir de RATE_SLOWDOWN_PCT e pára a
+    partir de RATE_STOP_PCT — para nunca chegar a ser bloqueado.
+    """
+
+    def __init__(self, name: str, rate: float):
+        self.name         = name
+        self.rate         = rate      # pedidos/minuto configurados
+        self.factor       = 1.0       # fracção do ritmo permitida pelo uso actual
+        self.tokens       = float(rate)
+        self.updated      = time.monotonic()
+        self.paused_until = 0.0
+        self._lock        = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate * self.factor)
+
+    def _refill(self, now: float):
+        per_second   = self.rate * self.factor / 60
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * per_second)
+        self.updated = now
+
+    def acquire(self, max_wait: float = RETRY_MAX_DELAY):
+        """Espera pela vez deste pedido; RateLimitExceeded se a espera passar de `max_wait`."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(0.0, self.paused_until - now)
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens * 60 / (self.rate * self.factor))
+            if wait > max_wait:
+                self.tokens += 1
+                raise RateLimitExceeded(f"{self.name}: limite de pedidos — seria preciso "
+                                        f"esperar {wait:.0f}s")
+        if wait > 0:
+            metrics.inc('rate_limit_wait_seconds_total', wait, platform=self.name)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Suspende os pedidos deste token durante `seconds` (ex.: 429 com Retry-After)."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_usage(self, pct: float, regain: float = None):
+        """Ajusta o ritmo à percentagem de uso reportada (0–100)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            previous = self.factor
+            if pct >= RATE_STOP_PCT:
+                self.factor = RATE_MIN_FACTOR
+            elif pct >= RATE_SLOWDOWN_PCT:
+                span = (pct - RATE_SLOWDOWN_PCT) / (RATE_STOP_PCT - RATE_SLOWDOWN_PCT)
+                self.factor = 1 - span * (1 - RATE_MIN_FACTOR)
+            else:
+                self.factor = 1.0
+            self.tokens = min(self.tokens, self.capacity)
+        if pct >= RATE_STOP_PCT:
+            log.warning(f"{self.name}: uso a {pct:.0f}% — pedidos suspensos")
+            self.pause(regain or RATE_PAUSE_SECONDS)
+        elif self.factor < previous:
+            log.info(f"{self.name}: uso a {pct:.0f}% — ritmo reduzido para "
+                     f"{self.rate * self.factor:.1f} pedidos/min")
+
+
+_rate_limiters      = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(platform: str, token: str) -> RateLimiter:
+    """RateLimiter partilhado por todos os pedidos de `platform` com este token."""
+    key = (platform, hashlib.sha256(token.encode()).hexdigest())
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = _rate_limiters[key] = RateLimiter(platform, RATE_LIMITS[platform])
+        return limiter
+
+
+def request_token(kwargs: dict) -> str:
+    """Access token de um pedido: access_token em params/data ou header Authorization."""
+    for field in ('params', 'data'):
+        values = kwargs.get(field)
+        if isinstance(values, dict) and values.get('access_token'):
+            return values['access_token']
+    auth = (kwargs.get('headers') or {}).get('Authorization', '')
+    return auth.split(' ', 1)[-1] if auth else None
+
+
+def current_limiter(kwargs: dict):
+    """Limiter do pedido em curso; None fora de um publisher ou sem token (ex.: media, blocos)."""
+    scope = (getattr(_publish_context, 'rate_scope', None)
+             or getattr(_publish_context, 'platform', None))
+    if scope not in RATE_LIMITS:
+        return None
+    token = request_token(kwargs)
+    return get_rate_limiter(scope, token) if token else None
+
+
+def platform_usage(resp) -> tuple:
+    """
+    (percentagem de uso, segundos até recuperar) dos headers X-App-Usage e
+    X-Business-Use-Case-Usage da Graph API; (None, None) sem esses headers.
+    """
+    pct, regain = None, None
+    for header in ('X-App-Usage', 'X-Business-Use-Case-Usage'):
+        raw = resp.headers.get(header)
+        if not isinstance(raw, str):
+            continue
+        try:
+            usage = json.loads(raw)
+        except ValueError:
+            continue
+        if header == 'X-App-Usage':
+            entries = [usage]
+        else:   # {business_id: [{type, call_count, ..., estimated_time_to_regain_access}]}
+            entries = [e for v in usage.values() if isinstance(v, list) for e in v]
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            for key in ('call_count', 'total_cputime', 'total_time'):
+                value = entry.get(key)
+                if isinstance(value, (int, float)):
+                    pct = max(pct or 0, value)
+            minutes = entry.get('estimated_time_to_regain_access')
+            if isinstance(minutes, (int, float)) and minutes > 0:
+                regain = max(regain or 0, minutes * 60)
+    return pct, regain
+
+
+def _is_throttled(resp) -> bool:
+    """429, ou 403 de quota do YouTube (rateLimitExceeded / quotaExceeded)."""
+    if resp.status_code == 429:
+        return True
+    if resp.status_code != 403:
+        return False
+    text = resp.text if isinstance(resp.text, str) else ''
+    return any(reason in text for reason in ('rateLimitExceeded', 'quotaExceeded'))
+
+
+class PublishSession(requests.Session):
+    """
+    Session partilhada por todos os publishers: mantém as ligações abertas
+    (keep-alive) para graph.facebook.com, open.tiktokapis.com e googleapis.com,
+    com um pool por host do tamanho da concorrência e timeout por omissão.
+
+    Falhas transitórias (rede, 429, 5xx) são repetidas segundo `retry_policy`,
+    respeitando Retry-After. O resultado final de um pedido à API conta para o
+    circuit breaker da plataforma em curso (ver current_breaker). `retry=False`
+    desliga as repetições num pedido.
+
+    Pedidos com token passam pelo RateLimiter da plataforma/token, que lê os
+    headers de uso de cada resposta e pausa com 429/quota esgotada; nesse caso
+    a repetição espera só pela pausa do limiter, sem o backoff do RetryPolicy.
+    """
+
+    def __init__(self, pool_size: int, timeout=HTTP_TIMEOUT, retry_policy: RetryPolicy = None):
+        super().__init__()
+        self.default_timeout = timeout
+        self.retry_policy    = retry_policy or RetryPolicy()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, retry=True, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        labels  = {
+            'platform': getattr(_publish_context, 'platform', None) or 'none',
+            'endpoint': endpoint_label(url, API_HOSTS),
+        }
+        # Sem query string nos atributos: os tokens vão no URL
+        attributes = {
+            'http.request.method': method,
+            'server.address':      urlsplit(url).hostname,
+            'url.template':        labels['endpoint'],
+        }
+        if isinstance(kwargs.get('data'), (bytes, bytearray)):
+            attributes['http.request.body.size'] = len(kwargs['data'])
+        with tracer.child(f"{method} {labels['endpoint']}", attributes, kind=SPAN_KIND_CLIENT) as span:
+            return self._send(method, url, retry, labels, span, **kwargs)
+
+    def _send(self, method, url, retry, labels, span, **kwargs):
+        policy  = self.retry_policy
+        breaker = current_breaker(url)
+        limiter = current_limiter(kwargs)
+        attempt = 0
+        while True:
+            if limiter:
+                limiter.acquire()
+            started = time.monotonic()
+            try:
+                resp = super().request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._record(labels, started, 'error')
+                transient = policy.transient_error(method, e)
+                if not (retry and transient) or attempt >= policy.attempts:
+                    if breaker and transient:
+                        breaker.record_failure()
+                    _publish_context.failure = (str(e), False)
+                    raise
+                delay  = policy.delay(attempt)
+                paused = False
+                reason = str(e)
+                metrics.inc('http_retries_total', reason='error', **labels)
+            else:
+                self._record(labels, started, resp.status_code)
+                retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                paused      = bool(limiter) and self._observe(limiter, resp, retry_after,
+                                                              stream=kwargs.get('stream'))
+                transient = policy.transient_response(method, resp)
+                delay = policy.delay(attempt, retry_after) if transient else 0
+                if not (retry and transient) or attempt >= policy.attempts or delay > policy.max_delay:
+                    if breaker and transient:
+                        breaker.record_failure()
+                    elif breaker:
+                        breaker.record_success()
+                    # Última resposta do publisher: classifica a falha se ele desistir
+                    _publish_context.failure = (None if resp.ok else
+                                                (f"HTTP {resp.status_code}", policy.permanent_response(resp)))
+                    if span:
+                        self._trace_response(span, resp)
+                    return resp
+                reason = f"HTTP {resp.status_code}"
+                metrics.inc('http_retries_total', reason=str(resp.status_code), **labels)
+                resp.close()
+
+            attempt += 1
+            if span:
+                span.set('http.request.resend_count', attempt)
+            log.warning(f"{method} {url.split('?')[0]}: {reason} — tentativa {attempt + 1} "
+                        f"de {policy.attempts + 1} em {delay:.1f}s")
+            if not paused:
+                time.sleep(delay)   # com o token em pausa, a espera é a do limiter.acquire()
+
+    @staticmethod
+    def _trace_response(span, resp):
+        span.set('http.response.status_code', resp.status_code)
+        length = resp.headers.get('Content-Length')
+        if length and length.isdigit():
+            span.set('http.response.body.size', int(length))
+        if resp.status_code >= 400:
+            span.fail(f"HTTP {resp.status_code}")
+
+    @staticmethod
+    def _record(labels: dict, started: float, status):
+        metrics.observe('http_request_duration_seconds', time.monotonic() - started, **labels)
+        metrics.inc('http_requests_total', status=str(status), **labels)
+
+    @staticmethod
+    def _observe(limiter: RateLimiter, resp, retry_after: float, stream: bool = False) -> bool:
+        """Aplica os headers de uso ao limiter; True se o token ficou em pausa (429/quota)."""
+        pct, regain = platform_usage(resp)
+        if pct is not None:
+            limiter.observe_usage(pct, regain)
+        if not stream and _is_throttled(resp):
+            limiter.pause(retry_after if retry_after is not None else RATE_PAUSE_SECONDS)
+            return True
+        return False
+
+
+http = PublishSession(pool_size=MAX_WORKERS)
+
+
+# ── Supabase ──────────────────────────────────────────────────
+
+# Colunas de posts usadas pelos publishers e pelo escalonador (o modo drain não pede '*')
+POST_COLUMNS = (
+    'id, avatar_id, campanha_id, prioridade, legenda, hashtags, imagem_url, video_url, '
+    'plataformas, agendado_para, yt_upload_url, yt_upload_offset, yt_upload_iniciado_em, tentativas'
+)
+DUE_POSTS_SELECT = '*, avatares(nome, nicho, prompt_base)'
+
+
+def retry_ready(now: str) -> str:
+    """Filtro PostgREST: posts sem nova tentativa pendente ou cuja hora já chegou."""
+    return f'proxima_tentativa_em.is.null,proxima_tentativa_em.lte."{now}"'
 
 
 def get_due_posts():
-    """Busca posts agendados com data <= agora."""
-    now = datetime.now(timezone.utc).isoformat()
+    """
+    Busca até DUE_POSTS_LIMIT posts agendados com data <= agora (e nova
+    tentativa, se houver, já devida), sem os reservar.
+
+    A função due_posts na BD escolhe-os com as regras de schedule_posts()
+    sobre todos os posts devidos — um backlog de um avatar maior que a
+    página não esconde os posts em atraso dos outros.
+    """
+    res = (supabase.rpc('due_posts', {
+               'p_limit':         DUE_POSTS_LIMIT,
+               'p_grace_seconds': int(SLOT_GRACE),
+               'p_fair_campaign': FAIR_BY_CAMPAIGN,
+           })
+           .select(DUE_POSTS_SELECT)
+           .execute())
+    return schedule_posts(res.data or [])
+
+
+def get_on_time_posts(columns: str, limit: int):
+    """Posts devidos há menos de SLOT_GRACE segundos — os que ainda vão a tempo do slot."""
+    now   = datetime.now(timezone.utc)
+    since = (now - timedelta(seconds=SLOT_GRACE)).isoformat()
+    now   = now.isoformat()
     res = (supabase.table('posts')
-           .select('*, avatares(nome, nicho, prompt_base)')
+           .select(columns)
            .eq('status', 'agendado')
            .lte('agendado_para', now)
+           .or_(retry_ready(now))
+           .gte('agendado_para', since)
+           .order('agendado_para')
+           .limit(limit)
+           .execute())
+    return res.data or []
+
+
+def unique_posts(posts: list) -> list:
+    """Remove posts repetidos (mesmo id), mantendo a primeira ocorrência."""
+    seen, unique = set(), []
+    for post in posts:
+        if post['id'] not in seen:
+            seen.add(post['id'])
+            unique.append(post)
+    return unique
+
+
+def get_due_posts_page(after: tuple = None, page_size: int = DRAIN_PAGE_SIZE):
+    """
+    Uma página de posts em atraso, por keyset em (agendado_para, id).
+    `after` é o (agendado_para, id) do último post da página anterior.
+    """
+    now   = datetime.now(timezone.utc).isoformat()
+    query = (supabase.table('posts')
+             .select(POST_COLUMNS)
+             .eq('status', 'agendado')
+             .lte('agendado_para', now))
+    ready = retry_ready(now)
+    if after:
+        # Um só or=(…): o filtro de novas tentativas vai dentro de cada ramo do cursor
+        ts, post_id = after
+        query = query.or_(
+            f'and(agendado_para.gt."{ts}",or({ready})),'
+            f'and(agendado_para.eq."{ts}",id.gt.{post_id},or({ready}))'
+        )
+    else:
+        query = query.or_(ready)
+    res = (query
            .order('agendado_para')
-           .limit(20)
+           .order('id')
+           .limit(page_size)
            .execute())
     return res.data or []
 
 
-def mark_post(post_id: str, status: str, error: str = None):
+def iter_due_post_pages(page_size: int, deadline: float):
+    """
+    Gera páginas de posts em atraso até a fila esvaziar ou time.monotonic()
+    passar `deadline`. O cursor keyset garante que posts já tratados nesta run
+    não voltam a sair, mesmo com o status ainda no WriteBuffer.
+
+    Enquanto há backlog (página cheia), cada página leva também os posts a
+    tempo do slot, que o cursor só alcançaria no fim da fila; os ids já
+    entregues são filtrados quando o cursor lá chega.
+    """
+    after = None
+    seen  = set()
+    while time.monotonic() < deadline:
+        page = get_due_posts_page(after, page_size)
+        if not page:
+            return
+        last = page[-1]
+        full = len(page) >= page_size
+        if full:
+            page = page + get_on_time_posts(POST_COLUMNS, page_size)
+        page = [p for p in unique_posts(page) if p['id'] not in seen]
+        seen.update(p['id'] for p in page)
+        if page:
+            yield page
+        if not full:
+            return
+        after = (last['agendado_para'], last['id'])
+    log.warning("Modo drain: orçamento de tempo esgotado — restantes posts ficam para a próxima run")
+
+
+def claim_due_posts(limit: int = DUE_POSTS_LIMIT):
+    """
+    Reserva atomicamente até `limit` posts em atraso para este worker.
+
+    A função claim_due_posts na BD usa FOR UPDATE SKIP LOCKED, passa os posts
+    para 'publicando' com lease de LEASE_SECONDS e recupera leases expirados.
+    Escolhe os posts com a mesma ordem que schedule_posts().
+    """
+    res = supabase.rpc('claim_due_posts', {
+        'p_worker':        WORKER_ID,
+        'p_limit':         limit,
+        'p_lease_seconds': LEASE_SECONDS,
+        'p_grace_seconds': int(SLOT_GRACE),
+        'p_fair_campaign': FAIR_BY_CAMPAIGN,
+    }).execute()
+    return schedule_posts(res.data or [])
+
+
+def iter_claimed_pages(page_size: int, deadline: float):
+    """Modo drain com reservas: reserva páginas até a fila esvaziar ou passar `deadline`."""
+    while time.monotonic() < deadline:
+        page = claim_due_posts(page_size)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+    log.warning("Modo drain: orçamento de tempo esgotado — restantes posts ficam para a próxima run")
+
+
+def due_post_pages():
+    """Páginas de posts a publicar nesta run, conforme PUBLISH_DRAIN e PUBLISH_CLAIM."""
+    claim = CLAIM_MODE and not DRY_RUN   # dry run nunca reserva posts
+    if not DRAIN_MODE:
+        return [claim_due_posts() if claim else get_due_posts()]
+
+    log.info(f"Modo drain: páginas de {DRAIN_PAGE_SIZE} posts, orçamento {DRAIN_BUDGET:.0f}s")
+    deadline = time.monotonic() + DRAIN_BUDGET
+    if claim:
+        return iter_claimed_pages(DRAIN_PAGE_SIZE, deadline)
+    return iter_due_post_pages(DRAIN_PAGE_SIZE, deadline)
+
+
+# ── Escalonador ───────────────────────────────────────────────
+
+def post_lateness(post: dict, now: datetime) -> float:
+    """Segundos desde agendado_para (None se a data faltar ou não for válida)."""
+    try:
+        return (now - datetime.fromisoformat(post['agendado_para'])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_on_time(post: dict, now: datetime) -> bool:
+    """O post ficou devido há menos de SLOT_GRACE segundos (ainda vai a tempo do slot)."""
+    lateness = post_lateness(post, now)
+    return lateness is not None and lateness <= SLOT_GRACE
+
+
+def schedule_posts(posts: list, now: datetime = None) -> list:
+    """
+    Ordena os posts pela ordem em que devem ser publicados.
+
+    1. posts.prioridade, da maior para a menor;
+    2. dentro de cada prioridade, primeiro os posts a tempo do slot
+       (is_on_time), depois o backlog;
+    3. em cada um destes grupos, rotação entre avatares: a 1.ª vez de cada
+       avatar, depois a 2.ª, … — um avatar com 200 posts em atraso não passa
+       à frente do único post dos outros. Na mesma volta, o mais antigo primeiro.
+
+    Com PUBLISH_FAIR_CAMPAIGN, a fila de cada avatar alterna também entre as
+    suas campanhas (e os posts sem campanha). As funções claim_due_posts e
+    due_posts na BD seguem as mesmas regras.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    def slot(post):
+        return (post.get('agendado_para') or '', post['id'])
+
+    tier   = {id(p): (-int(p.get('prioridade') or 0), not is_on_time(p, now)) for p in posts}
+    queues = defaultdict(list)
+    for post in posts:
+        queues[tier[id(post)] + (post.get('avatar_id'),)].append(post)
+
+    turn = {}
+    for queue in queues.values():
+        queue.sort(key=slot)
+        if FAIR_BY_CAMPAIGN:
+            campaign_turns = Counter()
+            ranked = []
+            for post in queue:
+                campaign = post.get('campanha_id')
+                ranked.append((campaign_turns[campaign],) + slot(post) + (post,))
+                campaign_turns[campaign] += 1
+            queue = [entry[-1] for entry in sorted(ranked, key=lambda e: e[:-1])]
+        for n, post in enumerate(queue):
+            turn[id(post)] = n
+
+    return sorted(posts, key=lambda p: tier[id(p)] + (turn[id(p)],) + slot(p))
+
+
+def seconds_until_next_due(max_wait: float) -> float:
+    """
+    Segundos até ao próximo agendado_para ou proxima_tentativa_em no futuro,
+    limitado a `max_wait`.
+    """
+    now  = datetime.now(timezone.utc)
+    wait = max_wait
+    for column in ('agendado_para', 'proxima_tentativa_em'):
+        try:
+            res = (supabase.table('posts')
+                   .select(column)
+                   .eq('status', 'agendado')
+                   .gt(column, now.isoformat())
+                   .order(column)
+                   .limit(1)
+                   .execute())
+            rows = res.data or []
+            if rows:
+                due  = datetime.fromisoformat(rows[0][column])
+                wait = min(wait, (due - now).total_seconds())
+        except Exception as e:
+            log.warning(f"Erro a consultar o próximo post agendado ({column}): {e}")
+    return max(0.0, wait)
+
+
+def own_lease(query):
+    """Em modo claim, restringe um update aos posts ainda reservados por este worker."""
+    return query.eq('lease_worker', WORKER_ID) if CLAIM_MODE else query
+
+
+def mark_post(post_id: str, status: str, error: str = None, **fields):
     data = {'status': status}
     if error:
         data['error_msg'] = str(error)[:500]
-    supabase.table('posts').update(data).eq('id', post_id).execute()
+    data.update(fields)
+    if CLAIM_MODE:
+        data['lease_worker']    = None
+        data['lease_expira_em'] = None
+    if write_buffer:
+        write_buffer.add_status(post_id, data)
+    else:
+        own_lease(supabase.table('posts').update(data).eq('id', post_id)).execute()
     log.info(f"Post {post_id} → {status}" + (f" ({error})" if error else ""))
 
 
-def save_published(post, platform: str, social_id: str = None, url: str = None):
-    supabase.table('publicados').insert({
+def save_published(post, platform: str, social_id: str = None, url: str = None,
+                   state: str = 'publicado'):
+    row = {
         'post_id':        post['id'],
         'avatar_id':      post.get('avatar_id'),
         'plataforma':     platform,
         'publicado_em':   datetime.now(timezone.utc).isoformat(),
         'post_id_social': social_id,
         'url_post':       url,
+        'estado':         state,
         'likes':          0,
         'comentarios':    0,
         'visualizacoes':  0,
-    }).execute()
+    }
+    if CLAIM_MODE and state == 'processando':
+        # Reservada para este worker: os outros não a retomam em load_pending()
+        row['lease_worker']    = WORKER_ID
+        row['lease_expira_em'] = (datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)).isoformat()
+    if write_buffer:
+        write_buffer.add_published(row)
+    else:
+        supabase.table('publicados').insert(row).execute()
+
+
+def published_platforms(post_ids: list) -> dict:
+    """post_id → plataformas já publicadas (post_plataformas), para não repetir uploads."""
+    if not post_ids:
+        return {}
+    try:
+        res = (supabase.table('post_plataformas')
+               .select('post_id, plataforma')
+               .eq('status', 'publicado')
+               .in_('post_id', post_ids)
+               .execute())
+    except Exception as e:
+        log.warning(f"Erro a ler o estado por plataforma: {e} — a publicar todas")
+        return {}
+    done = defaultdict(set)
+    for row in res.data or []:
+        done[row['post_id']].add(row['plataforma'])
+    return done
+
+
+def mark_platform(post_id: str, platform: str, status: str, error: str = None,
+                  duration: float = None, media_bytes: int = None):
+    """
+    Grava o estado de (post, plataforma) em post_plataformas, com a duração da
+    publicação e o tamanho do media (quando conhecidos) para o JobCostModel.
+    """
+    row = {
+        'post_id':       post_id,
+        'plataforma':    platform,
+        'status':        status,
+        'error_msg':     str(error)[:500] if error else None,
+        'duracao_ms':    round(duration * 1000) if duration is not None else None,
+        'media_bytes':   media_bytes,
+        'atualizado_em': datetime.now(timezone.utc).isoformat(),
+    }
+    if write_buffer:
+        write_buffer.add_platform_state(row)
+        return
+    try:
+        supabase.table('post_plataformas').upsert(row, on_conflict='post_id,plataforma').execute()
+    except Exception as e:
+        log.error(f"Erro a gravar estado {platform} do post {post_id}: {e}")
+
+
+class WriteBuffer:
+    """
+    Write-behind para mark_post(), mark_platform() e save_published() durante
+    uma run.
+
+    Acumula as linhas de `publicados`, os estados de `post_plataformas` e os
+    updates de `posts` e grava-os em lote: um insert para todas as linhas de
+    `publicados`, um upsert para os estados por plataforma e, em `posts`,
+    uma escrita por status (ver _update_posts). Grava
+    quando chega a `max_rows` escritas pendentes, a cada `interval` segundos
+    (thread de fundo) e em close(), que main() chama num finally.
+    """
+
+    def __init__(self, max_rows: int = FLUSH_ROWS, interval: float = FLUSH_SECONDS):
+        self.max_rows    = max_rows
+        self.interval    = interval
+        self._published  = []    # linhas para publicados
+        self._platforms  = {}    # (post_id, plataforma) → linha de post_plataformas
+        self._status     = {}    # post_id → dados do update em posts
+        self._lock       = threading.Lock()   # protege os buffers
+        self._flush_lock = threading.Lock()   # um flush de cada vez
+        self._stop       = threading.Event()
+        self._thread     = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def add_published(self, row: dict):
+        with self._lock:
+            self._published.append(row)
+            full = self._pending() >= self.max_rows
+        if full:
+            self.flush()
+
+    def add_platform_state(self, row: dict):
+        with self._lock:
+            self._platforms[(row['post_id'], row['plataforma'])] = row
+            full = self._pending() >= self.max_rows
+        if full:
+            self.flush()
+
+    def add_status(self, post_id: str, data: dict):
+        with self._lock:
+            self._status[post_id] = data
+            full = self._pending() >= self.max_rows
+        if full:
+            self.flush()
+
+    def _pending(self) -> int:
+        return len(self._published) + len(self._platforms) + len(self._status)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows,      self._published = self._published, []
+                platforms, self._platforms = self._platforms, {}
+                statuses,  self._status    = self._status, {}
+            # publicados e estados por plataforma primeiro: um post nunca volta
+            # a 'agendado' nem fica 'publicado' sem o registo das plataformas
+            if rows:
+                self._insert_published(rows)
+            if platforms:
+                self._upsert_platform_states(list(platforms.values()))
+            if statuses:
+                self._update_posts(statuses)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    @staticmethod
+    def _insert_published(rows: list):
+        try:
+            supabase.table('publicados').insert(rows).execute()
+            return
+        except Exception as e:
+            log.warning(f"Insert em lote de {len(rows)} publicados falhou ({e}) — a gravar um a um")
+        for row in rows:
+            try:
+                supabase.table('publicados').insert(row).execute()
+            except Exception as e:
+                log.error(f"Erro a gravar publicado {row['plataforma']} do post {row['post_id']}: {e}")
+
+    @staticmethod
+    def _upsert_platform_states(rows: list):
+        try:
+            supabase.table('post_plataformas').upsert(rows, on_conflict='post_id,plataforma').execute()
+            return
+        except Exception as e:
+            log.warning(f"Upsert em lote de {len(rows)} estados falhou ({e}) — a gravar um a um")
+        for row in rows:
+            try:
+                supabase.table('post_plataformas').upsert(row, on_conflict='post_id,plataforma').execute()
+            except Exception as e:
+                log.error(f"Erro a gravar estado {row['plataforma']} do post {row['post_id']}: {e}")
+
+    @staticmethod
+    def _update_posts(statuses: dict):
+        """
+        Agrupa os updates por status (e pelas colunas escritas — um upsert em
+        lote poria a NULL as colunas que faltam numa linha). Um grupo com os
+        mesmos dados vai num update `id=in.(…)`; um grupo com campos por post
+        (tentativas, proxima_tentativa_em, error_msg) vai num upsert em `id`.
+        Se o upsert falhar, grava um a um.
+        """
+        groups = defaultdict(dict)
+        for post_id, data in statuses.items():
+            groups[(data['status'], tuple(sorted(data)))][post_id] = data
+        for (status, _), group in groups.items():
+            payloads = list(group.values())
+            if all(data == payloads[0] for data in payloads):
+                try:
+                    own_lease(supabase.table('posts').update(payloads[0]).in_('id', list(group))).execute()
+                except Exception as e:
+                    log.error(f"Erro a actualizar posts {list(group)} → {payloads[0]}: {e}")
+                continue
+            try:
+                rows = [{'id': post_id, **data} for post_id, data in group.items()]
+                supabase.table('posts').upsert(rows, on_conflict='id').execute()
+                continue
+            except Exception as e:
+                log.warning(f"Upsert em lote de {len(group)} posts → {status} falhou ({e}) — a gravar um a um")
+            for post_id, data in group.items():
+                try:
+                    own_lease(supabase.table('posts').update(data).eq('id', post_id)).execute()
+                except Exception as e:
+                    log.error(f"Erro a actualizar post {post_id} → {data}: {e}")
+
+
+write_buffer = None   # WriteBuffer activo durante main(); None = escrita directa
+
+
+# ── Cache de IDs resolvidos ───────────────────────────────────
+
+class TokenIdCache:
+    """
+    Cache token → ID de conta (ex.: IG Business user ID devolvido por /me).
+
+    Vive em memória durante a run e, se `path` estiver definido, é persistida
+    num ficheiro JSON com validade `ttl` segundos. Os tokens nunca são escritos
+    em disco — a chave é o SHA-256 do token.
+    """
+
+    def __init__(self, path: str = '', ttl: int = 86400):
+        self.path    = path
+        self.ttl     = ttl
+        self._ids    = {}      # sha256(token) → (id, resolvido_em)
+        self._loaded = False
+        self._lock   = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _load(self):
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning(f"Cache de IDs ilegível ({self.path}): {e}")
+            return
+        for key, entry in saved.items():
+            self._ids[key] = (entry['id'], entry['ts'])
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({k: {'id': i, 'ts': ts} for k, (i, ts) in self._ids.items()}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning(f"Erro a guardar cache de IDs ({self.path}): {e}")
+
+    def get_or_resolve(self, token: str, resolve):
+        """Devolve o ID em cache para o token ou chama resolve() e guarda o resultado."""
+        key = self._key(token)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            cached = self._ids.get(key)
+            if cached and time.time() - cached[1] < self.ttl:
+                return cached[0]
+            # Resolver dentro do lock: com vários workers só um faz o pedido
+            resolved = resolve()
+            if resolved:
+                self._ids[key] = (resolved, time.time())
+                self._save()
+            return resolved
+
+    def invalidate(self, token: str):
+        with self._lock:
+            if self._ids.pop(self._key(token), None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._loaded = False
+
+
+ig_id_cache = TokenIdCache(IG_ID_CACHE_FILE, IG_ID_CACHE_TTL)
+
+
+# ── Cache de media ────────────────────────────────────────────
+
+class CachedMedia:
+    """Ficheiro de media na cache: `open()` devolve um handle binário para os uploaders."""
+
+    def __init__(self, path: str, size: int, content_type: str):
+        self.path         = path
+        self.size         = size
+        self.content_type = content_type
+
+    def open(self):
+        return open(self.path, 'rb')
+
+
+class MediaCache:
+    """
+    Cache em disco dos media descarregados pelos publishers.
+
+    Os ficheiros são endereçados pelo conteúdo (SHA-256): o mesmo asset usado
+    por vários posts, avatares ou campanhas ocupa um só ficheiro. O índice
+    URL → {sha256, etag, size, content_type} fica em index.json. O primeiro
+    download é gravado enquanto o uploader o lê (tee), sem atrasar o upload;
+    depois o URL sai da cache na mesma run e, entre runs (directório
+    persistido), é revalidado com If-None-Match. Media maior que `max_bytes`
+    não é gravado; acima de `max_bytes` no total apaga os ficheiros usados
+    há mais tempo (LRU pelo mtime, actualizado a cada uso).
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory    = directory
+        self.max_bytes    = max_bytes
+        self._index       = None     # carregado no primeiro uso
+        self._fresh       = set()    # URLs validados nesta run
+        self._downloading = set()    # URLs a ser gravados por um tee() em curso
+        self._lock        = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> dict:
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                with open(self._path(self.INDEX)) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        tmp = self._path(f'{self.INDEX}.{os.getpid()}.{threading.get_ident()}')
+        with open(tmp, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._path(self.INDEX))
+
+    def _entry(self, url: str):
+        with self._lock:
+            entry = self._load_index().get(url)
+        if entry and os.path.exists(self._path(entry['sha256'])):
+            return entry
+        return None
+
+    def _hit(self, entry: dict) -> CachedMedia:
+        path = self._path(entry['sha256'])
+        os.utime(path)   # LRU: marca como usado agora
+        return CachedMedia(path, entry['size'], entry.get('content_type') or 'application/octet-stream')
+
+    def fetch(self, url: str, offset: int = 0) -> tuple:
+        """
+        (CachedMedia, None) se `url` está (válido) na cache; senão (None, resp)
+        com o download em streaming já pedido a partir do byte `offset`, para
+        o uploader ler — e tee() gravar — sem esperar pelo ficheiro inteiro.
+        """
+        entry = self._entry(url)
+        if entry and url in self._fresh:
+            return self._hit(entry), None
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        r = http.get(url, stream=True, timeout=60, headers=headers or None)
+        if entry and r.status_code == 304:
+            r.close()
+            log.info(f"Cache de media: {url.split('?')[0]} inalterado")
+            self._fresh.add(url)
+            return self._hit(entry), None
+        try:
+            r.raise_for_status()
+        except Exception:
+            r.close()
+            raise
+        return None, r
+
+    def tee(self, url: str, resp, chunks):
+        """
+        Devolve os blocos de `chunks` (o download de `url` desde o byte 0) e
+        grava-os na cache à medida que são lidos. O ficheiro só entra na cache
+        se o download chegar ao fim; media maior que max_bytes não é gravado.
+        """
+        length = resp.headers.get('Content-Length')
+        if length and str(length).isdigit() and int(length) > self.max_bytes:
+            return chunks
+        return self._tee(url, resp, chunks)
+
+    def _tee(self, url: str, resp, chunks):
+        f = tmp = None
+        with self._lock:
+            if url not in self._downloading:   # senão outro upload já está a gravar este URL
+                try:
+                    self._load_index()   # cria o directório
+                    fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.download-')
+                    f = os.fdopen(fd, 'wb')
+                    self._downloading.add(url)
+                except OSError as e:
+                    log.warning(f"Cache de media indisponível ({e}) — {url.split('?')[0]} não fica na cache")
+        writing = f is not None
+        digest  = hashlib.sha256()
+        size    = 0
+        try:
+            for chunk in chunks:
+                if f:
+                    size += len(chunk)
+                    try:
+                        if size > self.max_bytes:
+                            raise OSError(f"maior que a cache ({self.max_bytes / 1e6:.0f} MB)")
+                        f.write(chunk)
+                        digest.update(chunk)
+                    except OSError as e:   # disco cheio, media grande demais…
+                        log.warning(f"Cache de media: {url.split('?')[0]} não fica na cache ({e})")
+                        f = self._discard(f, tmp)
+                yield chunk
+            if f:
+                f.close()
+                f = None
+                entry = self._commit(url, tmp, digest.hexdigest(), size, resp.headers)
+                self._fresh.add(url)
+                self._evict(keep=entry['sha256'])
+        finally:
+            if f:
+                self._discard(f, tmp)   # upload interrompido: o ficheiro parcial não serve
+            if writing:
+                with self._lock:
+                    self._downloading.discard(url)
+
+    @staticmethod
+    def _discard(f, tmp: str):
+        f.close()
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return None
+
+    def _commit(self, url: str, tmp: str, sha: str, size: int, headers) -> dict:
+        os.replace(tmp, self._path(sha))
+        entry = {
+            'sha256':       sha,
+            'etag':         headers.get('ETag'),
+            'size':         size,
+            'content_type': headers.get('Content-Type'),
+        }
+        with self._lock:
+            self._load_index()[url] = entry
+            self._save_index()
+        log.info(f"Cache de media: {url.split('?')[0]} guardado ({size / 1e6:.1f} MB)")
+        return entry
+
+    def _evict(self, keep: str = None):
+        """Apaga os ficheiros menos usados até a cache caber em max_bytes."""
+        with self._lock:
+            files = []
+            for name in os.listdir(self.directory):
+                if len(name) != 64 or name == keep:
+                    continue   # índice, downloads em curso e o ficheiro pedido agora
+                st = os.stat(self._path(name))
+                files.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in files)
+            if keep and os.path.exists(self._path(keep)):
+                total += os.path.getsize(self._path(keep))
+            removed = set()
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                os.unlink(self._path(name))   # handles já abertos continuam válidos
+                removed.add(name)
+                total -= size
+            if removed:
+                self._index = {u: e for u, e in self._load_index().items() if e['sha256'] not in removed}
+                self._save_index()
+                log.info(f"Cache de media: {len(removed)} ficheiros removidos (LRU)")
+
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MB * 1024 * 1024) if MEDIA_CACHE_MB else None
+
+
+def _is_auth_error(r) -> bool:
+    """True se a resposta da Graph API indicar token inválido ou expirado."""
+    if r.status_code == 401:
+        return True
+    try:
+        error = r.json().get('error') or {}
+    except Exception:
+        return False
+    return error.get('code') in (102, 190) or error.get('type') == 'OAuthException'
 
 
 # ── Publishers ────────────────────────────────────────────────
 
-def publish_instagram(post: dict) -> bool:
+GRAPH = 'https://graph.facebook.com/v19.0'
+
+
+class PendingPublish:
+    """
+    Resultado adiado de um publisher: o conteúdo ainda está a ser processado
+    pela plataforma. publish_posts() liberta o worker, consulta `poll` em lote
+    para todos os pendentes com a mesma função e corre `complete()` (que
+    devolve o bool habitual) quando o seu `key` fica pronto.
+
+    `poll(keys)` devolve {key: True (pronto) | None (em processamento) | str (erro)}.
+    """
+
+    def __init__(self, platform: str, key: str, poll, complete,
+                 interval: float, timeout: float):
+        self.platform = platform
+        self.key      = key
+        self.poll     = poll
+        self.complete = complete
+        self.interval = interval
+        self.deadline = time.monotonic() + timeout
+
+
+class PostponedPublish:
+    """
+    Resultado de um publisher que parou por falta de tempo antes do prazo da
+    run sem perder trabalho (ex.: upload YouTube resumível, com a sessão e o
+    offset guardados no post). publish_posts() adia a plataforma para a
+    próxima run, que retoma de onde ficou.
+    """
+
+    def __init__(self, platform: str, reason: str):
+        self.platform = platform
+        self.reason   = reason
+
+
+class PublishFailure:
+    """
+    Publisher sem sucesso, com o motivo e a classificação da falha: permanente
+    (4xx da API, token em falta, post sem media) não se resolve noutra run, e
+    um post em que todas as plataformas falham assim vai logo para 'erro'.
+    É falso, como o False que os publishers devolvem.
+    """
+
+    def __init__(self, platform: str, reason: str, permanent: bool = False):
+        self.platform  = platform
+        self.reason    = reason
+        self.permanent = permanent
+
+    def __bool__(self):
+        return False
+
+
+def permanent_failure(reason: str) -> bool:
+    """Publisher desiste por uma causa que nenhuma nova tentativa resolve; devolve False."""
+    _publish_context.failure = (reason, True)
+    return False
+
+
+def poll_instagram_containers(container_ids: list) -> dict:
+    """Estado de vários containers numa só chamada GET /?ids=…&fields=status_code."""
+    states = {}
+    for i in range(0, len(container_ids), IG_CONTAINER_BATCH):
+        batch = container_ids[i:i + IG_CONTAINER_BATCH]
+        r = http.get(f'{GRAPH}/', params={
+            'ids':          ','.join(batch),
+            'fields':       'status_code,status',
+            'access_token': INSTAGRAM_TOKEN,
+        })
+        if not r.ok:
+            log.warning(f"Instagram estado dos containers: {r.status_code} {r.text}")
+            continue
+        for container_id, data in r.json().items():
+            code = data.get('status_code')
+            if code == 'FINISHED':
+                states[container_id] = True
+            elif code in ('ERROR', 'EXPIRED'):
+                states[container_id] = f"container {code}: {data.get('status', '')}".strip(': ')
+            else:   # IN_PROGRESS
+                states[container_id] = None
+    return states
+
+
+def _instagram_media_publish(post: dict, ig_user_id: str, creation_id: str) -> bool:
+    r2 = http.post(
+        f'{GRAPH}/{ig_user_id}/media_publish',
+        data={'creation_id': creation_id, 'access_token': INSTAGRAM_TOKEN},
+    )
+    if not r2.ok:
+        log.error(f"Instagram publish: {r2.status_code} {r2.text}")
+        if _is_auth_error(r2):
+            ig_id_cache.invalidate(INSTAGRAM_TOKEN)
+        return False
+
+    post_id = r2.json().get('id')
+    log.info(f"Instagram publicado: {post_id}")
+    save_published(post, 'instagram', social_id=post_id)
+    return True
+
+
+def publish_instagram(post: dict):
+    """
+    Cria o media container e publica-o. Para Reels devolve um PendingPublish:
+    o media_publish só corre quando o container chegar a FINISHED.
+    """
     if not INSTAGRAM_TOKEN:
         log.warning("Instagram token não configurado — a saltar")
-        return False
+        return permanent_failure('Token não configurado')
 
-    GRAPH    = 'https://graph.facebook.com/v19.0'
     caption  = post.get('legenda', '')
     hashtags = post.get('hashtags', '')
     full_cap = f"{caption}\n\n{hashtags}".strip()
     img_url  = post.get('imagem_url')
     vid_url  = post.get('video_url')
 
-    # Obter IG Business User ID
-    me_r = requests.get(f'{GRAPH}/me', params={'fields': 'id', 'access_token': INSTAGRAM_TOKEN}, timeout=15)
-    if not me_r.ok:
-        log.error(f"Instagram /me: {me_r.status_code} {me_r.text}")
-        return False
-    ig_user_id = me_r.json().get('id')
+    # Obter IG Business User ID (uma vez por token — ver ig_id_cache)
+    def resolve_ig_user_id():
+        me_r = http.get(f'{GRAPH}/me', params={'fields': 'id', 'access_token': INSTAGRAM_TOKEN}, timeout=15)
+        if not me_r.ok:
+            log.error(f"Instagram /me: {me_r.status_code} {me_r.text}")
+            return None
+        user_id = me_r.json().get('id')
+        if not user_id:
+            log.error(f"Instagram: sem user ID na resposta: {me_r.json()}")
+        return user_id
+
+    ig_user_id = ig_id_cache.get_or_resolve(INSTAGRAM_TOKEN, resolve_ig_user_id)
     if not ig_user_id:
-        log.error(f"Instagram: sem user ID na resposta: {me_r.json()}")
         return False
 
     # Step 1: criar media container
@@ -106,39 +1583,38 @@ def publish_instagram(post: dict) -> bool:
         }
     else:
         log.warning("Post Instagram sem imagem ou vídeo — a saltar")
-        return False
+        return permanent_failure('Post sem imagem ou vídeo')
 
-    r = requests.post(f'{GRAPH}/{ig_user_id}/media', data=params, timeout=30)
+    r = http.post(f'{GRAPH}/{ig_user_id}/media', data=params)
     if not r.ok:
         log.error(f"Instagram media create: {r.status_code} {r.text}")
+        if _is_auth_error(r):
+            ig_id_cache.invalidate(INSTAGRAM_TOKEN)
         return False
 
-    creation_id = r.json().get('id')
-    if not creation_id:
-        log.error(f"Instagram: sem creation_id na resposta: {r.json()}")
-        return False
-
-    # Step 2: publicar
-    r2 = requests.post(
-        f'{GRAPH}/{ig_user_id}/media_publish',
-        data={'creation_id': creation_id, 'access_token': INSTAGRAM_TOKEN},
-        timeout=30
-    )
-    if not r2.ok:
-        log.error(f"Instagram publish: {r2.status_code} {r2.text}")
-        return False
-
-    post_id = r2.json().get('id')
-    log.info(f"Instagram publicado: {post_id}")
-    save_published(post, 'instagram', social_id=post_id)
-    return True
+    creation_id = r.json().get('id')
+    if not creation_id:
+        log.error(f"Instagram: sem creation_id na resposta: {r.json()}")
+        return False
+
+    # Step 2: publicar (Reels só depois de processados — ver PendingPublish)
+    if vid_url:
+        log.info(f"Instagram: container {creation_id} em processamento")
+        return PendingPublish(
+            'instagram', creation_id,
+            poll=poll_instagram_containers,
+            complete=lambda: _instagram_media_publish(post, ig_user_id, creation_id),
+            interval=IG_CONTAINER_POLL_SECONDS,
+            timeout=IG_CONTAINER_TIMEOUT,
+        )
+    return _instagram_media_publish(post, ig_user_id, creation_id)
 
 
 def publish_tiktok(post: dict) -> bool:
     """TikTok Content Posting API v2 — suporta vídeo e foto."""
     if not TIKTOK_TOKEN:
         log.warning("TikTok token não configurado — a saltar")
-        return False
+        return permanent_failure('Token não configurado')
 
     caption  = post.get('legenda', '')
     hashtags = post.get('hashtags', '')
@@ -191,9 +1667,9 @@ def publish_tiktok(post: dict) -> bool:
         endpoint = 'https://open.tiktokapis.com/v2/post/publish/content/init/'
     else:
         log.warning("TikTok: post sem imagem ou vídeo — a saltar")
-        return False
+        return permanent_failure('Post sem imagem ou vídeo')
 
-    r = requests.post(endpoint, headers=headers, json=payload, timeout=30)
+    r = http.post(endpoint, headers=headers, json=payload)
     if not r.ok:
         log.error(f"TikTok: {r.status_code} {r.text}")
         return False
@@ -206,14 +1682,213 @@ def publish_tiktok(post: dict) -> bool:
 
     publish_id = data.get('data', {}).get('publish_id')
     log.info(f"TikTok publicado: {publish_id}")
-    save_published(post, 'tiktok', social_id=publish_id)
+    # O TikTok ainda vai buscar e publicar o media: estado final via TikTokStatusTracker
+    save_published(post, 'tiktok', social_id=publish_id, state='processando')
+    if tiktok_tracker and publish_id:
+        tiktok_tracker.track(publish_id, post['id'])
     return True
 
 
+def fetch_tiktok_status(publish_id: str) -> dict:
+    """POST /v2/post/publish/status/fetch/ → data ({status, fail_reason, publicaly_available_post_id})."""
+    r = http.post(TIKTOK_STATUS_URL, json={'publish_id': publish_id}, headers={
+        'Authorization': f'Bearer {TIKTOK_TOKEN}',
+        'Content-Type':  'application/json; charset=UTF-8',
+    })
+    r.raise_for_status()
+    body = r.json()
+    err_code = body.get('error', {}).get('code', '')
+    if err_code not in ('ok', ''):
+        raise RuntimeError(f"TikTok status: {body.get('error')}")
+    return body.get('data') or {}
+
+
+def fetch_tiktok_username() -> str:
+    """creator_username da conta do token (para montar o URL do vídeo); None se falhar."""
+    r = http.post(TIKTOK_CREATOR_URL, headers={
+        'Authorization': f'Bearer {TIKTOK_TOKEN}',
+        'Content-Type':  'application/json; charset=UTF-8',
+    })
+    if not r.ok:
+        log.warning(f"TikTok creator_info: {r.status_code} {r.text}")
+        return None
+    return (r.json().get('data') or {}).get('creator_username')
+
+
+class TikTokStatusTracker:
+    """
+    Acompanha em segundo plano os publish_id devolvidos por publish_tiktok()
+    até PUBLISH_COMPLETE ou FAILED, sem atrasar o ciclo de publicação.
+
+    A cada `interval` segundos consulta os pendentes cuja vez chegou, no
+    máximo `workers` pedidos em paralelo, e actualiza a linha de `publicados`
+    (estado, post_id_social final, url_post). Cada publish_id começa a ser
+    consultado a cada `interval` segundos e o intervalo cresce
+    TIKTOK_STATUS_BACKOFF× por consulta sem estado final, até `max_interval`.
+    As consultas usam o bucket 'tiktok_status' de RATE_LIMITS, para não
+    gastarem o ritmo dos inits de publicação. Um FAILED marca a plataforma
+    como 'erro' em post_plataformas. start() retoma os publish_id que
+    ficaram 'processando' em runs anteriores — em modo claim, só os que
+    nenhum outro worker está a acompanhar (ver load_pending).
+    """
+
+    FINAL = {'PUBLISH_COMPLETE', 'FAILED'}
+
+    def __init__(self, workers: int = TIKTOK_STATUS_WORKERS, interval: float = TIKTOK_STATUS_POLL_SECONDS,
+                 max_interval: float = TIKTOK_STATUS_MAX_INTERVAL):
+        self.workers      = workers
+        self.interval     = interval
+        self.max_interval = max(interval, max_interval)
+        self._pending  = {}    # publish_id → post_id
+        self._schedule = {}    # publish_id → (próxima consulta, intervalo seguinte)
+        self._lock     = threading.Lock()
+        self._idle     = threading.Condition(self._lock)
+        self._stop     = threading.Event()
+        self._thread   = None
+        self._pool     = None
+        self._username = None
+
+    def track(self, publish_id: str, post_id: str = None):
+        with self._lock:
+            self._pending[publish_id]  = post_id
+            self._schedule[publish_id] = (time.monotonic(), self.interval)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def load_pending(self):
+        """
+        Retoma os publish_id que ficaram 'processando' (no último dia).
+
+        Em modo claim, a função claim_tiktok_pending na BD reserva-os para
+        este worker e só entrega os que nenhum outro worker vivo acompanha.
+        """
+        try:
+            if CLAIM_MODE:
+                res = supabase.rpc('claim_tiktok_pending', {
+                    'p_worker':          WORKER_ID,
+                    'p_lease_seconds':   LEASE_SECONDS,
+                    'p_max_age_seconds': int(TIKTOK_STATUS_MAX_AGE.total_seconds()),
+                }).execute()
+            else:
+                since = (datetime.now(timezone.utc) - TIKTOK_STATUS_MAX_AGE).isoformat()
+                res = (supabase.table('publicados')
+                       .select('post_id, post_id_social')
+                       .eq('plataforma', 'tiktok')
+                       .eq('estado', 'processando')
+                       .gte('publicado_em', since)
+                       .execute())
+        except Exception as e:
+            log.warning(f"Erro a ler publicações TikTok pendentes: {e}")
+            return
+        for row in res.data or []:
+            if row.get('post_id_social'):
+                self.track(row['post_id_social'], row.get('post_id'))
+
+    def start(self):
+        self.load_pending()
+        self._pool   = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tiktok-status')
+        self._thread = threading.Thread(target=self._run, name='tiktok-status', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+    def poll_once(self):
+        """Consulta os pendentes cuja vez chegou e grava os que chegaram a um estado final."""
+        now = time.monotonic()
+        with self._lock:
+            pending = {pid: post_id for pid, post_id in self._pending.items()
+                       if self._schedule[pid][0] <= now}
+        if not pending:
+            return
+        ids     = list(pending)
+        mapper  = self._pool.map if self._pool else map
+        results = list(mapper(self._fetch, ids))
+        done    = [(pid, pending[pid], data) for pid, data in zip(ids, results)
+                   if data and data.get('status') in self.FINAL]
+        if done:
+            if write_buffer:
+                write_buffer.flush()   # a linha 'processando' tem de existir antes do update
+            for publish_id, post_id, data in done:
+                self._save(publish_id, post_id, data)
+        finished = {publish_id for publish_id, _, _ in done}
+        now      = time.monotonic()
+        with self._lock:
+            for publish_id in ids:
+                if publish_id in finished:
+                    self._pending.pop(publish_id, None)
+                    self._schedule.pop(publish_id, None)
+                elif publish_id in self._schedule:
+                    _, wait = self._schedule[publish_id]
+                    self._schedule[publish_id] = (
+                        now + wait, min(self.max_interval, wait * TIKTOK_STATUS_BACKOFF))
+            if not self._pending:
+                self._idle.notify_all()
+
+    @staticmethod
+    def _fetch(publish_id: str) -> dict:
+        try:
+            return run_in_context('tiktok', fetch_tiktok_status, publish_id, rate_scope='tiktok_status')
+        except Exception as e:
+            log.warning(f"TikTok: erro a consultar {publish_id}: {e}")
+            return None
+
+    def _video_url(self, video_id) -> str:
+        if self._username is None:
+            self._username = run_in_context('tiktok', fetch_tiktok_username) or ''
+        return f'https://www.tiktok.com/@{self._username}/video/{video_id}'
+
+    def _save(self, publish_id: str, post_id: str, data: dict):
+        if data['status'] == 'PUBLISH_COMPLETE':
+            video_ids = data.get('publicaly_available_post_id') or []   # sic, nome da API
+            update = {'estado': 'publicado'}
+            if video_ids:
+                update['post_id_social'] = str(video_ids[0])
+                update['url_post']       = self._video_url(video_ids[0])
+            log.info(f"TikTok {publish_id}: publicado {update.get('url_post', '')}".rstrip())
+        else:
+            reason = data.get('fail_reason') or 'FAILED'
+            update = {'estado': 'falhou', 'erro': str(reason)[:500]}
+            log.error(f"TikTok {publish_id}: publicação falhou ({reason})")
+            if post_id:
+                mark_platform(post_id, 'tiktok', 'erro', reason)
+        try:
+            (supabase.table('publicados')
+             .update(update)
+             .eq('plataforma', 'tiktok')
+             .eq('post_id_social', publish_id)
+             .execute())
+        except Exception as e:
+            log.error(f"Erro a actualizar publicado TikTok {publish_id}: {e}")
+
+    def close(self, timeout: float = TIKTOK_STATUS_WAIT):
+        """Espera até `timeout` segundos pelos pendentes e pára; os restantes ficam para a próxima run."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending and self._thread and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            left = len(self._pending)
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._pool:
+            self._pool.shutdown()
+        if left:
+            log.info(f"TikTok: {left} publicações ainda em processamento — continuam na próxima run")
+
+
+tiktok_tracker = None   # TikTokStatusTracker activo durante main()/daemon
+
+
 def publish_facebook(post: dict) -> bool:
     if not FACEBOOK_TOKEN:
         log.warning("Facebook token não configurado — a saltar")
-        return False
+        return permanent_failure('Token não configurado')
 
     caption  = post.get('legenda', '')
     hashtags = post.get('hashtags', '')
@@ -221,13 +1896,13 @@ def publish_facebook(post: dict) -> bool:
     img_url  = post.get('imagem_url')
 
     if img_url:
-        r = requests.post('https://graph.facebook.com/v19.0/me/photos', params={
+        r = http.post('https://graph.facebook.com/v19.0/me/photos', params={
             'url': img_url, 'caption': message, 'access_token': FACEBOOK_TOKEN
-        }, timeout=30)
+        })
     else:
-        r = requests.post('https://graph.facebook.com/v19.0/me/feed', params={
+        r = http.post('https://graph.facebook.com/v19.0/me/feed', params={
             'message': message, 'access_token': FACEBOOK_TOKEN
-        }, timeout=30)
+        })
 
     if not r.ok:
         log.error(f"Facebook: {r.status_code} {r.text}")
@@ -239,76 +1914,350 @@ def publish_facebook(post: dict) -> bool:
     return True
 
 
+def _iter_chunks(resp, size: int, skip: int = 0):
+    """
+    Reagrupa o stream do download em blocos de `size` bytes (o último pode ser
+    menor), descartando primeiro `skip` bytes.
+    """
+    buf = bytearray()
+    for piece in resp.iter_content(chunk_size=size):
+        if skip:
+            dropped = min(skip, len(piece))
+            piece   = piece[dropped:]
+            skip   -= dropped
+        if not piece:
+            continue
+        buf += piece
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+
+def _iter_file_chunks(f, size: int):
+    """Lê um ficheiro em blocos de `size` bytes a partir da posição actual."""
+    return iter(lambda: f.read(size), b'')
+
+
+def _content_total(resp, offset: int):
+    """Tamanho total do conteúdo, a partir de Content-Range (206) ou Content-Length."""
+    if offset and resp.status_code == 206:
+        length = resp.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+    else:
+        length = resp.headers.get('Content-Length')
+    return int(length) if length and str(length).isdigit() else None
+
+
+def _open_media(url: str, offset: int = 0) -> tuple:
+    """
+    Abre o conteúdo de `url` a partir do byte `offset` para o upload em blocos.
+    Devolve (blocos, content_type, total, close).
+
+    Com a media_cache activa, um asset já na cache é lido do disco; senão o
+    download segue em streaming para o upload e é gravado na cache ao mesmo
+    tempo (só a partir do byte 0). Ao retomar, pede só os bytes em falta
+    (Range) e, se a origem ignorar o Range, descarta os bytes já enviados à
+    medida que chegam.
+    """
+    content_r = None
+    if media_cache:
+        try:
+            with tracer.child('media.cache') as span:
+                media, content_r = media_cache.fetch(url, offset)
+                if span:
+                    span.set('media.cache_hit', media is not None)
+        except requests.RequestException:
+            raise
+        except OSError as e:   # disco cheio, sem permissões…
+            log.warning(f"Cache de media indisponível ({e}) — download em streaming")
+        else:
+            if media:
+                f = media.open()
+                f.seek(offset)
+                return _iter_file_chunks(f, YOUTUBE_CHUNK_SIZE), media.content_type, media.size, f.close
+
+    if content_r is None:
+        headers   = {'Range': f'bytes={offset}-'} if offset else None
+        content_r = http.get(url, stream=True, timeout=60, headers=headers)
+        try:
+            content_r.raise_for_status()
+        except Exception:
+            content_r.close()
+            raise
+    content_type = content_r.headers.get('Content-Type', 'video/mp4')
+    total        = _content_total(content_r, offset)
+    skip         = offset if offset and content_r.status_code != 206 else 0
+    chunks       = _iter_chunks(content_r, YOUTUBE_CHUNK_SIZE, skip=skip)
+    if media_cache and not offset:
+        chunks = media_cache.tee(url, content_r, chunks)
+
+    def close():
+        chunks.close()   # um tee por acabar apaga o ficheiro parcial
+        content_r.close()
+
+    return chunks, content_type, total, close
+
+
+def _with_last(iterable):
+    """Gera (item, is_last) — precisa de ver o bloco seguinte para saber se é o último."""
+    it = iter(iterable)
+    try:
+        prev = next(it)
+    except StopIteration:
+        return
+    for item in it:
+        yield prev, False
+        prev = item
+    yield prev, True
+
+
+def _youtube_acked(resp) -> int:
+    """Bytes confirmados pelo YouTube segundo o header Range de uma resposta 308."""
+    rng = resp.headers.get('Range')
+    if not rng:
+        return 0
+    return int(rng.rsplit('-', 1)[1]) + 1
+
+
+def _youtube_query_offset(upload_url: str, total: str):
+    """
+    Pergunta ao YouTube quantos bytes da sessão já recebeu.
+    Devolve (bytes_confirmados, resposta); bytes_confirmados é None se o
+    upload já estiver concluído (a resposta traz então o vídeo criado).
+    """
+    r = http.put(
+        upload_url,
+        headers={'Content-Range': f'bytes */{total}', 'Content-Length': '0'},
+    )
+    if r.status_code in (200, 201):
+        return None, r
+    if r.status_code == 308:
+        return _youtube_acked(r), r
+    raise RuntimeError(f"estado da sessão: {r.status_code} {r.text}")
+
+
+def youtube_upload_stream(upload_url: str, chunks, content_type: str, total: int = None,
+                          offset: int = 0, on_progress=None):
+    """
+    Envia `chunks` para uma sessão de upload resumível do YouTube, um PUT por bloco.
+
+    `chunks` começa no byte `offset` da sessão (0 num upload novo). A memória
+    fica limitada a dois blocos (o actual e o seguinte). Se um bloco falhar por
+    erro de rede ou 5xx, consulta o offset confirmado pelo YouTube e reenvia só
+    a parte em falta desse bloco, até YOUTUBE_CHUNK_RETRIES vezes. Após cada
+    bloco confirmado chama on_progress(bytes_confirmados).
+
+    Com um run_budget, antes de cada bloco (excepto o primeiro) confirma que o
+    prazo ainda cobre o dobro do tempo do bloco anterior; se não, pára e
+    devolve um PostponedPublish — a sessão continua válida para a próxima run.
+    Devolve a resposta final (200/201) ou None em caso de falha.
+    """
+    first         = offset
+    chunk_seconds = 0.0
+    for chunk, is_last in _with_last(chunks):
+        if offset > first and run_budget and not run_budget.allows(2 * chunk_seconds):
+            log.info(f"YouTube: prazo da run a acabar — upload pára no byte {offset} e continua na próxima run")
+            return PostponedPublish('youtube', f'upload parado no byte {offset}')
+        chunk_started = time.monotonic()
+        start = offset
+        end   = start + len(chunk)
+        if total is not None:
+            size_str = str(total)
+        else:
+            size_str = str(end) if is_last else '*'
+
+        acked    = start
+        attempts = 0
+        while acked < end:
+            r = None
+            try:
+                r = http.put(
+                    upload_url,
+                    retry=False,   # o ciclo do bloco retoma pelo offset confirmado
+                    data=chunk[acked - start:],
+                    headers={
+                        'Content-Type':  content_type,
+                        'Content-Range': f'bytes {acked}-{end - 1}/{size_str}',
+                    },
+                    timeout=YOUTUBE_CHUNK_TIMEOUT,
+                )
+            except requests.RequestException as e:
+                log.warning(f"YouTube: bloco {acked}-{end - 1} interrompido: {e}")
+
+            if r is not None:
+                if r.status_code in (200, 201):
+                    metrics.inc('upload_bytes_total', end - acked, platform='youtube')
+                    tracer.add('upload.bytes', end - acked)
+                    return r
+                if r.status_code == 308:
+                    confirmed = _youtube_acked(r)
+                    if confirmed > acked:
+                        metrics.inc('upload_bytes_total', confirmed - acked, platform='youtube')
+                        tracer.add('upload.bytes', confirmed - acked)
+                        acked = confirmed
+                        continue
+                elif r.status_code < 500 and r.status_code not in (408, 429):
+                    log.error(f"YouTube upload: {r.status_code} {r.text}")
+                    return None
+                else:
+                    log.warning(f"YouTube: bloco {acked}-{end - 1} falhou com {r.status_code}")
+
+            attempts += 1
+            if attempts > YOUTUBE_CHUNK_RETRIES:
+                log.error(f"YouTube upload: desistir após {YOUTUBE_CHUNK_RETRIES} tentativas no byte {acked}")
+                return None
+            time.sleep(min(2 ** attempts, 30))
+
+            # Retomar a partir do último byte confirmado pelo YouTube
+            try:
+                confirmed, status_r = _youtube_query_offset(upload_url, size_str)
+            except Exception as e:
+                log.warning(f"YouTube: erro a consultar sessão: {e}")
+                continue
+            if confirmed is None:
+                return status_r
+            if confirmed < start:
+                log.error(f"YouTube upload: sessão recuou para o byte {confirmed} (bloco começa em {start})")
+                return None
+            acked = max(acked, confirmed)
+
+        offset        = end
+        chunk_seconds = time.monotonic() - chunk_started
+        if on_progress:
+            on_progress(offset)
+
+    if offset == first:
+        log.error("YouTube upload: conteúdo vazio")
+    else:
+        log.error(f"YouTube upload: {offset} bytes enviados sem confirmação final")
+    return None
+
+
+def save_youtube_session(post_id: str, upload_url: str, offset: int, started: bool = False):
+    """Guarda no post a sessão de upload resumível e o offset confirmado."""
+    data = {'yt_upload_url': upload_url, 'yt_upload_offset': offset}
+    if started:
+        data['yt_upload_iniciado_em'] = datetime.now(timezone.utc).isoformat()
+    try:
+        supabase.table('posts').update(data).eq('id', post_id).execute()
+    except Exception as e:
+        log.warning(f"YouTube: erro a guardar sessão de upload do post {post_id}: {e}")
+
+
+def clear_youtube_session(post_id: str):
+    save_youtube_session(post_id, None, None)
+
+
+def _youtube_saved_session(post: dict):
+    """Devolve o URL da sessão guardada no post, se ainda estiver dentro da validade."""
+    upload_url = post.get('yt_upload_url')
+    started    = post.get('yt_upload_iniciado_em')
+    if not upload_url or not started:
+        return None
+    try:
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(started)
+    except (TypeError, ValueError):
+        return None
+    return upload_url if age < YOUTUBE_SESSION_MAX_AGE else None
+
+
 def publish_youtube(post: dict) -> bool:
-    """YouTube Data API v3 — Resumable video upload."""
+    """YouTube Data API v3 — Resumable video upload, em streaming por blocos."""
     if not YOUTUBE_TOKEN:
         log.warning("YouTube token não configurado — a saltar")
-        return False
+        return permanent_failure('Token não configurado')
 
     video_url = post.get('video_url')
     if not video_url:
         log.warning("YouTube: post sem URL de conteúdo — a saltar")
-        return False
+        return permanent_failure('Post sem vídeo')
 
     caption     = post.get('legenda', '')
     hashtags    = post.get('hashtags', '')
     title       = caption[:100] or 'Novo vídeo'
     description = f"{caption}\n\n{hashtags}".strip()
 
-    # Descarregar conteúdo
+    # Retomar uma sessão de upload deixada a meio por uma run anterior
+    upload_url = _youtube_saved_session(post)
+    offset     = 0
+    if upload_url:
+        try:
+            confirmed, status_r = _youtube_query_offset(upload_url, '*')
+        except Exception as e:
+            log.warning(f"YouTube: sessão anterior inutilizável ({e}) — a reiniciar upload")
+            upload_url = None
+        else:
+            if confirmed is None:
+                return _youtube_done(post, status_r)
+            offset = confirmed
+            log.info(f"YouTube: a retomar upload do post {post['id']} no byte {offset}")
+
+    # Abrir o conteúdo (cache ou download em streaming) — nunca fica todo em memória
     try:
-        content_r = requests.get(video_url, timeout=60)
-        content_r.raise_for_status()
+        chunks, content_type, total, close = _open_media(video_url, offset)
     except Exception as e:
         log.error(f"YouTube: erro a descarregar conteúdo: {e}")
         return False
 
-    content_type = content_r.headers.get('Content-Type', 'video/mp4')
-    content_data = content_r.content
-
-    # Step 1: iniciar upload resumível
-    init_headers = {
-        'Authorization':          f'Bearer {YOUTUBE_TOKEN}',
-        'Content-Type':           'application/json; charset=UTF-8',
-        'X-Upload-Content-Type':  content_type,
-        'X-Upload-Content-Length': str(len(content_data)),
-    }
-    metadata = {
-        'snippet': {
-            'title':       title,
-            'description': description,
-            'categoryId':  '22',   # People & Blogs
-        },
-        'status': {'privacyStatus': 'public'},
-    }
-    init_r = requests.post(
-        'https://www.googleapis.com/upload/youtube/v3/videos'
-        '?uploadType=resumable&part=snippet,status',
-        headers=init_headers, json=metadata, timeout=30
-    )
-    if not init_r.ok:
-        log.error(f"YouTube init: {init_r.status_code} {init_r.text}")
-        return False
+    try:
+        if not upload_url:
+            # Step 1: iniciar upload resumível
+            init_headers = {
+                'Authorization':          f'Bearer {YOUTUBE_TOKEN}',
+                'Content-Type':           'application/json; charset=UTF-8',
+                'X-Upload-Content-Type':  content_type,
+            }
+            if total is not None:
+                init_headers['X-Upload-Content-Length'] = str(total)
+            metadata = {
+                'snippet': {
+                    'title':       title,
+                    'description': description,
+                    'categoryId':  '22',   # People & Blogs
+                },
+                'status': {'privacyStatus': 'public'},
+            }
+            init_r = http.post(
+                'https://www.googleapis.com/upload/youtube/v3/videos'
+                '?uploadType=resumable&part=snippet,status',
+                headers=init_headers, json=metadata
+            )
+            if not init_r.ok:
+                log.error(f"YouTube init: {init_r.status_code} {init_r.text}")
+                return False
 
-    upload_url = init_r.headers.get('Location')
-    if not upload_url:
-        log.error("YouTube: sem URL de upload na resposta")
-        return False
+            upload_url = init_r.headers.get('Location')
+            if not upload_url:
+                log.error("YouTube: sem URL de upload na resposta")
+                return False
+            save_youtube_session(post['id'], upload_url, 0, started=True)
+
+        # Step 2: enviar conteúdo por blocos, directamente do download
+        try:
+            upload_r = youtube_upload_stream(
+                upload_url, chunks, content_type, total, offset=offset,
+                on_progress=lambda n: save_youtube_session(post['id'], upload_url, n),
+            )
+        except requests.RequestException as e:
+            log.error(f"YouTube: download interrompido: {e}")
+            return False
+        if upload_r is None:
+            return False
+        if isinstance(upload_r, PostponedPublish):
+            return upload_r
+    finally:
+        close()
+
+    return _youtube_done(post, upload_r)
 
-    # Step 2: enviar conteúdo
-    upload_r = requests.put(
-        upload_url,
-        data=content_data,
-        headers={'Content-Type': content_type},
-        timeout=120
-    )
-    if upload_r.status_code not in (200, 201):
-        log.error(f"YouTube upload: {upload_r.status_code} {upload_r.text}")
-        return False
 
+def _youtube_done(post: dict, upload_r) -> bool:
+    """Regista o vídeo criado e limpa a sessão de upload guardada."""
     video_id = upload_r.json().get('id')
     url      = f"https://www.youtube.com/watch?v={video_id}"
     log.info(f"YouTube publicado: {video_id}")
+    clear_youtube_session(post['id'])
     save_published(post, 'youtube', social_id=video_id, url=url)
     return True
 
@@ -321,49 +2270,977 @@ PUBLISHERS = {
 }
 
 
-# ── Main ──────────────────────────────────────────────────────
+# ── Validação prévia de media ─────────────────────────────────
 
-def main():
-    posts = get_due_posts()
-    log.info(f"Posts para publicar: {len(posts)}" + (" [DRY RUN]" if DRY_RUN else ""))
+MEDIA_FIELDS = {'image': 'imagem_url', 'video': 'video_url'}
+MEDIA_LABELS = {'image': 'imagem', 'video': 'vídeo'}
 
-    published = 0
-    errors    = 0
 
+def media_for(post: dict, platform: str):
+    """(tipo, URL) do media que o publisher de `platform` vai usar; None se nenhum."""
+    for kind in PLATFORM_MEDIA.get(platform, ()):
+        url = post.get(MEDIA_FIELDS[kind])
+        if url:
+            return kind, url
+    return None
+
+
+def probe_media(url: str):
+    """
+    HEAD ao media (ou GET Range: bytes=0-0 se o servidor não responder ao HEAD
+    com tamanho). Devolve {error} ou {content_type, size}; None se o resultado
+    for inconclusivo (rede, 5xx) — nesse caso o publisher tenta na mesma.
+    """
+    try:
+        r = http.head(url, allow_redirects=True, timeout=PREFLIGHT_TIMEOUT, retry=False)
+        if r.status_code in (403, 405, 501) or (r.ok and not r.headers.get('Content-Length')):
+            r = http.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                         timeout=PREFLIGHT_TIMEOUT, retry=False)
+            r.close()
+    except requests.RequestException as e:
+        log.warning(f"Pré-validação de {url.split('?')[0]} inconclusiva: {e}")
+        return None
+    if r.status_code >= 500:
+        return None
+    if r.status_code >= 400:
+        return {'error': f'HTTP {r.status_code}'}
+    if r.status_code == 206:
+        length = r.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+    else:
+        length = r.headers.get('Content-Length')
+    return {
+        'content_type': (r.headers.get('Content-Type') or '').split(';')[0].strip().lower(),
+        'size':         int(length) if length and str(length).isdigit() else None,
+    }
+
+
+def check_media(platform: str, kind: str, info: dict):
+    """Mensagem de erro se o media não servir para `platform`; None se estiver OK."""
+    label = MEDIA_LABELS[kind]
+    if info.get('error'):
+        return f"{label} inacessível ({info['error']})"
+    types, max_bytes = MEDIA_LIMITS[(platform, kind)]
+    content_type = info.get('content_type')
+    if content_type and content_type != 'application/octet-stream':
+        accepted = content_type in types if types else content_type.startswith(f'{kind}/')
+        if not accepted:
+            expected = ', '.join(sorted(types)) if types else f'{kind}/*'
+            return f"{label} {content_type} não suportado ({expected})"
+    size = info.get('size')
+    if size and size > max_bytes:
+        return f"{label} com {size / MB:.0f} MB excede o limite de {max_bytes / MB:.0f} MB"
+    return None
+
+
+def preflight_media(jobs: dict, sizes: dict = None) -> dict:
+    """
+    Valida em paralelo os media de {post_id: (post, [plataformas])}: um pedido
+    por URL distinto. Devolve {(post_id, plataforma): erro} só para os media
+    que de certeza falhariam. Se `sizes` for dado, junta-lhe o tamanho em
+    bytes de cada media que o servidor indicou, por (post_id, plataforma).
+    """
+    targets = {}   # (post_id, plataforma) → (tipo, url)
+    for post_id, (post, platforms) in jobs.items():
+        for platform in platforms:
+            media = media_for(post, platform)
+            if media and (platform, media[0]) in MEDIA_LIMITS:
+                targets[(post_id, platform)] = media
+    urls = sorted({url for _, url in targets.values()})
+    if not urls:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(urls)), thread_name_prefix='preflight') as pool:
+        infos = dict(zip(urls, pool.map(tracer.bind(probe_media), urls)))
+
+    problems = {}
+    for (post_id, platform), (kind, url) in targets.items():
+        info = infos.get(url)
+        if sizes is not None and info and info.get('size'):
+            sizes[(post_id, platform)] = info['size']
+        error = check_media(platform, kind, info) if info else None
+        if error:
+            problems[(post_id, platform)] = f"{platform}: {error}"
+    return problems
+
+
+# ── Prazo da run e custo estimado das publicações ─────────────
+
+class JobCostModel:
+    """
+    Custo estimado, em segundos, de publicar um post numa plataforma (da 1.ª
+    chamada até ficar publicado, incluindo o processamento na plataforma).
+
+    Por plataforma, ajusta segundos = base + por_mb × MB por mínimos
+    quadrados às durações de runs anteriores (post_plataformas.duracao_ms e
+    media_bytes) e às desta run, e soma como margem o percentil 90 dos
+    desvios. Com menos de COST_MIN_SAMPLES durações usa DEFAULT_JOB_COSTS.
+    Sem tamanho do media (pré-validação desligada) assume o tamanho mediano.
+    """
+
+    def __init__(self):
+        self._samples = defaultdict(list)   # plataforma → [(segundos, MB ou None)]
+        self._fits    = {}                  # plataforma → (base, por_mb, margem, MB típico)
+        self._lock    = threading.Lock()
+
+    def load(self, limit: int = COST_HISTORY_ROWS):
+        """Lê as durações mais recentes de publicações com sucesso."""
+        try:
+            res = (supabase.table('post_plataformas')
+                   .select('plataforma, duracao_ms, media_bytes')
+                   .eq('status', 'publicado')
+                   .gte('duracao_ms', 0)
+                   .order('atualizado_em', desc=True)
+                   .limit(limit)
+                   .execute())
+            rows = list(res.data or [])
+        except Exception as e:
+            log.warning(f"Erro a ler o histórico de durações: {e} — a usar custos por omissão")
+            return self
+        for row in rows:
+            try:
+                self.observe(row['plataforma'], row['duracao_ms'] / 1000, row.get('media_bytes'))
+            except (KeyError, TypeError):
+                continue
+        return self
+
+    def observe(self, platform: str, seconds: float, size: int = None):
+        with self._lock:
+            self._samples[platform].append((seconds, size / MB if size else None))
+            self._fits.pop(platform, None)
+
+    def estimate(self, platform: str, size: int = None) -> float:
+        with self._lock:
+            fit = self._fits.get(platform)
+            if fit is None:
+                fit = self._fits[platform] = self._fit(platform)
+        base, per_mb, margin, typical_mb = fit
+        mb = size / MB if size else typical_mb
+        return base + per_mb * mb + margin
+
+    def _fit(self, platform: str) -> tuple:
+        base, per_mb = DEFAULT_JOB_COSTS.get(platform, (30, 1.0))
+        samples = self._samples.get(platform, [])
+        sized   = [(secs, mb) for secs, mb in samples if mb is not None]
+        typical = statistics.median(mb for _, mb in sized) if sized else 0.0
+        if len(samples) < COST_MIN_SAMPLES:
+            return base, per_mb, 0.0, typical
+        try:
+            if len(sized) < COST_MIN_SAMPLES:
+                raise statistics.StatisticsError
+            per_mb, base = statistics.linear_regression([mb for _, mb in sized],
+                                                        [secs for secs, _ in sized])
+            per_mb = max(0.0, per_mb)
+        except statistics.StatisticsError:   # sem tamanhos ou todos iguais
+            per_mb = 0.0
+            base   = statistics.median(secs for secs, _ in samples)
+        deviations = [secs - base - per_mb * (typical if mb is None else mb) for secs, mb in samples]
+        margin     = max(0.0, statistics.quantiles(deviations, n=10)[-1])
+        return max(0.0, base), per_mb, margin, typical
+
+
+class RunBudget:
+    """
+    Prazo de uma run de main(): `seconds` a partir de agora (0 = sem prazo).
+
+    publish_posts() só começa uma publicação se fits() — o custo estimado
+    pelo JobCostModel ainda cabe no tempo que resta — e run_cycle() deixa de
+    ler páginas quando nem a publicação mais barata cabe. stop() (SIGTERM ou
+    SIGINT) termina o prazo de imediato. Depois do prazo, as chamadas em
+    curso têm `grace` segundos para acabar; as que não param contam em
+    `stranded` e main() sai com os._exit depois de gravar o estado.
+    """
+
+    def __init__(self, seconds: float = RUN_BUDGET, costs: JobCostModel = None,
+                 grace: float = CHECKPOINT_GRACE):
+        self.seconds     = seconds
+        self.deadline    = time.monotonic() + seconds if seconds > 0 else float('inf')
+        self.costs       = costs or JobCostModel()
+        self.grace       = grace
+        self.stopped     = False   # parado por sinal
+        self.stranded    = 0       # chamadas que não pararam depois do prazo
+        self._expired_at = None
+
+    def stop(self):
+        self.stopped = True
+        if self._expired_at is None:
+            self._expired_at = time.monotonic()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        if self._expired_at is None and time.monotonic() >= self.deadline:
+            self._expired_at = time.monotonic()
+        return self._expired_at is not None
+
+    def abandon(self) -> bool:
+        """O prazo acabou há mais de `grace` segundos: deixar de esperar pelas chamadas em curso."""
+        return self.expired() and time.monotonic() - self._expired_at >= self.grace
+
+    def allows(self, seconds: float) -> bool:
+        """Ainda há `seconds` segundos antes do prazo."""
+        return not self.expired() and self.remaining() >= seconds
+
+    def fits(self, platform: str, size: int = None) -> bool:
+        if platform in RESUMABLE_PLATFORMS:
+            # O upload pára sozinho entre blocos (PostponedPublish) e continua
+            # na próxima run: basta caber o arranque e o primeiro bloco
+            size = YOUTUBE_CHUNK_SIZE if size is None else min(size, YOUTUBE_CHUNK_SIZE)
+        return self.allows(self.costs.estimate(platform, size))
+
+    def can_start(self) -> bool:
+        """Ainda cabe pelo menos a publicação mais barata."""
+        return any(self.fits(platform) for platform in PUBLISHERS)
+
+
+run_budget = None   # RunBudget activo durante main(); None = sem prazo (daemon, testes)
+
+
+# ── Motor de publicação concorrente ───────────────────────────
+
+def retry_delay(attempts: int) -> float:
+    """Espera até à tentativa seguinte: RETRY_QUEUE_BASE a duplicar, com jitter de ±10%."""
+    delay = min(RETRY_QUEUE_MAX, RETRY_QUEUE_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def fail_post(post: dict, error: str, retryable: bool = True):
+    """
+    Post sem nenhuma plataforma com sucesso: volta a 'agendado' com
+    proxima_tentativa_em no futuro, ou passa a 'erro' (dead letter) quando a
+    falha não é recuperável ou já esgotou MAX_ATTEMPTS tentativas.
+    """
+    attempts = (post.get('tentativas') or 0) + 1
+    if not retryable or attempts >= MAX_ATTEMPTS:
+        if retryable:
+            error = f"{error} ({attempts} tentativas)"
+        mark_post(post['id'], 'erro', error, tentativas=attempts, proxima_tentativa_em=None)
+        metrics.inc('posts_total', result='erro')
+        return
+    next_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay(attempts))
+    log.info(f"Post {post['id']}: tentativa {attempts}/{MAX_ATTEMPTS} falhou — "
+             f"nova tentativa às {next_at:%H:%M:%S} UTC")
+    mark_post(post['id'], 'agendado', error,
+              tentativas=attempts, proxima_tentativa_em=next_at.isoformat())
+    metrics.inc('posts_total', result='reagendado')
+
+
+def requeue_post(post: dict, platforms: list):
+    """
+    Post com plataformas por publicar quando a run acabou: volta a 'agendado'
+    sem gastar uma tentativa. As plataformas já publicadas estão em
+    post_plataformas e a próxima run só faz as restantes.
+    """
+    mark_post(post['id'], 'agendado', f"Run terminou antes de publicar em {', '.join(platforms)}")
+    metrics.inc('posts_total', result='adiado')
+
+
+def finish_post(post: dict, success_platforms: list, retryable: bool = True,
+                error: str = 'Sem plataformas com sucesso') -> tuple:
+    """Marca o post conforme o resultado. Devolve (publicados, erros) a somar."""
+    if success_platforms:
+        mark_post(post['id'], 'publicado')
+        metrics.inc('posts_total', result='publicado')
+        return 1, 0
+    if post.get('plataformas'):  # só marca erro se havia plataformas para publicar
+        fail_post(post, error, retryable)
+        return 0, 1
+    if CLAIM_MODE:
+        mark_post(post['id'], 'agendado')   # devolve à fila, como sem reservas
+    return 0, 0
+
+
+def run_in_context(platform: str, fn, *args, rate_scope: str = None):
+    """
+    Corre fn(*args) com a plataforma registada para o circuit breaker e o rate limiter.
+    rate_scope escolhe outro bucket de RATE_LIMITS (endpoint com limite próprio).
+    _publish_context.failure fica com a última falha (motivo, permanente) da chamada.
+    """
+    _publish_context.platform   = platform
+    _publish_context.rate_scope = rate_scope
+    _publish_context.failure    = None
+    try:
+        return fn(*args)
+    finally:
+        _publish_context.platform   = None
+        _publish_context.rate_scope = None
+
+
+def run_traced(name: str, parent, platform: str, fn, *args):
+    """
+    run_in_context num span `name` filho de `parent` (o span do post). Um
+    resultado falso passa a PublishFailure, com a última falha da chamada.
+    """
+    with tracer.span(name, parent, {'platform': platform}) as span:
+        result = run_in_context(platform, fn, *args)
+        if isinstance(result, PendingPublish):
+            span.set('publish.pending', result.key)
+        elif isinstance(result, PostponedPublish):
+            span.set('publish.postponed', result.reason)
+        elif not result:
+            reason, permanent = _publish_context.failure or ('Sem sucesso', False)
+            span.fail(reason)
+            result = PublishFailure(platform, reason, permanent)
+        return result
+
+
+def run_publisher(platform: str, post: dict, parent=None):
+    """Corre PUBLISHERS[platform](post) no contexto da plataforma."""
+    return run_traced(f'publish {platform}', parent, platform, PUBLISHERS[platform], post)
+
+
+def poll_pending(awaiting: list) -> tuple:
+    """
+    Consulta em lote os (PendingPublish, post) em `awaiting`: uma chamada a
+    `poll` por função. Devolve (prontos, falhados, à espera); os falhados são
+    (pending, post, erro), incluindo os que passaram do prazo.
+    """
+    groups = defaultdict(list)
+    for item in awaiting:
+        groups[item[0].poll].append(item)
+
+    ready, failed, waiting = [], [], []
+    now = time.monotonic()
+    for poll, items in groups.items():
+        platform = items[0][0].platform
+        try:
+            with tracer.span(f'poll {platform}', attributes={'publish.pending': len(items)}):
+                states = run_in_context(platform, poll, [p.key for p, _ in items])
+        except Exception as e:
+            log.warning(f"Erro a consultar {len(items)} publicações pendentes: {e}")
+            states = {}
+        for pending, post in items:
+            state = states.get(pending.key)
+            if state is True:
+                ready.append((pending, post))
+            elif state:
+                failed.append((pending, post, state))
+            elif now >= pending.deadline:
+                failed.append((pending, post, 'Tempo de processamento esgotado'))
+            else:
+                waiting.append((pending, post))
+    return ready, failed, waiting
+
+
+def publish_posts(posts: list) -> tuple:
+    """
+    Publica os posts em paralelo, com uma chamada por (post, plataforma).
+
+    No máximo MAX_WORKERS chamadas correm ao mesmo tempo e no máximo
+    PLATFORM_LIMITS[plataforma] por plataforma, para que um upload lento do
+    YouTube não bloqueie o Instagram, TikTok e Facebook. Plataformas com o
+    circuit breaker aberto são saltadas (contam como falha). Plataformas já
+    publicadas numa run anterior (post_plataformas) contam como sucesso sem
+    nova chamada. Um publisher pode devolver um PendingPublish (ex.: Reels
+    em processamento): o worker fica livre, os pendentes são consultados em
+    lote e, quando ficam prontos, completados antes das novas chamadas da
+    plataforma, com o mesmo limite e circuit breaker que a primeira chamada
+    (do prazo da run basta caber esse último pedido). Cada post é marcado assim
+    que todas as suas plataformas terminam; se todas falharam de forma
+    permanente (PublishFailure), vai logo para 'erro' sem nova tentativa.
+    Devolve (publicados, erros).
+
+    Cada post tem um span filho do span activo (a run), com um span por
+    chamada ao publisher e outro por espera de processamento na plataforma.
+
+    Com um run_budget, cada chamada só começa se o custo estimado couber no
+    prazo; as que não cabem, as que param sozinhas (PostponedPublish) e as
+    que esperavam processamento no fim do prazo ficam adiadas, e o post volta
+    a 'agendado' (requeue_post). Depois do prazo (ou de um sinal) as chamadas
+    em curso têm CHECKPOINT_GRACE segundos; se uma não parar, o seu post não
+    é tocado — fica com o lease até expirar, porque a chamada ainda pode
+    publicar — e conta em run_budget.stranded.
+    """
+    totals    = {'published': 0, 'errors': 0}
+    queues    = {platform: deque() for platform in PUBLISHERS}
+    pending   = {}   # post_id → nº de plataformas por terminar
+    successes = {}   # post_id → plataformas com sucesso
+    failures  = defaultdict(list)   # post_id → [(plataforma, motivo, permanente)]
+    postponed = defaultdict(list)   # post_id → plataformas para a próxima run
+    stranded  = set()               # post_id com chamadas que não pararam no fim do prazo
+    spans     = {}   # post_id → span do post
+    waits     = {}   # (post_id, plataforma) → span da espera por processamento
+    sizes     = {}   # (post_id, plataforma) → bytes do media (pré-validação)
+    started   = {}   # (post_id, plataforma) → time.monotonic() da 1.ª chamada
+
+    def finish(post, retryable=True, **kw):
+        if post['id'] in stranded:
+            postponed.pop(post['id'], None)
+            log.warning(f"Post {post['id']}: chamada em curso no fim do prazo — o post fica como está"
+                        + (" até o lease expirar" if CLAIM_MODE else ""))
+            metrics.inc('posts_total', result='interrompido')
+            span = spans.pop(post['id'], None)
+            if span:
+                span.set('post.result', 'interrompido')
+                span.end()
+            return
+        if postponed.get(post['id']):
+            requeue_post(post, postponed.pop(post['id']))
+            span = spans.pop(post['id'], None)
+            if span:
+                span.set('post.result', 'adiado')
+                span.end()
+            return
+        failed = failures.get(post['id'])
+        if retryable and failed and all(permanent for _, _, permanent in failed):
+            # Só falhas permanentes: repetir noutra run daria o mesmo resultado
+            retryable = False
+            kw.setdefault('error', '; '.join(f'{platform}: {reason}' for platform, reason, _ in failed))
+        p, e = finish_post(post, successes.get(post['id'], []), retryable, **kw)
+        totals['published'] += p
+        totals['errors']    += e
+        span = spans.pop(post['id'], None)
+        if span:
+            span.set('post.result', 'publicado' if p else 'erro' if e else 'ignorado')
+            if e:
+                span.fail(kw.get('error') or 'Sem plataformas com sucesso')
+            span.end()
+
+    def end_wait(post, platform, error=None):
+        span = waits.pop((post['id'], platform), None)
+        if span:
+            if error:
+                span.fail(str(error))
+            span.end()
+
+    def platform_done(post, platform, ok, error=None, permanent=False):
+        key      = (post['id'], platform)
+        duration = time.monotonic() - started.pop(key) if key in started else None
+        mark_platform(post['id'], platform, 'publicado' if ok else 'erro', error,
+                      duration=duration, media_bytes=sizes.get(key))
+        metrics.inc('platform_results_total', platform=platform, result='success' if ok else 'failure')
+        spans[post['id']].set(f'platform.{platform}', 'publicado' if ok else 'erro')
+        if not ok:
+            failures[post['id']].append((platform, str(error or 'Sem sucesso'), permanent))
+        if ok:
+            successes[post['id']].append(platform)
+            if duration is not None and run_budget:
+                run_budget.costs.observe(platform, duration, sizes.get(key))
+        pending[post['id']] -= 1
+        if pending[post['id']] == 0:
+            finish(post)
+
+    def postpone(post, platform, stranded_call=False):
+        """
+        A plataforma fica para a próxima run: sem tempo, parou sozinha ou
+        esperava processamento no fim do prazo. Com `stranded_call`, a
+        chamada continua a correr e o post não pode ser marcado nem devolvido.
+        """
+        started.pop((post['id'], platform), None)
+        if stranded_call:
+            stranded.add(post['id'])
+            run_budget.stranded += 1
+        spans[post['id']].set(f'platform.{platform}', 'interrompido' if stranded_call else 'adiado')
+        metrics.inc('platform_results_total', platform=platform,
+                    result='stranded' if stranded_call else 'postponed')
+        postponed[post['id']].append(platform)
+        pending[post['id']] -= 1
+        if pending[post['id']] == 0:
+            finish(post)
+
+    already = published_platforms([post['id'] for post in posts])
+
+    jobs_by_post = {}   # post_id → (post, plataformas a publicar)
     for post in posts:
         post_id   = post['id']
         platforms = post.get('plataformas') or []
         log.info(f"Post {post_id}: plataformas={platforms}")
+        spans[post_id] = tracer.start_span('post', attributes={
+            'post.id':         post_id,
+            'post.platforms':  platforms,
+            'post.attempt':    (post.get('tentativas') or 0) + 1,
+        })
 
-        if DRY_RUN:
-            log.info(f"  [DRY RUN] Não publicado: {post.get('legenda', '')[:60]}…")
-            continue
-
-        success_platforms = []
+        jobs = []
+        successes[post_id] = []
         for platform in platforms:
-            publisher = PUBLISHERS.get(platform)
-            if not publisher:
+            if platform in already.get(post_id, ()):
+                log.info(f"Post {post_id}: {platform} já publicado — a saltar")
+                successes[post_id].append(platform)
+                continue
+            if platform not in PUBLISHERS:
                 log.warning(f"Plataforma '{platform}' não suportada")
                 continue
+            jobs.append(platform)
+        jobs_by_post[post_id] = (post, jobs)
+
+    # Media partidos ou fora dos limites falham já, sem chegar aos publishers
+    with metrics.phase('preflight'), tracer.child('preflight'):
+        problems = preflight_media(jobs_by_post, sizes) if PREFLIGHT else {}
+
+    for post_id, (post, jobs) in jobs_by_post.items():
+        errors = []
+        for platform in list(jobs):
+            error = problems.get((post_id, platform))
+            if error:
+                log.error(f"Post {post_id}: {error}")
+                mark_platform(post_id, platform, 'erro', error)
+                jobs.remove(platform)
+                errors.append(error)
+
+        if not jobs:
+            # já publicado, nenhuma plataforma suportada ou media inválidos
+            if errors:
+                finish(post, retryable=False, error='; '.join(errors))
+            else:
+                finish(post, retryable=False)
+            continue
+
+        pending[post_id] = len(jobs)
+        for platform in jobs:
+            queues[platform].append(post)
+
+    running   = {}          # future → (platform, post)
+    inflight  = Counter()   # platform → chamadas em curso
+    awaiting  = []          # (PendingPublish, post) em processamento na plataforma
+    ready     = {platform: deque() for platform in PUBLISHERS}   # (PendingPublish, post) prontos a completar
+    next_poll = 0.0
+    abandoned = False       # chamadas deixadas a correr no fim do prazo
+
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='publish')
+    try:
+        with metrics.phase('publish'):
+            while running or awaiting or any(queues.values()) or any(ready.values()):
+                if run_budget and run_budget.abandon():
+                    for platform, post in running.values():
+                        log.warning(f"Post {post['id']}: {platform} não parou até ao fim do prazo")
+                        postpone(post, platform, stranded_call=True)
+                    # Nada corre para os pendentes (ex.: container por publicar): retomam na próxima run
+                    for deferred, post in awaiting:
+                        end_wait(post, deferred.platform, 'Fim do prazo da run')
+                        postpone(post, deferred.platform)
+                    abandoned = abandoned or bool(running)
+                    running, awaiting = {}, []
+                    inflight.clear()   # o que resta nas filas é adiado já a seguir
+
+                if awaiting and time.monotonic() >= next_poll:
+                    done_waiting, failed, awaiting = poll_pending(awaiting)
+                    for deferred, post in done_waiting:
+                        end_wait(post, deferred.platform)
+                        ready[deferred.platform].append((deferred, post))
+                    for deferred, post, error in failed:
+                        log.error(f"Post {post['id']}: {deferred.platform} {deferred.key} — {error}")
+                        end_wait(post, deferred.platform, error)
+                        platform_done(post, deferred.platform, False, error)
+                    if awaiting:
+                        next_poll = time.monotonic() + min(d.interval for d, _ in awaiting)
+
+                for platform, queue in queues.items():
+                    limit       = PLATFORM_LIMITS.get(platform, MAX_WORKERS)
+                    breaker     = breakers.get(platform)
+                    completions = ready[platform]
+                    # Completar (ex.: media_publish) passa à frente de novas publicações,
+                    # mas com os mesmos limites, circuit breaker e prazo da run
+                    while (completions or queue) and len(running) < MAX_WORKERS and inflight[platform] < limit:
+                        deferred, post = completions.popleft() if completions else (None, queue.popleft())
+                        key = (post['id'], platform)
+                        if breaker and breaker.is_open:
+                            log.warning(f"Post {post['id']}: {platform} com circuito aberto — a saltar")
+                            platform_done(post, platform, False, 'Circuito aberto')
+                            continue
+                        # Completar é um só pedido (ex.: media_publish): basta caber esse pedido,
+                        # não o custo da publicação inteira — adiar deitava fora o container
+                        if run_budget and not (run_budget.allows(HTTP_TIMEOUT[1]) if deferred
+                                               else run_budget.fits(platform, sizes.get(key))):
+                            log.info(f"Post {post['id']}: {platform} fica para a próxima run (prazo da run)")
+                            postpone(post, platform)
+                            continue
+                        if deferred:
+                            future = pool.submit(run_traced, f'complete {platform}', spans[post['id']],
+                                                 platform, deferred.complete)
+                        else:
+                            started[key] = time.monotonic()
+                            future = pool.submit(run_publisher, platform, post, spans[post['id']])
+                        running[future] = (platform, post)
+                        inflight[platform] += 1
+
+                timeout = max(0.0, next_poll - time.monotonic()) if awaiting else None
+                if run_budget:
+                    # acordar a tempo do prazo e de um SIGTERM/SIGINT
+                    timeout = 1.0 if timeout is None else min(timeout, 1.0)
+                if not running:
+                    if awaiting:
+                        time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    platform, post = running.pop(future)
+                    inflight[platform] -= 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        log.error(f"Erro a publicar em {platform}: {e}")
+                        totals['errors'] += 1
+                        result = PublishFailure(platform, str(e), RetryPolicy.permanent_error(e))
+                    if isinstance(result, PostponedPublish):
+                        log.info(f"Post {post['id']}: {platform} adiado ({result.reason})")
+                        postpone(post, platform)
+                        continue
+                    if isinstance(result, PendingPublish):
+                        if not awaiting:
+                            next_poll = time.monotonic() + result.interval
+                        awaiting.append((result, post))
+                        waits[(post['id'], platform)] = tracer.start_span(
+                            f'{platform} processing', spans[post['id']], {'publish.pending': result.key})
+                        continue
+                    if isinstance(result, PublishFailure):
+                        platform_done(post, platform, False, result.reason, result.permanent)
+                        continue
+                    platform_done(post, platform, bool(result))
+    finally:
+        # Chamadas que não pararam: não se espera por elas aqui; main() grava o
+        # estado e sai com os._exit, porque o interpretador esperaria pelas threads
+        pool.shutdown(wait=not abandoned, cancel_futures=True)
+
+    return totals['published'], totals['errors']
+
+
+# ── Main ──────────────────────────────────────────────────────
+
+def _stop_on_signal(signum, frame):
+    # 1.º SIGTERM/SIGINT (cancelamento ou timeout do workflow) durante a
+    # publicação: acaba o prazo da run — nada novo começa e o estado das
+    # chamadas em curso é gravado. Fora dela, ou ao 2.º sinal, SystemExit
+    # para que os blocos finally corram e o buffer seja gravado.
+    if run_budget is None or run_budget.stopped:
+        raise SystemExit(128 + signum)
+    log.warning(f"Sinal {signum} recebido — a gravar o estado da run e a terminar")
+    run_budget.stop()
+
+
+def run_cycle(pages) -> tuple:
+    """Publica (ou, em DRY_RUN, lista) as páginas de posts. Devolve (publicados, erros, lidos)."""
+    published = 0
+    errors    = 0
+    fetched   = 0
+    pages     = iter(pages)
+    while True:
+        if run_budget and not run_budget.can_start():
+            log.warning("Prazo da run: sem tempo para mais publicações — "
+                        "restantes posts ficam para a próxima run")
+            break
+        with metrics.phase('fetch'), tracer.child('supabase fetch posts') as span:
+            posts = next(pages, None)
+            if span:
+                span.set('posts', len(posts or []))
+        if posts is None:
+            break
+        posts    = schedule_posts(posts)
+        now      = datetime.now(timezone.utc)
+        fetched += len(posts)
+        for post in posts:
+            metrics.inc('posts_scheduled_total', slot='a_tempo' if is_on_time(post, now) else 'atraso')
+        log.info(f"Posts para publicar: {len(posts)}" + (" [DRY RUN]" if DRY_RUN else ""))
+        if DRY_RUN:
+            for post in posts:
+                log.info(f"Post {post['id']}: plataformas={post.get('plataformas') or []}")
+                log.info(f"  [DRY RUN] Não publicado: {post.get('legenda', '')[:60]}…")
+            continue
+        p, e = publish_posts(posts)
+        published += p
+        errors    += e
+    return published, errors, fetched
+
+
+def start_tiktok_tracker():
+    return TikTokStatusTracker().start() if TIKTOK_TOKEN and not DRY_RUN else None
+
+
+def stop_tiktok_tracker(timeout: float = TIKTOK_STATUS_WAIT):
+    global tiktok_tracker
+    if tiktok_tracker:
+        tracker, tiktok_tracker = tiktok_tracker, None
+        tracker.close(timeout)
+
+
+def export_metrics():
+    """Escreve publish.prom e publish.json em METRICS_DIR (se definido)."""
+    try:
+        paths = metrics.export()
+    except OSError as e:
+        log.warning(f"Erro a exportar métricas: {e}")
+        return
+    if paths:
+        log.info(f"Métricas exportadas: {', '.join(paths)}")
+
+
+def close_writers(tracker_timeout: float = TIKTOK_STATUS_WAIT):
+    """Pára o TikTokStatusTracker e grava o que estiver no WriteBuffer."""
+    global write_buffer
+    try:
+        with metrics.phase('tiktok_status'), tracer.child('tiktok status'):
+            stop_tiktok_tracker(tracker_timeout)
+    finally:
+        # Mesmo com um sinal a meio da espera pelo TikTok, o buffer é gravado
+        if write_buffer:
+            buffer, write_buffer = write_buffer, None
+            with metrics.phase('flush'), tracer.child('supabase flush'):
+                buffer.close()
+
+
+def export_trace():
+    """Acrescenta os spans da run a TRACE_FILE (se definido)."""
+    try:
+        path = tracer.export()
+    except OSError as e:
+        log.warning(f"Erro a exportar trace: {e}")
+        return
+    if path:
+        log.info(f"Trace exportado: {path}")
+
+
+def main():
+    """
+    Uma run: publica os posts em atraso dentro de PUBLISH_RUN_BUDGET segundos
+    (RunBudget) e grava o estado no fim, também em SIGTERM/SIGINT.
+    """
+    global write_buffer, tiktok_tracker, run_budget
+
+    costs      = JobCostModel() if DRY_RUN else JobCostModel().load()
+    run_budget = RunBudget(RUN_BUDGET, costs, CHECKPOINT_GRACE)
+    previous_handlers = {sig: signal.signal(sig, _stop_on_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+    write_buffer   = None if DRY_RUN else WriteBuffer().start()
+    tiktok_tracker = start_tiktok_tracker()
+    try:
+        with tracer.span('publish run', attributes={'worker.id': WORKER_ID, 'dry_run': DRY_RUN},
+                         root=True) as run_span:
+            try:
+                published, errors, fetched = run_cycle(due_post_pages())
+                run_span.set('posts.fetched', fetched)
+                run_span.set('posts.published', published)
+                run_span.set('posts.errors', errors)
+            finally:
+                # Depois de um sinal não se espera pelo TikTok: o runner mata o job em segundos
+                budget, run_budget = run_budget, None
+                close_writers(0 if budget.stopped else TIKTOK_STATUS_WAIT)
+    finally:
+        run_budget = None
+        export_metrics()
+        export_trace()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+    log.info(f"Resultado: {published} publicados, {errors} erros")
+    code = 1 if errors > 0 and published == 0 else 0
+    if budget.stranded:
+        # O estado já está gravado; sair sem esperar pelas threads impede que uma
+        # chamada abandonada publique depois, sem registo
+        log.warning(f"{budget.stranded} chamadas não pararam no fim do prazo — a sair sem esperar por elas")
+        logging.shutdown()
+        os._exit(code)
+    sys.exit(code)
+
+
+class PostsChangeFeed:
+    """
+    LISTEN no canal NOTIFY_CHANNEL (trigger posts_notify_agendados em posts).
+
+    wait() dorme até chegar uma notificação, acabar o timeout ou `stop` ser
+    activado. Se o psycopg2 não estiver instalado ou a ligação falhar, wait()
+    limita-se a dormir (polling) e tenta voltar a ligar a cada
+    LISTEN_RETRY_SECONDS.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn       = dsn
+        self.conn      = None
+        self._retry_at = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.conn is not None
+
+    def connect(self) -> bool:
+        self._retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+        try:
+            import psycopg2
+            import psycopg2.extensions
+        except ImportError:
+            log.warning("psycopg2 não instalado — daemon sem LISTEN, só polling")
+            self._retry_at = float('inf')
+            return False
+        try:
+            conn = psycopg2.connect(self.dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+        except Exception as e:
+            log.warning(f"LISTEN {NOTIFY_CHANNEL} indisponível ({e}) — a usar polling")
+            return False
+        self.conn = conn
+        log.info(f"LISTEN {NOTIFY_CHANNEL} activo")
+        return True
+
+    def close(self):
+        if self.conn is not None:
             try:
-                ok = publisher(post)
-                if ok:
-                    success_platforms.append(platform)
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+    def wait(self, timeout: float, stop: threading.Event) -> bool:
+        """Devolve True se acordou por uma notificação."""
+        if self.conn is None and (time.monotonic() < self._retry_at or not self.connect()):
+            stop.wait(timeout)
+            return False
+
+        deadline = time.monotonic() + timeout
+        while not stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                # Fatias curtas para reagir a `stop` (o select é retomado após sinais)
+                ready, _, _ = select.select([self.conn], [], [], min(remaining, 1.0))
+                if not ready:
+                    continue
+                self.conn.poll()
+                if self.conn.notifies:
+                    log.info(f"Notificação: {self.conn.notifies[-1].payload}")
+                    self.conn.notifies.clear()
+                    return True
             except Exception as e:
-                log.error(f"Erro a publicar em {platform}: {e}")
-                errors += 1
+                log.warning(f"LISTEN {NOTIFY_CHANNEL} perdido ({e}) — a usar polling")
+                self.close()
+                self._retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+                stop.wait(max(0.0, deadline - time.monotonic()))
+                return False
+        return False
 
-        if success_platforms:
-            mark_post(post_id, 'publicado')
-            published += 1
-        else:
-            if platforms:  # só marca erro se havia plataformas para publicar
-                mark_post(post_id, 'erro', 'Sem plataformas com sucesso')
-                errors += 1
 
-    log.info(f"Resultado: {published} publicados, {errors} erros")
-    sys.exit(1 if errors > 0 and published == 0 else 0)
+def run_daemon(poll_interval: float = DAEMON_POLL_SECONDS):
+    """
+    Modo daemon: publica o que estiver em atraso e dorme até ao próximo
+    agendado_para (no máximo `poll_interval` segundos), em ciclo.
+
+    Com SUPABASE_DB_URL, acorda também por LISTEN/NOTIFY quando um post é
+    agendado ou reagendado; enquanto o LISTEN estiver activo o poll de
+    segurança passa a LISTEN_POLL_SECONDS.
+
+    SIGTERM/SIGINT pedem paragem: o ciclo em curso termina, os resultados em
+    buffer são gravados e o processo sai. Um segundo sinal sai de imediato.
+    """
+    global write_buffer, tiktok_tracker
+
+    stop = threading.Event()
+    feed = PostsChangeFeed(SUPABASE_DB_URL) if SUPABASE_DB_URL else None
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise SystemExit(128 + signum)
+        log.info("Sinal recebido — a terminar depois do ciclo em curso")
+        stop.set()
+
+    previous_handlers = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    write_buffer   = None if DRY_RUN else WriteBuffer().start()
+    tiktok_tracker = start_tiktok_tracker()
+    log.info(f"Daemon iniciado (worker {WORKER_ID}, espera máxima {poll_interval:.0f}s)"
+             + (" [DRY RUN]" if DRY_RUN else ""))
+    try:
+        if feed:
+            feed.connect()
+        while not stop.is_set():
+            try:
+                with tracer.span('publish cycle', attributes={'worker.id': WORKER_ID}, root=True) as cycle_span:
+                    published, errors, fetched = run_cycle(due_post_pages())
+                    if write_buffer:
+                        # Gravar já: o próximo ciclo não pode voltar a ver estes posts como agendados
+                        with metrics.phase('flush'), tracer.span('supabase flush'):
+                            write_buffer.flush()
+                    cycle_span.set('posts.fetched', fetched)
+                if fetched:
+                    export_metrics()
+                    export_trace()
+                    log.info(f"Ciclo: {published} publicados, {errors} erros")
+                else:
+                    tracer.discard()   # ciclos vazios não enchem o TRACE_FILE
+            except Exception as e:
+                log.error(f"Daemon: erro no ciclo de publicação: {e}")
+                export_trace()
+                published = errors = fetched = 0
+
+            if stop.is_set():
+                break
+            if fetched >= DUE_POSTS_LIMIT and published + errors and not DRY_RUN:
+                # Página cheia e a fila andou — ainda há posts em atraso. Posts que
+                # ficam 'agendado' (ex.: sem plataformas) voltariam na mesma página
+                continue
+            if feed:
+                max_wait = LISTEN_POLL_SECONDS if feed.connected else poll_interval
+                feed.wait(seconds_until_next_due(max_wait), stop)
+            else:
+                stop.wait(seconds_until_next_due(poll_interval))
+    finally:
+        if feed:
+            feed.close()
+        close_writers(tracker_timeout=0)   # TikTok pendentes retomados no próximo arranque
+        export_metrics()
+        export_trace()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    log.info("Daemon terminado")
+
+
+def import_report(top: int = 15) -> int:
+    """
+    Mede o arranque a frio: importa publish.py num processo novo com
+    `python -X importtime` e mostra o tempo total e os imports directos mais
+    lentos. Devolve o código de saída.
+    """
+    import subprocess
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [script_dir, os.environ.get('PYTHONPATH')])))
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import publish'],
+                         env=env, capture_output=True, text=True)
+    if res.returncode:
+        print(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else 'import falhou', file=sys.stderr)
+        return res.returncode
+
+    # A saída está em pós-ordem: os imports de publish aparecem antes dele,
+    # depois do último módulo de nível 0 (arranque do interpretador)
+    total, modules, direct = None, 0, []
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        name  = name.strip()
+        if level == 0:
+            if name == 'publish':
+                total = int(cumulative)
+                break
+            modules, direct = 0, []
+            continue
+        modules += 1
+        if level == 1:
+            direct.append((int(cumulative), int(own), name))
+
+    if total is None:
+        print("publish não encontrado na saída de -X importtime", file=sys.stderr)
+        return 1
+    print(f"publish.py importado em {total / 1000:.1f} ms ({modules} módulos carregados)")
+    print(f"{'cumulativo':>12} {'próprio':>10}  módulo")
+    for cumulative, own, name in sorted(direct, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>9.1f} ms {own / 1000:>7.1f} ms  {name}")
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Publica os posts agendados nas redes sociais")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Corre continuamente, acordando no próximo post agendado")
+    parser.add_argument("--poll-interval", type=float, default=DAEMON_POLL_SECONDS,
+                        help="Espera máxima entre consultas no modo daemon (segundos)")
+    parser.add_argument("--import-report", action="store_true",
+                        help="Mostra o tempo de import do script e dos módulos mais lentos")
+    args = parser.parse_args()
+    if args.import_report:
+        sys.exit(import_report())
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        log.error("SUPABASE_URL e SUPABASE_KEY são obrigatórios.")
+        sys.exit(1)
+    if args.daemon:
+        run_daemon(args.poll_interval)
+    else:
+        main()
@@ -28,6 +28,8 @@ Environment variables (GitHub Secrets):
                                  conta Stripe principal para payout diário
   STRIPE_MIN_PAYOUT_CENTS     — (opcional) Montante mínimo em cêntimos para
                                  activar payout automático (default: 1000 = €10)
+  METRICS_DIR                 — (opcional) directório para stripe_payout.prom/.json
+                                 com latências, contadores e tempo por fase
 
 Usage:
   python scripts/stripe_payout.py [--dry-run]
@@ -46,6 +48,8 @@ import urllib.parse
 import urllib.error
 from datetime import datetime, timezone
 
+from telemetry import Metrics
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -53,9 +57,28 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+metrics = Metrics("stripe_payout")
+
 
 # ── HTTP helpers ───────────────────────────────────────────────────────────────
 
+def _urlopen_json(req, service, path):
+    """urlopen + JSON decode, recording latency and status in the run metrics."""
+    labels  = {"service": service, "endpoint": path.split("?")[0].strip("/")}
+    started = time.monotonic()
+    status  = "error"
+    try:
+        with urllib.request.urlopen(req) as resp:
+            status = resp.status
+            return json.loads(resp.read().decode())
+    except urllib.error.HTTPError as e:
+        status = e.code
+        raise
+    finally:
+        metrics.observe("http_request_duration_seconds", time.monotonic() - started, **labels)
+        metrics.inc("http_requests_total", status=str(status), **labels)
+
+
 def _supabase_request(method, path, body=None, *, url, key):
     """Make a Supabase REST request."""
     full_url = f"{url.rstrip('/')}/rest/v1/{path.lstrip('/')}"
@@ -68,8 +91,7 @@ def _supabase_request(method, path, body=None, *, url, key):
     data = json.dumps(body).encode() if body else None
     req  = urllib.request.Request(full_url, data=data, headers=headers, method=method)
     try:
-        with urllib.request.urlopen(req) as resp:
-            return json.loads(resp.read().decode())
+        return _urlopen_json(req, "supabase", path)
     except urllib.error.HTTPError as e:
         body_text = e.read().decode()
         raise RuntimeError(f"Supabase {method} {path} → {e.code}: {body_text}") from e
@@ -88,8 +110,7 @@ def _stripe_request(method, path, body=None, stripe_account=None, *, key):
     data = urllib.parse.urlencode(body).encode() if body else None
     req  = urllib.request.Request(full_url, data=data, headers=headers, method=method)
     try:
-        with urllib.request.urlopen(req) as resp:
-            return json.loads(resp.read().decode())
+        return _urlopen_json(req, "stripe", path)
     except urllib.error.HTTPError as e:
         body_text = e.read().decode()
         raise RuntimeError(f"Stripe {method} {path} → {e.code}: {body_text}") from e
@@ -266,9 +287,11 @@ def auto_collect_all(min_cents, supabase_url, supabase_key, stripe_key, dry_run=
             try:
                 lev_id = create_levantamento(conta, amount, currency, supabase_url, supabase_key)
                 log.info("    ✓ Levantamento criado: %s", lev_id)
+                metrics.inc("levantamentos_created_total", currency=currency)
                 created += 1
             except Exception as e:
                 log.error("    ✗ Erro ao criar levantamento para %s: %s", titular, e)
+                metrics.inc("levantamentos_failed_total")
 
     log.info("Fase 1 concluída: %d levantamento(s) criado(s).", created)
 
@@ -331,6 +354,9 @@ def process_pending(supabase_url, supabase_key, stripe_key, dry_run=False):
                         supabase_url=supabase_url, supabase_key=supabase_key,
                     )
                 log.info("  ✓ %s → pago (%s)", lev_id, payout_id)
+                metrics.inc("payouts_total", result="paid")
+                metrics.inc("payout_amount_cents_total", lev.get("montante") or 0,
+                            currency=(lev.get("moeda") or "eur").lower())
                 success_count += 1
             else:
                 if not dry_run:
@@ -339,9 +365,11 @@ def process_pending(supabase_url, supabase_key, stripe_key, dry_run=False):
                         supabase_url=supabase_url, supabase_key=supabase_key,
                     )
                 log.warning("  ⚠ %s saltado: %s", lev_id, err)
+                metrics.inc("payouts_total", result="manual")
                 fail_count += 1
         except Exception as exc:
             log.error("  ✗ %s falhou: %s", lev_id, exc)
+            metrics.inc("payouts_total", result="failed")
             if not dry_run:
                 try:
                     update_levantamento_status(
@@ -397,8 +425,11 @@ def payout_platform_account(main_bank_account_id, min_cents, stripe_key, dry_run
         try:
             payout_id, status = create_stripe_payout(amount, currency, desc, stripe_key)
             log.info("  ✓ Payout principal criado: %s (status: %s)", payout_id, status)
+            metrics.inc("platform_payouts_total", result="paid")
+            metrics.inc("platform_payout_amount_cents_total", amount, currency=currency)
         except Exception as e:
             log.error("  ✗ Erro ao criar payout principal: %s", e)
+            metrics.inc("platform_payouts_total", result="failed")
 
 
 # ── Entry point ────────────────────────────────────────────────────────────────
@@ -421,17 +452,28 @@ def run(dry_run=False):
              "(DRY RUN)" if dry_run else "")
     log.info("Limiar mínimo: %s cêntimos (%.2f EUR)", min_cents, min_cents / 100)
 
-    # Fase 1: auto-criar levantamentos para contas com payout automático
-    auto_collect_all(min_cents, supabase_url, supabase_key, stripe_key, dry_run=dry_run)
-
-    # Fase 2: processar todos os levantamentos pendentes (auto + manuais)
-    success, failed = process_pending(supabase_url, supabase_key, stripe_key, dry_run=dry_run)
-
-    # Fase 3: payout da conta Stripe principal para a conta bancária do titular
-    if main_bank_acct:
-        payout_platform_account(main_bank_acct, min_cents, stripe_key, dry_run=dry_run)
-    else:
-        log.info("── Fase 3: STRIPE_MAIN_BANK_ACCOUNT_ID não definido — a saltar payout principal.")
+    try:
+        # Fase 1: auto-criar levantamentos para contas com payout automático
+        with metrics.phase("auto_collect"):
+            auto_collect_all(min_cents, supabase_url, supabase_key, stripe_key, dry_run=dry_run)
+
+        # Fase 2: processar todos os levantamentos pendentes (auto + manuais)
+        with metrics.phase("pending"):
+            success, failed = process_pending(supabase_url, supabase_key, stripe_key, dry_run=dry_run)
+
+        # Fase 3: payout da conta Stripe principal para a conta bancária do titular
+        if main_bank_acct:
+            with metrics.phase("platform"):
+                payout_platform_account(main_bank_acct, min_cents, stripe_key, dry_run=dry_run)
+        else:
+            log.info("── Fase 3: STRIPE_MAIN_BANK_ACCOUNT_ID não definido — a saltar payout principal.")
+    finally:
+        try:
+            paths = metrics.export()
+            if paths:
+                log.info("Métricas exportadas: %s", ", ".join(paths))
+        except OSError as e:
+            log.warning("Erro a exportar métricas: %s", e)
 
     log.info("=== Concluído: %d pago(s), %d falhado(s) ===", success, failed)
     if failed > 0:
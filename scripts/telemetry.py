@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+telemetry.py — Métricas e traces de uma run dos scripts (publish.py, stripe_payout.py)
+
+Contadores, histogramas de latência e tempo gasto em cada fase, exportados
+no fim da run em dois formatos:
+
+  <METRICS_DIR>/<job>.prom  — textfile Prometheus (node_exporter textfile collector)
+  <METRICS_DIR>/<job>.json  — artefacto JSON (ex.: actions/upload-artifact)
+
+Spans (Tracer) exportados para TRACE_FILE em OTLP/JSON, uma linha por
+export (o formato do fileexporter do OpenTelemetry Collector), prontos a
+abrir num visualizador de traces (Jaeger, otel-desktop-viewer…).
+
+Uso:
+  metrics = Metrics('publish')
+  metrics.inc('posts_total', result='publicado')
+  metrics.observe('http_request_duration_seconds', 0.42, platform='tiktok', endpoint='…')
+  with metrics.phase('fetch'):
+      ...
+  metrics.export()
+
+  tracer = Tracer('publish')
+  with tracer.span('post', attributes={'post.id': post_id}) as span:
+      span.set('bytes', n)
+  tracer.export()
+
+Variáveis de ambiente:
+  METRICS_DIR — directório de saída; sem ela, export() não escreve nada
+  TRACE_FILE  — ficheiro de traces; sem ela, os spans não são guardados
+
+Só usa a biblioteca standard (o stripe_payout.py não tem dependências).
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# Limites (segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def endpoint_label(url: str, api_hosts=()) -> str:
+    """
+    Label de baixa cardinalidade para um URL: host + caminho com os IDs
+    trocados por ':id' nos hosts de API conhecidos; 'media' nos restantes
+    (CDNs e storage, cujos caminhos são nomes de ficheiros).
+    """
+    parts = urlsplit(url)
+    if parts.hostname not in api_hosts:
+        return 'media'
+    segments = []
+    for segment in parts.path.strip('/').split('/'):
+        if segment.isdigit() or (len(segment) >= 16 and not segment.isalpha()):
+            segment = ':id'
+        segments.append(segment)
+    return f"{parts.hostname}/{'/'.join(segments)}"
+
+
+class Histogram:
+    """Histograma cumulativo ao estilo Prometheus (buckets `le`, soma e contagem)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * (len(self.buckets) + 1)   # último = +Inf
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """[(le, contagem acumulada)], terminando em '+Inf'."""
+        out, total = [], 0
+        for le, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += n
+            out.append((le, total))
+        return out
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    items = key + extra
+    if not items:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def _format_le(le) -> str:
+    return le if isinstance(le, str) else repr(float(le))
+
+
+class Metrics:
+    """
+    Métricas de uma run, seguras entre threads. Os nomes são prefixados com
+    `job` no export (ex.: publish_posts_total).
+    """
+
+    def __init__(self, job: str):
+        self.job         = job
+        self.started_at  = datetime.now(timezone.utc)
+        self._started    = time.monotonic()
+        self._counters   = {}   # (nome, labels) → valor
+        self._histograms = {}   # (nome, labels) → Histogram
+        self._phases     = {}   # fase → segundos
+        self._lock       = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Regista no histograma `name` a duração do bloco."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Soma a duração do bloco ao tempo da fase `name`."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + elapsed
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels_key(labels)), 0)
+
+    def to_prometheus(self) -> str:
+        prefix = self.job
+        lines  = []
+        with self._lock:
+            counters   = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            phases     = sorted(self._phases.items())
+
+        seen = set()
+        for (name, key), value in counters:
+            metric = f'{prefix}_{name}'
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_format_labels(key)} {value:g}')
+
+        for (name, key), hist in histograms:
+            metric = f'{prefix}_{name}'
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f'# TYPE {metric} histogram')
+            for le, count in hist.cumulative():
+                lines.append(f'{metric}_bucket{_format_labels(key, (("le", _format_le(le)),))} {count}')
+            lines.append(f'{metric}_sum{_format_labels(key)} {hist.sum:.6f}')
+            lines.append(f'{metric}_count{_format_labels(key)} {hist.count}')
+
+        if phases:
+            lines.append(f'# TYPE {prefix}_phase_seconds gauge')
+            for phase, seconds in phases:
+                lines.append(f'{prefix}_phase_seconds{{phase="{phase}"}} {seconds:.6f}')
+        lines.append(f'# TYPE {prefix}_run_duration_seconds gauge')
+        lines.append(f'{prefix}_run_duration_seconds {time.monotonic() - self._started:.6f}')
+        lines.append(f'# TYPE {prefix}_last_run_timestamp_seconds gauge')
+        lines.append(f'{prefix}_last_run_timestamp_seconds {time.time():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(key), 'value': value}
+                        for (name, key), value in sorted(self._counters.items())]
+            histograms = [{
+                'name':    name,
+                'labels':  dict(key),
+                'count':   hist.count,
+                'sum':     round(hist.sum, 6),
+                'buckets': {_format_le(le): n for le, n in hist.cumulative()},
+            } for (name, key), hist in sorted(self._histograms.items(), key=lambda item: item[0])]
+            phases = {phase: round(seconds, 6) for phase, seconds in sorted(self._phases.items())}
+        return {
+            'job':              self.job,
+            'started_at':       self.started_at.isoformat(),
+            'finished_at':      datetime.now(timezone.utc).isoformat(),
+            'duration_seconds': round(time.monotonic() - self._started, 6),
+            'counters':         counters,
+            'histograms':       histograms,
+            'phases':           phases,
+        }
+
+    def export(self, directory: str = None) -> list:
+        """Escreve <job>.prom e <job>.json em `directory` (ou METRICS_DIR). Devolve os caminhos."""
+        directory = directory or os.environ.get('METRICS_DIR', '')
+        if not directory:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for ext, content in (('prom', self.to_prometheus()),
+                             ('json', json.dumps(self.to_dict(), indent=2, ensure_ascii=False))):
+            path = os.path.join(directory, f'{self.job}.{ext}')
+            tmp  = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                f.write(content)
+            os.replace(tmp, path)   # o textfile collector nunca lê um ficheiro a meio
+            paths.append(path)
+        return paths
+
+
+# ── Traces ──────────────────────────────────────────────────────────────
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT   = 3
+
+STATUS_OK    = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple, set)):
+        return {'arrayValue': {'values': [_otlp_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """Um span: nome, pai, início/fim em nanossegundos, atributos e estado."""
+
+    def __init__(self, tracer, name: str, parent=None, attributes: dict = None,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.tracer     = tracer
+        self.name       = name
+        self.trace_id   = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id    = os.urandom(8).hex()
+        self.parent_id  = parent.span_id if parent else ''
+        self.kind       = kind
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.status     = 0
+        self.message    = ''
+        self.start_ns   = time.time_ns()
+        self.end_ns     = None
+
+    def set(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def add(self, key: str, value: float):
+        """Soma `value` ao atributo `key` (ex.: bytes enviados em vários blocos)."""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def fail(self, message: str):
+        self.status  = STATUS_ERROR
+        self.message = message
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._finish(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId':           self.trace_id,
+            'spanId':            self.span_id,
+            'name':              self.name,
+            'kind':              self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano':   str(self.end_ns or time.time_ns()),
+            'attributes':        [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status:
+            span['status'] = {'code': self.status, 'message': self.message}
+        return span
+
+
+class Tracer:
+    """
+    Spans de uma run, seguros entre threads. Cada thread tem a sua pilha de
+    spans activos: span() usa o do topo como pai. Em threads de um pool, o
+    pai passa-se explicitamente (parent=…) ou com bind().
+    """
+
+    def __init__(self, service: str, path: str = None):
+        self.service   = service
+        self.path      = os.environ.get('TRACE_FILE', '') if path is None else path
+        self._local    = threading.local()
+        self._finished = []
+        self._lock     = threading.Lock()
+
+    def current(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def start_span(self, name: str, parent=None, attributes: dict = None,
+                   kind: int = SPAN_KIND_INTERNAL, root: bool = False) -> Span:
+        """Abre um span (filho de `parent` ou do span activo; `root` força um trace novo)."""
+        if parent is None and not root:
+            parent = self.current()
+        return Span(self, name, parent, attributes, kind)
+
+    @contextmanager
+    def activate(self, span):
+        """Torna `span` o span activo desta thread durante o bloco."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def span(self, name: str, parent=None, attributes: dict = None,
+             kind: int = SPAN_KIND_INTERNAL, root: bool = False):
+        span = self.start_span(name, parent, attributes, kind, root)
+        with self.activate(span):
+            try:
+                yield span
+            except BaseException as e:
+                span.fail(f"{type(e).__name__}: {e}")
+                raise
+            finally:
+                span.end()
+
+    def child(self, name: str, attributes: dict = None, kind: int = SPAN_KIND_INTERNAL):
+        """span() se houver um span activo nesta thread; senão, um bloco sem span (None)."""
+        if self.current() is None:
+            return nullcontext()
+        return self.span(name, attributes=attributes, kind=kind)
+
+    def bind(self, fn):
+        """Devolve fn a correr com o span activo de agora como pai (para pools de threads)."""
+        parent = self.current()
+        if parent is None:
+            return fn
+
+        def bound(*args, **kwargs):
+            with self.activate(parent):
+                return fn(*args, **kwargs)
+        return bound
+
+    def add(self, key: str, value: float):
+        """Soma `value` ao atributo `key` do span activo, se houver."""
+        span = self.current()
+        if span is not None:
+            span.add(key, value)
+
+    def _finish(self, span: Span):
+        if self.path:
+            with self._lock:
+                self._finished.append(span)
+
+    def discard(self):
+        """Esquece os spans terminados ainda não exportados."""
+        with self._lock:
+            self._finished = []
+
+    def to_otlp(self, spans: list) -> dict:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': _otlp_value(self.service)}]},
+            'scopeSpans': [{
+                'scope': {'name': f'avatarstudio.{self.service}'},
+                'spans': [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def export(self, path: str = None) -> str:
+        """Acrescenta os spans terminados a `path` (ou TRACE_FILE) numa linha OTLP/JSON. Devolve o caminho."""
+        path = path or self.path
+        with self._lock:
+            spans, self._finished = self._finished, []
+        if not path or not spans:
+            return None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.to_otlp(spans), ensure_ascii=False) + '\n')
+        return path
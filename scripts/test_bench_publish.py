@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Testes unitários para scripts/bench_publish.py
+
+Executa:
+  python scripts/test_bench_publish.py
+  python -m pytest scripts/test_bench_publish.py -v
+"""
+import os
+import sys
+import json
+import unittest
+import importlib.util
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_publish as bench
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_interpolacao(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(bench.percentile(values, 50), 3)
+        self.assertAlmostEqual(bench.percentile(values, 95), 4.8)
+        self.assertEqual(bench.percentile([], 99), 0.0)
+
+
+class TestStubs(unittest.TestCase):
+
+    def _server(self, app, behaviour=None):
+        server = bench.StubServer(app, behaviour).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_youtube_resumivel(self):
+        server = self._server(bench.YouTubeApp())
+        init = requests.post(f'{server.url}/upload/youtube/v3/videos',
+                             headers={'X-Upload-Content-Length': '6'})
+        upload = init.headers['Location'].replace('https://www.googleapis.com', server.url)
+        r = requests.put(upload, data=b'abcd', headers={'Content-Range': 'bytes 0-3/6'})
+        self.assertEqual((r.status_code, r.headers['Range']), (308, 'bytes=0-3'))
+        r = requests.put(upload, data=b'ef', headers={'Content-Range': 'bytes 4-5/6'})
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.json()['id'].startswith('yt'))
+
+    def test_postgrest_claim_e_status(self):
+        app    = bench.PostgrestApp()
+        server = self._server(app)
+        app.load([{'id': 'a'}, {'id': 'b'}, {'id': 'c'}])
+        page = requests.post(f'{server.url}/rest/v1/rpc/claim_due_posts', json={'p_limit': 2}).json()
+        self.assertEqual([p['id'] for p in page], ['a', 'b'])
+        requests.patch(f'{server.url}/rest/v1/posts', params={'id': 'in.("a","b")'},
+                       json={'status': 'publicado'})
+        self.assertEqual(app.statuses, {'a': 'publicado', 'b': 'publicado'})
+        requests.post(f'{server.url}/rest/v1/posts', params={'on_conflict': 'id'},
+                      json=[{'id': 'c', 'status': 'agendado', 'tentativas': 1}])
+        self.assertEqual(app.statuses['c'], 'agendado')
+
+    def test_throttling_responde_429(self):
+        server = self._server(bench.MediaApp(10, 10), bench.Behaviour(throttle_rpm=2))
+        codes = [requests.head(f'{server.url}/image/1.jpg').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    def test_fila_sintetica_reprodutivel(self):
+        a = bench.queue_posts(50, 'http://cdn', seed=7)
+        b = bench.queue_posts(50, 'http://cdn', seed=7)
+        self.assertEqual([p['plataformas'] for p in a], [p['plataformas'] for p in b])
+        self.assertEqual({p['status'] for p in a}, {'agendado'})
+        for post in a:
+            url = post['imagem_url'] or post['video_url']
+            self.assertRegex(url, r'^http://cdn/(image|video)/\d+\.(jpg|mp4)$')
+            if post['video_url']:
+                self.assertNotIn('facebook', post['plataformas'])
+
+    def test_fila_de_fixture(self):
+        fixture = {'posts': [
+            {'id': 'b', 'status': 'agendado', 'agendado_para': '2026-01-02', 'imagem_url': 'https://x/a/image/1.jpg'},
+            {'id': 'a', 'status': 'publicado', 'agendado_para': '2026-01-01'},
+            {'id': 'c', 'status': 'agendado', 'agendado_para': '2026-01-01', 'video_url': 'https://x/v/9.mp4'},
+        ]}
+        posts = bench.queue_posts(10, 'http://cdn', fixture=fixture)
+        self.assertEqual([p['id'] for p in posts], ['c', 'b'])
+        self.assertEqual(posts[0]['video_url'], 'http://cdn/video/9.mp4')
+
+
+@unittest.skipUnless(importlib.util.find_spec('supabase'), 'pacote supabase não instalado')
+class TestBenchRun(unittest.TestCase):
+
+    def test_run_publica_todos_os_posts(self):
+        args = bench.argparse.Namespace(
+            latency_ms=1, jitter_ms=0, error_rate=0, throttle_rpm=0, db_latency_ms=0,
+            processing_ms=50, image_kb=1, video_kb=300, workers=4, page_size=4,
+            poll_seconds=0.05, publish_rate=0, preflight=True, seed=3, log_level='WARNING')
+        stubs = bench.start_stubs(args)
+        try:
+            result = bench.run_size(6, args, stubs)
+        finally:
+            for stub in stubs.values():
+                stub.stop()
+        self.assertEqual(result['outcomes'], {'publicado': 6})
+        self.assertGreater(result['posts_per_second'], 0)
+        self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertTrue(set(result['latency_ms']) <= set(bench.PLATFORMS))
+        json.dumps(result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Testes unitários para scripts/gen_workload.py
+
+Executa:
+  python scripts/test_gen_workload.py
+  python -m pytest scripts/test_gen_workload.py -v
+"""
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gen_workload as gw
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_reprodutivel_com_a_mesma_seed(self):
+        a = gw.to_json(gw.generate(seed=3, now=NOW), NOW)
+        b = gw.to_json(gw.generate(seed=3, now=NOW), NOW)
+        c = gw.to_json(gw.generate(seed=4, now=NOW), NOW)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a['posts'], c['posts'])
+
+    def test_escala_e_contagens(self):
+        data = gw.generate(scale=2, counts={'posts': 50}, now=NOW)
+        self.assertEqual(len(data['avatares']), 2 * gw.BASE_COUNTS['avatares'])
+        self.assertEqual(len(data['levantamentos']), 2 * gw.BASE_COUNTS['levantamentos'])
+        self.assertEqual(len(data['posts']), 50)
+
+    def test_chaves_estrangeiras_e_plataformas(self):
+        data      = gw.generate(scale=3, now=NOW)
+        avatares  = {a['id']: a for a in data['avatares']}
+        campanhas = {c['id'] for c in data['campanhas']}
+        contas    = {c['id']: c for c in data['contas_bancarias']}
+        for avatar in avatares.values():
+            self.assertGreaterEqual(len(avatar['plataformas']), 2)
+        for post in data['posts']:
+            avatar = avatares[post['avatar_id']]
+            self.assertTrue(set(post['plataformas']) <= set(avatar['plataformas']))
+            self.assertTrue(set(post['plataformas']) <= set(gw.MEDIA_PLATFORMS[post['tipo_conteudo']]))
+            self.assertIn(post['campanha_id'], campanhas | {None})
+        for lev in data['levantamentos']:
+            self.assertEqual(lev['avatar_id'], contas[lev['conta_bancaria_id']]['avatar_id'])
+            self.assertGreater(lev['montante'], 0)
+
+    def test_due_only_gera_fila_em_atraso(self):
+        data = gw.generate(counts={'posts': 200}, now=NOW, due_only=True)
+        self.assertEqual({p['status'] for p in data['posts']}, {'agendado'})
+        self.assertTrue(all(p['agendado_para'].seconds < 0 for p in data['posts']))
+
+    def test_agendados_futuros_em_horarios_nobres(self):
+        rows  = gw.to_json(gw.generate(counts={'posts': 500}, now=NOW), NOW)['posts']
+        slots = {h for h, _ in gw.PRIME_SLOTS}
+        future = [datetime.fromisoformat(p['agendado_para']) for p in rows
+                  if p['status'] == 'agendado' and p['agendado_para'] > NOW.isoformat()]
+        self.assertTrue(future)
+        for when in future:
+            self.assertIn(when.hour, slots)
+            self.assertIn(when.minute, (0, 15, 30, 45))
+
+    def test_iban_valido(self):
+        gen  = gw.Generator(1, NOW)
+        iban = gen.iban('0035')
+        self.assertEqual(len(iban), 25)
+        rearranged = iban[4:] + iban[:4]
+        numeric = ''.join(str(int(ch, 36)) for ch in rearranged)
+        self.assertEqual(int(numeric) % 97, 1)
+
+
+class TestRender(unittest.TestCase):
+
+    def test_sql_relativo_a_now_e_escapado(self):
+        data = {'avatares': [{'id': 'x', 'nome': "D'Ávila", 'plataformas': [], 'ativo': True}],
+                'posts': [{'id': 'p', 'agendado_para': gw.Rel(-60), 'plataformas': ['tiktok']}],
+                'campanhas': [{'id': 'c', 'data_inicio': gw.Rel(86400, date=True)}]}
+        sql = gw.to_sql(data)
+        self.assertTrue(sql.startswith('begin;'))
+        self.assertIn("('x', 'D''Ávila', '{}'::text[], true)", sql)
+        self.assertIn("(now() + interval '-60 seconds')", sql)
+        self.assertIn("(now() + interval '86400 seconds')::date", sql)
+        self.assertIn("array['tiktok']", sql)
+        # avatares → campanhas → posts (ordem das chaves estrangeiras)
+        self.assertLess(sql.index('into avatares'), sql.index('into campanhas'))
+        self.assertLess(sql.index('into campanhas'), sql.index('into posts'))
+        self.assertTrue(sql.rstrip().endswith('commit;'))
+
+    def test_sql_em_lotes(self):
+        rows = [{'id': str(i)} for i in range(gw.SQL_BATCH + 1)]
+        sql  = gw.to_sql({'posts': rows})
+        self.assertEqual(sql.count('insert into posts'), 2)
+        self.assertEqual(sql.count('on conflict (id) do nothing;'), 2)
+
+    def test_json_com_datas_absolutas(self):
+        data = {'campanhas': [{'id': 'c', 'data_inicio': gw.Rel(86400, date=True), 'criado_em': gw.Rel(-3600)}]}
+        row  = gw.to_json(data, NOW)['campanhas'][0]
+        self.assertEqual(row['data_inicio'], '2026-10-19')
+        self.assertEqual(row['criado_em'], '2026-10-18T11:00:00+00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,20 +8,23 @@ Executa:
 """
 import os
 import sys
+import json
+import time
+import signal
+import tempfile
+import threading
 import unittest
 import importlib.util
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, patch, call
 
 # ── Setup: variáveis de ambiente ───────────────────────────────────────────
 os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
 os.environ.setdefault('SUPABASE_KEY', 'test-key-xxx')
-
-# Injectar um módulo supabase falso antes de importar publish.py
-# (necessário quando as dependências nativas do supabase não estão disponíveis)
-_mock_client = MagicMock()
-_fake_supabase = MagicMock()
-_fake_supabase.create_client.return_value = _mock_client
-sys.modules.setdefault('supabase', _fake_supabase)
+# Sem cache de media por omissão: os testes de upload simulam o download em streaming
+os.environ.setdefault('MEDIA_CACHE_MB', '0')
+# Sem pré-validação por omissão: os testes não fazem pedidos HEAD aos media
+os.environ.setdefault('PUBLISH_PREFLIGHT', 'false')
 
 # Carregar publish.py como módulo isolado
 _spec = importlib.util.spec_from_file_location(
@@ -31,6 +34,10 @@ _spec = importlib.util.spec_from_file_location(
 pub = importlib.util.module_from_spec(_spec)
 _spec.loader.exec_module(pub)
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_publish as bench   # noqa: E402 — stubs HTTP (PostgREST) para os testes do daemon
+
 
 # ── Testes: mark_post() ────────────────────────────────────────────────────
 class TestMarkPost(unittest.TestCase):
@@ -119,6 +126,7 @@ class TestPublishInstagram(unittest.TestCase):
 
     def setUp(self):
         pub.INSTAGRAM_TOKEN = ''
+        pub.ig_id_cache.clear()
 
     def tearDown(self):
         pub.INSTAGRAM_TOKEN = ''
@@ -129,14 +137,14 @@ class TestPublishInstagram(unittest.TestCase):
 
     def test_com_token_e_sem_media_retorna_false(self):
         pub.INSTAGRAM_TOKEN = 'valid-token'
-        with patch('requests.get') as mock_get:
+        with patch.object(pub.http, 'get') as mock_get:
             mock_get.return_value = MagicMock(ok=True, json=lambda: {'id': 'ig_user_1'})
             result = pub.publish_instagram({'legenda': 'Teste'})
         self.assertFalse(result)
 
     def test_erro_na_chamada_me_retorna_false(self):
         pub.INSTAGRAM_TOKEN = 'valid-token'
-        with patch('requests.get') as mock_get:
+        with patch.object(pub.http, 'get') as mock_get:
             mock_get.return_value = MagicMock(ok=False, status_code=401, text='Unauthorized')
             result = pub.publish_instagram({'legenda': 'Teste', 'imagem_url': 'http://img.jpg'})
         self.assertFalse(result)
@@ -164,7 +172,7 @@ class TestPublishTikTok(unittest.TestCase):
         """O title enviado ao TikTok não deve exceder 2200 caracteres."""
         pub.TIKTOK_TOKEN = 'valid-token'
         long_caption = 'a' * 3000
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(
                 ok=True,
                 json=lambda: {'error': {'code': 'ok'}, 'data': {'publish_id': 'tt1'}},
@@ -191,7 +199,7 @@ class TestPublishFacebook(unittest.TestCase):
     def test_com_imagem_usa_endpoint_photos(self):
         pub.FACEBOOK_TOKEN = 'fb-token'
         pub.supabase = MagicMock()
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=True, json=lambda: {'id': 'fb123'})
             pub.publish_facebook({'id': 'p1', 'avatar_id': 'av1', 'legenda': 'Olá', 'imagem_url': 'http://img.jpg'})
             url = mock_post.call_args[0][0]
@@ -200,7 +208,7 @@ class TestPublishFacebook(unittest.TestCase):
     def test_sem_imagem_usa_endpoint_feed(self):
         pub.FACEBOOK_TOKEN = 'fb-token'
         pub.supabase = MagicMock()
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=True, json=lambda: {'id': 'fb456'})
             pub.publish_facebook({'id': 'p2', 'avatar_id': 'av1', 'legenda': 'Olá sem imagem'})
             url = mock_post.call_args[0][0]
@@ -228,10 +236,10 @@ class TestPublishYouTube(unittest.TestCase):
     def test_titulo_truncado_a_100_chars(self):
         pub.YOUTUBE_TOKEN = 'yt-token'
         long_title = 'T' * 200
-        with patch('requests.get') as mock_get, \
-             patch('requests.post') as mock_post, \
-             patch('requests.put') as mock_put:
-            mock_get.return_value = MagicMock(ok=True, content=b'video-data',
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
+            mock_get.return_value = MagicMock(ok=True, iter_content=lambda chunk_size: iter([b'video-data']),
                 headers={'Content-Type': 'video/mp4'}, raise_for_status=lambda: None)
             mock_post.return_value = MagicMock(
                 ok=True, headers={'Location': 'https://upload.googleapis.com/upload/abc'}
@@ -267,15 +275,7 @@ class TestMainDryRun(unittest.TestCase):
         pub.supabase = self.supa
         pub.DRY_RUN  = True
         # Simular 1 post pronto a publicar
-        mock_chain = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit.return_value
-            .execute.return_value
-        )
+        mock_chain = self.supa.rpc.return_value.select.return_value.execute.return_value
         mock_chain.data = [{
             'id': 'p1',
             'plataformas': ['instagram', 'tiktok'],
@@ -308,15 +308,7 @@ class TestMainSemPosts(unittest.TestCase):
         self.supa = MagicMock()
         pub.supabase = self.supa
         pub.DRY_RUN  = False
-        mock_chain = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit.return_value
-            .execute.return_value
-        )
+        mock_chain = self.supa.rpc.return_value.select.return_value.execute.return_value
         mock_chain.data = []
 
     def test_sai_com_0_quando_sem_posts(self):
@@ -334,48 +326,21 @@ class TestGetDuePosts(unittest.TestCase):
 
     def _mock_chain(self, data):
         """Configura a cadeia de chamadas do Supabase para retornar data."""
-        chain = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit.return_value
-            .execute.return_value
-        )
+        chain = self.supa.rpc.return_value.select.return_value.execute.return_value
         chain.data = data
         return chain
 
-    def test_filtra_por_status_agendado(self):
-        self._mock_chain([])
-        pub.get_due_posts()
-        eq_call = self.supa.table.return_value.select.return_value.eq
-        eq_call.assert_called_once_with('status', 'agendado')
-
-    def test_limita_a_20_posts(self):
-        self._mock_chain([])
-        pub.get_due_posts()
-        limit_call = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit
-        )
-        limit_call.assert_called_once_with(20)
-
-    def test_ordena_por_agendado_para(self):
+    def test_chama_due_posts_com_as_regras_do_escalonador(self):
         self._mock_chain([])
-        pub.get_due_posts()
-        order_call = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order
-        )
-        order_call.assert_called_once_with('agendado_para')
+        with patch.object(pub, 'SLOT_GRACE', 600.0), \
+             patch.object(pub, 'FAIR_BY_CAMPAIGN', True):
+            pub.get_due_posts()
+        self.supa.rpc.assert_called_once_with('due_posts', {
+            'p_limit':         pub.DUE_POSTS_LIMIT,
+            'p_grace_seconds': 600,
+            'p_fair_campaign': True,
+        })
+        self.supa.table.assert_not_called()
 
     def test_retorna_lista_vazia_quando_sem_posts(self):
         self._mock_chain([])
@@ -393,28 +358,14 @@ class TestGetDuePosts(unittest.TestCase):
         self.assertEqual(result[0]['id'], 'p1')
 
     def test_retorna_lista_vazia_quando_data_e_none(self):
-        chain = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit.return_value
-            .execute.return_value
-        )
-        chain.data = None
+        self._mock_chain(None)
         result = pub.get_due_posts()
         self.assertEqual(result, [])
 
-    def test_consulta_tabela_posts(self):
-        self._mock_chain([])
-        pub.get_due_posts()
-        self.supa.table.assert_called_with('posts')
-
     def test_seleciona_campos_com_join_avatares(self):
         self._mock_chain([])
         pub.get_due_posts()
-        select_call = self.supa.table.return_value.select
+        select_call = self.supa.rpc.return_value.select
         args = select_call.call_args[0][0]
         self.assertIn('avatares', args)
         self.assertIn('nome', args)
@@ -436,15 +387,7 @@ class TestMainPublishFlow(unittest.TestCase):
         pub.YOUTUBE_TOKEN = ''
 
     def _setup_posts(self, posts):
-        chain = (
-            self.supa.table.return_value
-            .select.return_value
-            .eq.return_value
-            .lte.return_value
-            .order.return_value
-            .limit.return_value
-            .execute.return_value
-        )
+        chain = self.supa.rpc.return_value.select.return_value.execute.return_value
         chain.data = posts
 
     def test_marca_erro_quando_todas_plataformas_falham(self):
@@ -453,6 +396,7 @@ class TestMainPublishFlow(unittest.TestCase):
             'plataformas': ['instagram'],
             'legenda': 'Teste',
             'avatar_id': 'av1',
+            'tentativas': pub.MAX_ATTEMPTS - 1,  # última tentativa → dead letter
         }])
         pub.INSTAGRAM_TOKEN = ''  # token em falta → publish_instagram retorna False
 
@@ -476,7 +420,7 @@ class TestMainPublishFlow(unittest.TestCase):
         }])
         pub.FACEBOOK_TOKEN = 'fb-token'
 
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=True, json=lambda: {'id': 'fb-post-123'})
             with self.assertRaises(SystemExit) as cm:
                 pub.main()
@@ -529,6 +473,7 @@ class TestPublishInstagramFullFlow(unittest.TestCase):
     def setUp(self):
         pub.INSTAGRAM_TOKEN = 'valid-token'
         pub.supabase = MagicMock()
+        pub.ig_id_cache.clear()
 
     def tearDown(self):
         pub.INSTAGRAM_TOKEN = ''
@@ -539,7 +484,7 @@ class TestPublishInstagramFullFlow(unittest.TestCase):
             'legenda': 'Foto linda', 'hashtags': '#teste',
             'imagem_url': 'https://img.jpg',
         }
-        with patch('requests.get') as mock_get, patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
             mock_get.return_value = MagicMock(ok=True, json=lambda: {'id': 'ig_user_1'})
             mock_post.side_effect = [
                 MagicMock(ok=True, json=lambda: {'id': 'creation_123'}),   # media container
@@ -556,15 +501,20 @@ class TestPublishInstagramFullFlow(unittest.TestCase):
             'legenda': 'Reel', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get, patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
             mock_get.return_value = MagicMock(ok=True, json=lambda: {'id': 'ig_user_2'})
             mock_post.side_effect = [
                 MagicMock(ok=True, json=lambda: {'id': 'creation_789'}),
                 MagicMock(ok=True, json=lambda: {'id': 'ig_reel_101'}),
             ]
             result = pub.publish_instagram(post)
+            # Reels: o media_publish só corre quando o container estiver pronto
+            self.assertIsInstance(result, pub.PendingPublish)
+            self.assertEqual(result.key, 'creation_789')
+            self.assertEqual(mock_post.call_count, 1)
+            self.assertTrue(result.complete())
 
-        self.assertTrue(result)
+        self.assertEqual(mock_post.call_count, 2)
         # Verificar que o parâmetro media_type foi REELS
         first_post_data = mock_post.call_args_list[0][1].get('data', {})
         self.assertEqual(first_post_data.get('media_type'), 'REELS')
@@ -575,7 +525,7 @@ class TestPublishInstagramFullFlow(unittest.TestCase):
             'legenda': 'Teste', 'hashtags': '',
             'imagem_url': 'https://img.jpg',
         }
-        with patch('requests.get') as mock_get, patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
             mock_get.return_value = MagicMock(ok=True, json=lambda: {'id': 'ig_user_1'})
             mock_post.return_value = MagicMock(ok=True, json=lambda: {})  # sem 'id'
             result = pub.publish_instagram(post)
@@ -588,7 +538,7 @@ class TestPublishInstagramFullFlow(unittest.TestCase):
             'legenda': 'Legenda bonita', 'hashtags': '#tag1 #tag2',
             'imagem_url': 'https://img.jpg',
         }
-        with patch('requests.get') as mock_get, patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
             mock_get.return_value = MagicMock(ok=True, json=lambda: {'id': 'ig_user_1'})
             mock_post.side_effect = [
                 MagicMock(ok=True, json=lambda: {'id': 'creation_abc'}),
@@ -618,7 +568,7 @@ class TestPublishTikTokFullFlow(unittest.TestCase):
             'legenda': 'Foto', 'hashtags': '',
             'imagem_url': 'https://img.jpg',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(
                 ok=True,
                 json=lambda: {'error': {'code': 'ok'}, 'data': {'publish_id': 'tt1'}},
@@ -635,7 +585,7 @@ class TestPublishTikTokFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(
                 ok=True,
                 json=lambda: {'error': {'code': 'ok'}, 'data': {'publish_id': 'tt2'}},
@@ -653,7 +603,7 @@ class TestPublishTikTokFullFlow(unittest.TestCase):
             'legenda': 'Teste', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(
                 ok=True,
                 json=lambda: {'error': {'code': 'spam_risk_too_many_posts'}, 'data': {}},
@@ -670,7 +620,7 @@ class TestPublishTikTokFullFlow(unittest.TestCase):
             'legenda': 'Legenda', 'hashtags': '#tag',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(
                 ok=True,
                 json=lambda: {'error': {'code': 'ok'}, 'data': {'publish_id': 'tt3'}},
@@ -698,7 +648,7 @@ class TestPublishFacebookFullFlow(unittest.TestCase):
             'legenda': 'Olá', 'hashtags': '',
             'imagem_url': 'https://img.jpg',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=True, json=lambda: {'id': 'fb123'})
             result = pub.publish_facebook(post)
 
@@ -706,7 +656,7 @@ class TestPublishFacebookFullFlow(unittest.TestCase):
 
     def test_retorna_false_em_erro_http(self):
         post = {'id': 'p2', 'avatar_id': 'av1', 'legenda': 'Teste', 'hashtags': ''}
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=False, status_code=403, text='Forbidden')
             result = pub.publish_facebook(post)
 
@@ -717,7 +667,7 @@ class TestPublishFacebookFullFlow(unittest.TestCase):
             'id': 'p3', 'avatar_id': 'av1',
             'legenda': 'Legenda FB', 'hashtags': '#fb',
         }
-        with patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'post') as mock_post:
             mock_post.return_value = MagicMock(ok=True, json=lambda: {'id': 'fb456'})
             pub.publish_facebook(post)
 
@@ -743,7 +693,7 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get:
+        with patch.object(pub.http, 'get') as mock_get:
             mock_get.return_value = MagicMock(ok=False, raise_for_status=lambda: (_ for _ in ()).throw(Exception('404')))
             result = pub.publish_youtube(post)
 
@@ -756,9 +706,9 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get, patch('requests.post') as mock_post:
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
             mock_get.return_value = MagicMock(
-                ok=True, content=b'video-data',
+                ok=True, iter_content=lambda chunk_size: iter([b'video-data']),
                 headers={'Content-Type': 'video/mp4'},
                 raise_for_status=lambda: None,
             )
@@ -776,11 +726,11 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get, \
-             patch('requests.post') as mock_post, \
-             patch('requests.put') as mock_put:
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
             mock_get.return_value = MagicMock(
-                ok=True, content=b'data',
+                ok=True, iter_content=lambda chunk_size: iter([b'data']),
                 headers={'Content-Type': 'video/mp4'},
                 raise_for_status=lambda: None,
             )
@@ -799,11 +749,11 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo ótimo', 'hashtags': '#yt',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get, \
-             patch('requests.post') as mock_post, \
-             patch('requests.put') as mock_put:
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
             mock_get.return_value = MagicMock(
-                ok=True, content=b'vid-data',
+                ok=True, iter_content=lambda chunk_size: iter([b'vid-data']),
                 headers={'Content-Type': 'video/mp4'},
                 raise_for_status=lambda: None,
             )
@@ -826,11 +776,11 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.mp4',
         }
-        with patch('requests.get') as mock_get, \
-             patch('requests.post') as mock_post, \
-             patch('requests.put') as mock_put:
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
             mock_get.return_value = MagicMock(
-                ok=True, content=b'data',
+                ok=True, iter_content=lambda chunk_size: iter([b'data']),
                 headers={'Content-Type': 'video/mp4'},
                 raise_for_status=lambda: None,
             )
@@ -853,11 +803,11 @@ class TestPublishYouTubeFullFlow(unittest.TestCase):
             'legenda': 'Vídeo', 'hashtags': '',
             'video_url': 'https://vid.webm',
         }
-        with patch('requests.get') as mock_get, \
-             patch('requests.post') as mock_post, \
-             patch('requests.put') as mock_put:
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
             mock_get.return_value = MagicMock(
-                ok=True, content=b'webm-data',
+                ok=True, iter_content=lambda chunk_size: iter([b'webm-data']),
                 headers={'Content-Type': 'video/webm'},
                 raise_for_status=lambda: None,
             )
@@ -928,5 +878,2110 @@ class TestSavePublishedEdgeCases(unittest.TestCase):
         self.assertEqual(data['url_post'], 'https://youtube.com/watch?v=yt-vid-123')
 
 
+# ── Testes: publish_posts() — motor concorrente ──────────────────────────
+class TestPublishPostsConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        self._limits  = dict(pub.PLATFORM_LIMITS)
+        self._workers = pub.MAX_WORKERS
+
+    def tearDown(self):
+        pub.PLATFORM_LIMITS.clear()
+        pub.PLATFORM_LIMITS.update(self._limits)
+        pub.MAX_WORKERS = self._workers
+
+    def _tracking_publisher(self, tracker):
+        """Publisher falso que regista o pico de chamadas em simultâneo."""
+        lock = threading.Lock()
+
+        def publisher(post):
+            with lock:
+                tracker['now'] += 1
+                tracker['peak'] = max(tracker['peak'], tracker['now'])
+            time.sleep(0.02)
+            with lock:
+                tracker['now'] -= 1
+            return True
+        return publisher
+
+    def _statuses(self):
+        update = self.supa.table.return_value.update
+        return [c[0][0]['status'] for c in update.call_args_list]
+
+    def test_respeita_limite_por_plataforma(self):
+        tracker = {'now': 0, 'peak': 0}
+        pub.PLATFORM_LIMITS['youtube'] = 1
+        posts = [{'id': f'p{i}', 'plataformas': ['youtube']} for i in range(4)]
+        with patch.dict(pub.PUBLISHERS, {'youtube': self._tracking_publisher(tracker)}):
+            published, errors = pub.publish_posts(posts)
+        self.assertEqual(tracker['peak'], 1)
+        self.assertEqual((published, errors), (4, 0))
+
+    def test_respeita_limite_global(self):
+        tracker = {'now': 0, 'peak': 0}
+        pub.MAX_WORKERS = 2
+        publisher = self._tracking_publisher(tracker)
+        posts = [{'id': f'p{i}', 'plataformas': ['instagram', 'tiktok', 'facebook']} for i in range(3)]
+        with patch.dict(pub.PUBLISHERS, {'instagram': publisher, 'tiktok': publisher, 'facebook': publisher}):
+            published, _ = pub.publish_posts(posts)
+        self.assertLessEqual(tracker['peak'], 2)
+        self.assertEqual(published, 3)
+
+    def test_plataforma_lenta_nao_bloqueia_as_outras(self):
+        """O YouTube só termina depois de o Instagram publicar — exige paralelismo."""
+        instagram_done = threading.Event()
+
+        def slow_youtube(post):
+            return instagram_done.wait(timeout=2)
+
+        def fast_instagram(post):
+            instagram_done.set()
+            return True
+
+        posts = [{'id': 'p1', 'plataformas': ['youtube', 'instagram']}]
+        with patch.dict(pub.PUBLISHERS, {'youtube': slow_youtube, 'instagram': fast_instagram}):
+            published, errors = pub.publish_posts(posts)
+        self.assertEqual((published, errors), (1, 0))
+
+    def test_excepcao_conta_erro_mas_sucesso_parcial_marca_publicado(self):
+        def boom(post):
+            raise RuntimeError('timeout')
+
+        posts = [{'id': 'p1', 'plataformas': ['tiktok', 'facebook']}]
+        with patch.dict(pub.PUBLISHERS, {'tiktok': boom, 'facebook': lambda post: True}):
+            published, errors = pub.publish_posts(posts)
+        self.assertEqual((published, errors), (1, 1))
+        self.assertEqual(self._statuses(), ['publicado'])
+
+    def test_marca_cada_post_uma_vez(self):
+        posts = [
+            {'id': 'ok',   'plataformas': ['instagram', 'facebook']},
+            {'id': 'fail', 'plataformas': ['instagram']},
+        ]
+        with patch.dict(pub.PUBLISHERS, {
+            'instagram': lambda post: post['id'] == 'ok',
+            'facebook':  lambda post: True,
+        }):
+            published, errors = pub.publish_posts(posts)
+        self.assertEqual((published, errors), (1, 1))
+        self.assertEqual(sorted(self._statuses()), ['agendado', 'publicado'])
+
+
+# ── Testes: upload YouTube por blocos ────────────────────────────────────
+class TestYouTubeChunkedUpload(unittest.TestCase):
+
+    URL = 'https://upload.googleapis.com/upload/abc'
+
+    def setUp(self):
+        self._chunk = pub.YOUTUBE_CHUNK_SIZE
+        pub.YOUTUBE_CHUNK_SIZE = 4
+        pub.YOUTUBE_TOKEN = 'yt-token'
+        pub.supabase = MagicMock()
+
+    def tearDown(self):
+        pub.YOUTUBE_CHUNK_SIZE = self._chunk
+        pub.YOUTUBE_TOKEN = ''
+
+    @staticmethod
+    def _resp(status, rng=None, body=None):
+        headers = {'Range': rng} if rng else {}
+        return MagicMock(status_code=status, headers=headers, text='', json=lambda: body or {})
+
+    def _ranges(self, mock_put):
+        return [c[1]['headers']['Content-Range'] for c in mock_put.call_args_list]
+
+    def test_iter_chunks_reagrupa_em_blocos_fixos(self):
+        resp = MagicMock(iter_content=lambda chunk_size: iter([b'ab', b'cdefg', b'', b'hij']))
+        self.assertEqual(list(pub._iter_chunks(resp, 4)), [b'abcd', b'efgh', b'ij'])
+
+    def test_envia_blocos_com_content_range(self):
+        with patch.object(pub.http, 'put') as mock_put:
+            mock_put.side_effect = [
+                self._resp(308, 'bytes=0-3'),
+                self._resp(308, 'bytes=0-7'),
+                self._resp(200, body={'id': 'vid'}),
+            ]
+            r = pub.youtube_upload_stream(self.URL, iter([b'abcd', b'efgh', b'ij']), 'video/mp4', 10)
+        self.assertEqual(r.json(), {'id': 'vid'})
+        self.assertEqual(self._ranges(mock_put), ['bytes 0-3/10', 'bytes 4-7/10', 'bytes 8-9/10'])
+
+    def test_tamanho_desconhecido_so_no_ultimo_bloco(self):
+        with patch.object(pub.http, 'put') as mock_put:
+            mock_put.side_effect = [self._resp(308, 'bytes=0-3'), self._resp(201, body={'id': 'vid'})]
+            pub.youtube_upload_stream(self.URL, iter([b'abcd', b'ef']), 'video/mp4')
+        self.assertEqual(self._ranges(mock_put), ['bytes 0-3/*', 'bytes 4-5/6'])
+
+    def test_confirmacao_parcial_reenvia_resto_do_bloco(self):
+        with patch.object(pub.http, 'put') as mock_put:
+            mock_put.side_effect = [self._resp(308, 'bytes=0-1'), self._resp(200, body={'id': 'vid'})]
+            pub.youtube_upload_stream(self.URL, iter([b'abcd']), 'video/mp4', 4)
+        self.assertEqual(self._ranges(mock_put), ['bytes 0-3/4', 'bytes 2-3/4'])
+        self.assertEqual(mock_put.call_args_list[1][1]['data'], b'cd')
+
+    def test_falha_de_rede_retoma_do_offset_confirmado(self):
+        with patch.object(pub.http, 'put') as mock_put, patch.object(pub.time, 'sleep'):
+            mock_put.side_effect = [
+                self._resp(308, 'bytes=0-3'),
+                pub.requests.ConnectionError('reset'),
+                self._resp(308, 'bytes=0-5'),            # consulta de estado
+                self._resp(200, body={'id': 'vid'}),
+            ]
+            r = pub.youtube_upload_stream(self.URL, iter([b'abcd', b'efgh']), 'video/mp4', 8)
+        self.assertIsNotNone(r)
+        self.assertEqual(
+            self._ranges(mock_put),
+            ['bytes 0-3/8', 'bytes 4-7/8', 'bytes */8', 'bytes 6-7/8'],
+        )
+
+    def test_erro_permanente_nao_repete(self):
+        with patch.object(pub.http, 'put') as mock_put:
+            mock_put.return_value = self._resp(403)
+            r = pub.youtube_upload_stream(self.URL, iter([b'abcd']), 'video/mp4', 4)
+        self.assertIsNone(r)
+        self.assertEqual(mock_put.call_count, 1)
+
+    def test_desiste_apos_maximo_de_tentativas(self):
+        with patch.object(pub.http, 'put') as mock_put, patch.object(pub.time, 'sleep'):
+            mock_put.return_value = self._resp(503)
+            r = pub.youtube_upload_stream(self.URL, iter([b'abcd']), 'video/mp4', 4)
+        self.assertIsNone(r)
+
+    def test_publish_youtube_pede_download_em_streaming(self):
+        post = {'id': 'p1', 'avatar_id': 'av1', 'legenda': 'V', 'video_url': 'https://vid.mp4'}
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
+            mock_get.return_value = MagicMock(
+                iter_content=lambda chunk_size: iter([b'abcdef']),
+                headers={'Content-Type': 'video/mp4', 'Content-Length': '6'},
+                raise_for_status=lambda: None,
+            )
+            mock_post.return_value = MagicMock(ok=True, headers={'Location': self.URL})
+            mock_put.side_effect = [self._resp(308, 'bytes=0-3'), self._resp(200, body={'id': 'vid'})]
+            self.assertTrue(pub.publish_youtube(post))
+
+        self.assertTrue(mock_get.call_args[1].get('stream'))
+        self.assertEqual(mock_post.call_args[1]['headers']['X-Upload-Content-Length'], '6')
+        mock_get.return_value.close.assert_called_once()
+
+
+# ── Testes: sessões de upload YouTube persistidas ────────────────────────
+class TestYouTubeSessionResume(unittest.TestCase):
+
+    URL = 'https://upload.googleapis.com/upload/saved'
+
+    def setUp(self):
+        self._chunk = pub.YOUTUBE_CHUNK_SIZE
+        pub.YOUTUBE_CHUNK_SIZE = 4
+        pub.YOUTUBE_TOKEN = 'yt-token'
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+
+    def tearDown(self):
+        pub.YOUTUBE_CHUNK_SIZE = self._chunk
+        pub.YOUTUBE_TOKEN = ''
+
+    def _post(self, started=None):
+        started = started or pub.datetime.now(pub.timezone.utc).isoformat()
+        return {
+            'id': 'p1', 'avatar_id': 'av1', 'legenda': 'V', 'video_url': 'https://vid.mp4',
+            'yt_upload_url': self.URL, 'yt_upload_offset': 4, 'yt_upload_iniciado_em': started,
+        }
+
+    def _updates(self):
+        return [c[0][0] for c in self.supa.table.return_value.update.call_args_list]
+
+    def test_retoma_sessao_guardada_com_range(self):
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
+            mock_put.side_effect = [
+                MagicMock(status_code=308, headers={'Range': 'bytes=0-3'}),   # estado da sessão
+                MagicMock(status_code=200, json=lambda: {'id': 'vid'}),
+            ]
+            mock_get.return_value = MagicMock(
+                status_code=206,
+                iter_content=lambda chunk_size: iter([b'ef']),
+                headers={'Content-Type': 'video/mp4', 'Content-Range': 'bytes 4-5/6'},
+                raise_for_status=lambda: None,
+            )
+            self.assertTrue(pub.publish_youtube(self._post()))
+
+        mock_post.assert_not_called()
+        self.assertEqual(mock_get.call_args[1]['headers'], {'Range': 'bytes=4-'})
+        self.assertEqual(mock_put.call_args_list[1][1]['headers']['Content-Range'], 'bytes 4-5/6')
+        self.assertEqual(self._updates()[-1]['yt_upload_url'], None)
+
+    def test_origem_sem_range_descarta_bytes_ja_enviados(self):
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'put') as mock_put:
+            mock_put.side_effect = [
+                MagicMock(status_code=308, headers={'Range': 'bytes=0-3'}),
+                MagicMock(status_code=200, json=lambda: {'id': 'vid'}),
+            ]
+            mock_get.return_value = MagicMock(
+                status_code=200,
+                iter_content=lambda chunk_size: iter([b'abc', b'def']),
+                headers={'Content-Type': 'video/mp4', 'Content-Length': '6'},
+                raise_for_status=lambda: None,
+            )
+            self.assertTrue(pub.publish_youtube(self._post()))
+        self.assertEqual(mock_put.call_args_list[1][1]['data'], b'ef')
+
+    def test_sessao_ja_concluida_nao_descarrega(self):
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'put') as mock_put:
+            mock_put.return_value = MagicMock(status_code=201, json=lambda: {'id': 'vid'})
+            self.assertTrue(pub.publish_youtube(self._post()))
+        mock_get.assert_not_called()
+
+    def test_sessao_expirada_inicia_upload_novo(self):
+        old = (pub.datetime.now(pub.timezone.utc) - pub.timedelta(days=8)).isoformat()
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
+            mock_get.return_value = MagicMock(
+                iter_content=lambda chunk_size: iter([b'abcd']),
+                headers={'Content-Type': 'video/mp4', 'Content-Length': '4'},
+                raise_for_status=lambda: None,
+            )
+            mock_post.return_value = MagicMock(ok=True, headers={'Location': 'https://new'})
+            mock_put.return_value = MagicMock(status_code=200, json=lambda: {'id': 'vid'})
+            self.assertTrue(pub.publish_youtube(self._post(started=old)))
+        mock_post.assert_called_once()
+        self.assertEqual(mock_put.call_args[0][0], 'https://new')
+
+    def test_guarda_sessao_e_progresso(self):
+        post = {'id': 'p2', 'avatar_id': 'av1', 'legenda': 'V', 'video_url': 'https://vid.mp4'}
+        with patch.object(pub.http, 'get') as mock_get, \
+             patch.object(pub.http, 'post') as mock_post, \
+             patch.object(pub.http, 'put') as mock_put:
+            mock_get.return_value = MagicMock(
+                iter_content=lambda chunk_size: iter([b'abcdef']),
+                headers={'Content-Type': 'video/mp4', 'Content-Length': '6'},
+                raise_for_status=lambda: None,
+            )
+            mock_post.return_value = MagicMock(ok=True, headers={'Location': 'https://new'})
+            mock_put.side_effect = [
+                MagicMock(status_code=308, headers={'Range': 'bytes=0-3'}),
+                MagicMock(status_code=503, text=''),
+            ]
+            with patch.object(pub.time, 'sleep'), patch.object(pub, 'YOUTUBE_CHUNK_RETRIES', 0):
+                self.assertFalse(pub.publish_youtube(post))
+
+        updates = self._updates()
+        self.assertEqual(updates[0]['yt_upload_url'], 'https://new')
+        self.assertIn('yt_upload_iniciado_em', updates[0])
+        self.assertEqual(updates[-1], {'yt_upload_url': 'https://new', 'yt_upload_offset': 4})
+
+
+# ── Testes: PublishSession ───────────────────────────────────────────────
+class TestPublishSession(unittest.TestCase):
+
+    def test_aplica_timeout_por_omissao(self):
+        session = pub.PublishSession(pool_size=3)
+        with patch('requests.Session.request') as mock_request:
+            session.get('https://graph.facebook.com/v19.0/me')
+        self.assertEqual(mock_request.call_args[1]['timeout'], pub.HTTP_TIMEOUT)
+
+    def test_timeout_explicito_prevalece(self):
+        session = pub.PublishSession(pool_size=3)
+        with patch('requests.Session.request') as mock_request:
+            session.get('https://vid.mp4', timeout=60)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 60)
+
+    def test_pool_dimensionado_para_a_concorrencia(self):
+        session = pub.PublishSession(pool_size=12)
+        adapter = session.get_adapter('https://open.tiktokapis.com/v2/')
+        self.assertEqual(adapter._pool_maxsize, 12)
+
+    def test_publishers_partilham_a_mesma_session(self):
+        self.assertIsInstance(pub.http, pub.PublishSession)
+        self.assertEqual(pub.http.get_adapter('https://x')._pool_maxsize, pub.MAX_WORKERS)
+
+
+# ── Testes: cache do Instagram user ID ──────────────────────────────────
+class TestInstagramIdCache(unittest.TestCase):
+
+    POST = {'id': 'p1', 'avatar_id': 'av1', 'legenda': 'Foto', 'imagem_url': 'https://img.jpg'}
+
+    def setUp(self):
+        pub.INSTAGRAM_TOKEN = 'valid-token'
+        pub.supabase = MagicMock()
+        pub.ig_id_cache.clear()
+
+    def tearDown(self):
+        pub.INSTAGRAM_TOKEN = ''
+        pub.ig_id_cache.clear()
+
+    def _ok(self, body):
+        return MagicMock(ok=True, status_code=200, json=lambda: body)
+
+    def test_chama_me_uma_vez_por_token(self):
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
+            mock_get.return_value = self._ok({'id': 'ig_user_1'})
+            mock_post.side_effect = [
+                self._ok({'id': 'c1'}), self._ok({'id': 'm1'}),
+                self._ok({'id': 'c2'}), self._ok({'id': 'm2'}),
+            ]
+            self.assertTrue(pub.publish_instagram(self.POST))
+            self.assertTrue(pub.publish_instagram(self.POST))
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIn('/ig_user_1/media', mock_post.call_args_list[2][0][0])
+
+    def test_erro_de_autenticacao_invalida_cache(self):
+        auth_err = MagicMock(ok=False, status_code=400, text='expired',
+                             json=lambda: {'error': {'code': 190, 'type': 'OAuthException'}})
+        with patch.object(pub.http, 'get') as mock_get, patch.object(pub.http, 'post') as mock_post:
+            mock_get.return_value = self._ok({'id': 'ig_user_1'})
+            mock_post.side_effect = [auth_err, self._ok({'id': 'c2'}), self._ok({'id': 'm2'})]
+            self.assertFalse(pub.publish_instagram(self.POST))
+            self.assertTrue(pub.publish_instagram(self.POST))
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_falha_no_me_nao_fica_em_cache(self):
+        with patch.object(pub.http, 'get') as mock_get:
+            mock_get.return_value = MagicMock(ok=False, status_code=500, text='boom')
+            self.assertFalse(pub.publish_instagram(self.POST))
+            self.assertFalse(pub.publish_instagram(self.POST))
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_persistencia_em_disco_com_ttl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ig_ids.json')
+            resolve = MagicMock(return_value='ig_user_9')
+
+            pub.TokenIdCache(path, ttl=60).get_or_resolve('secret-token', resolve)
+            with open(path) as f:
+                self.assertNotIn('secret-token', f.read())
+
+            # Nova run: lê do disco sem resolver de novo
+            self.assertEqual(pub.TokenIdCache(path, ttl=60).get_or_resolve('secret-token', resolve), 'ig_user_9')
+            self.assertEqual(resolve.call_count, 1)
+
+            # Entrada expirada: resolve outra vez
+            pub.TokenIdCache(path, ttl=0).get_or_resolve('secret-token', resolve)
+            self.assertEqual(resolve.call_count, 2)
+
+    def test_invalidate_remove_do_disco(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path  = os.path.join(tmp, 'ig_ids.json')
+            cache = pub.TokenIdCache(path, ttl=60)
+            cache.get_or_resolve('tok', lambda: 'id1')
+            cache.invalidate('tok')
+            with open(path) as f:
+                self.assertEqual(json.load(f), {})
+
+
+# ── Testes: WriteBuffer (write-behind) ───────────────────────────────────
+class TestWriteBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+
+    def tearDown(self):
+        pub.write_buffer = None
+
+    def _row(self, post_id, platform='instagram'):
+        return {'post_id': post_id, 'plataforma': platform}
+
+    def test_nao_escreve_antes_do_limite(self):
+        buf = pub.WriteBuffer(max_rows=3, interval=0)
+        buf.add_published(self._row('p1'))
+        buf.add_status('p1', {'status': 'publicado'})
+        self.supa.table.assert_not_called()
+
+    def test_insert_em_lote_ao_atingir_limite(self):
+        buf = pub.WriteBuffer(max_rows=2, interval=0)
+        buf.add_published(self._row('p1'))
+        buf.add_published(self._row('p2'))
+        insert = self.supa.table.return_value.insert
+        insert.assert_called_once_with([self._row('p1'), self._row('p2')])
+
+    def test_agrupa_updates_por_status(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_status('p1', {'status': 'publicado'})
+        buf.add_status('p2', {'status': 'publicado'})
+        buf.add_status('p3', {'status': 'erro', 'error_msg': 'x'})
+        buf.close()
+        update = self.supa.table.return_value.update
+        self.assertEqual(update.call_count, 2)
+        in_calls = [c[0] for c in update.return_value.in_.call_args_list]
+        self.assertIn(('id', ['p1', 'p2']), in_calls)
+        self.assertIn(('id', ['p3']), in_calls)
+
+    def test_novas_tentativas_vao_num_upsert_por_status(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        for i in range(3):
+            buf.add_status(f'p{i}', {'status': 'agendado', 'error_msg': f'HTTP 50{i}',
+                                     'tentativas': i + 1, 'proxima_tentativa_em': f'2026-01-01T00:0{i}:00'})
+        buf.close()
+        self.supa.table.return_value.update.assert_not_called()
+        upsert = self.supa.table.return_value.upsert
+        upsert.assert_called_once()
+        rows = upsert.call_args[0][0]
+        self.assertEqual([r['id'] for r in rows], ['p0', 'p1', 'p2'])
+        self.assertEqual(rows[2]['proxima_tentativa_em'], '2026-01-01T00:02:00')
+        self.assertEqual(upsert.call_args[1], {'on_conflict': 'id'})
+
+    def test_upsert_nao_mistura_linhas_com_colunas_diferentes(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_status('p1', {'status': 'agendado', 'error_msg': 'a', 'tentativas': 1})
+        buf.add_status('p2', {'status': 'agendado', 'error_msg': 'b', 'tentativas': 2})
+        buf.add_status('p3', {'status': 'agendado', 'error_msg': 'Run terminou'})
+        buf.close()
+        rows = self.supa.table.return_value.upsert.call_args[0][0]
+        self.assertEqual([r['id'] for r in rows], ['p1', 'p2'])
+        self.supa.table.return_value.update.return_value.in_.assert_called_once_with('id', ['p3'])
+
+    def test_upsert_falhado_actualiza_post_a_post(self):
+        self.supa.table.return_value.upsert.return_value.execute.side_effect = RuntimeError('bulk')
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_status('p1', {'status': 'agendado', 'tentativas': 1})
+        buf.add_status('p2', {'status': 'agendado', 'tentativas': 2})
+        buf.close()
+        eq = self.supa.table.return_value.update.return_value.eq
+        self.assertEqual([c[0] for c in eq.call_args_list], [('id', 'p1'), ('id', 'p2')])
+
+    def test_erro_do_cliente_nao_perde_estados_por_plataforma(self):
+        calls = []
+
+        def table(name):
+            calls.append(name)
+            if len(calls) == 1:
+                raise RuntimeError('cliente')
+            return MagicMock()
+
+        self.supa.table.side_effect = table
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_platform_state({'post_id': 'p1', 'plataforma': 'tiktok', 'status': 'publicado'})
+        buf.add_platform_state({'post_id': 'p2', 'plataforma': 'tiktok', 'status': 'publicado'})
+        buf.close()
+        self.assertEqual(calls, ['post_plataformas'] * 3)
+
+    def test_flush_periodico(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0.01).start()
+        try:
+            buf.add_status('p1', {'status': 'publicado'})
+            deadline = time.time() + 2
+            while not self.supa.table.return_value.update.called and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            buf.close()
+        self.supa.table.return_value.update.assert_called_once()
+
+    def test_lote_falhado_grava_linha_a_linha(self):
+        insert = self.supa.table.return_value.insert
+        insert.return_value.execute.side_effect = [RuntimeError('bulk'), None, None]
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_published(self._row('p1'))
+        buf.add_published(self._row('p2'))
+        buf.close()
+        self.assertEqual(insert.call_count, 3)
+        self.assertEqual(insert.call_args_list[1][0][0], self._row('p1'))
+
+    def test_mark_post_e_save_published_usam_buffer_activo(self):
+        pub.write_buffer = pub.WriteBuffer(max_rows=100, interval=0)
+        pub.mark_post('p1', 'publicado')
+        pub.save_published({'id': 'p1', 'avatar_id': 'av1'}, 'tiktok')
+        self.supa.table.assert_not_called()
+        pub.write_buffer.close()
+        self.supa.table.return_value.insert.assert_called_once()
+        self.supa.table.return_value.update.assert_called_once_with({'status': 'publicado'})
+
+    def test_main_grava_resultados_mesmo_com_excepcao(self):
+        chain = self.supa.rpc.return_value.select.return_value.execute.return_value
+        chain.data = [{'id': 'p1', 'plataformas': ['facebook', 'tiktok']}]
+
+        def fb_ok(post):
+            pub.save_published(post, 'facebook')
+            return True
+
+        with patch.dict(pub.PUBLISHERS, {'facebook': fb_ok}), \
+             patch.object(pub, 'finish_post', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                pub.main()
+
+        self.supa.table.return_value.insert.assert_called_once()
+        self.assertIsNone(pub.write_buffer)
+
+
+# ── Testes: modo drain (paginação keyset) ────────────────────────────────
+class TestDrainMode(unittest.TestCase):
+
+    def setUp(self):
+        self.supa  = MagicMock()
+        pub.supabase = self.supa
+        self.query = self.supa.table.return_value.select.return_value.eq.return_value.lte.return_value
+
+    def tearDown(self):
+        pub.DRAIN_MODE = False
+        pub.DRY_RUN    = False
+
+    def _pages(self, *pages, on_time=()):
+        """Todas as páginas passam pelo filtro or_ (novas tentativas e, depois da 1.ª, cursor)."""
+        execute = self.query.or_.return_value.order.return_value.order.return_value.limit.return_value.execute
+        execute.side_effect = [MagicMock(data=p) for p in pages]
+        # Posts a tempo do slot, pedidos a cada página cheia
+        on_time_execute = self.query.or_.return_value.gte.return_value.order.return_value.limit.return_value.execute
+        on_time_execute.return_value = MagicMock(data=list(on_time))
+
+    @staticmethod
+    def _post(i):
+        return {'id': f'id{i}', 'agendado_para': f'2026-01-01T00:00:0{i}+00:00', 'plataformas': []}
+
+    def test_projeta_so_colunas_usadas(self):
+        self._pages([])
+        pub.get_due_posts_page()
+        columns = self.supa.table.return_value.select.call_args[0][0]
+        self.assertNotIn('*', columns)
+        for col in ('id', 'legenda', 'video_url', 'plataformas'):
+            self.assertIn(col, columns)
+
+    def test_ordena_por_agendado_para_e_id(self):
+        self._pages([])
+        pub.get_due_posts_page()
+        ordered = self.query.or_.return_value.order
+        ordered.assert_called_once_with('agendado_para')
+        ordered.return_value.order.assert_called_once_with('id')
+
+    def test_pagina_com_cursor_keyset(self):
+        self._pages([self._post(1), self._post(2)], [self._post(3)])
+        pages = list(pub.iter_due_post_pages(2, time.monotonic() + 60))
+        self.assertEqual([len(p) for p in pages], [2, 1])
+        cursor = self.query.or_.call_args[0][0]
+        self.assertIn('agendado_para.gt."2026-01-01T00:00:02+00:00"', cursor)
+        self.assertIn('id.gt.id2', cursor)
+
+    def test_para_quando_a_fila_esvazia(self):
+        self._pages([self._post(1), self._post(2)], [])
+        pages = list(pub.iter_due_post_pages(2, time.monotonic() + 60))
+        self.assertEqual(len(pages), 1)
+
+    def test_para_quando_o_orcamento_acaba(self):
+        self._pages([self._post(1)])
+        self.assertEqual(list(pub.iter_due_post_pages(1, time.monotonic() - 1)), [])
+
+    def test_backlog_cheio_junta_posts_a_tempo_uma_vez(self):
+        recent = {'id': 'novo', 'agendado_para': '2026-01-01T09:00:00+00:00', 'plataformas': []}
+        self._pages([self._post(1), self._post(2)], [self._post(3), recent], [], on_time=[recent])
+        pages = list(pub.iter_due_post_pages(2, time.monotonic() + 60))
+        self.assertEqual([[p['id'] for p in page] for page in pages],
+                         [['id1', 'id2', 'novo'], ['id3']])
+
+    def test_main_em_drain_publica_todas_as_paginas(self):
+        pub.DRAIN_MODE = True
+        pages = [[{'id': 'a', 'agendado_para': 't1', 'plataformas': ['facebook']}],
+                 [{'id': 'b', 'agendado_para': 't2', 'plataformas': ['facebook']}]]
+        with patch.object(pub, 'iter_due_post_pages', return_value=iter(pages)), \
+             patch.dict(pub.PUBLISHERS, {'facebook': lambda post: True}):
+            with self.assertRaises(SystemExit) as cm:
+                pub.main()
+        self.assertEqual(cm.exception.code, 0)
+        ids = [c[0][1] for c in self.supa.table.return_value.update.return_value.in_.call_args_list]
+        self.assertEqual(sorted(sum(ids, [])), ['a', 'b'])
+
+
+# ── Testes: reserva atómica de posts (claim) ─────────────────────────────
+class TestClaimMode(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        pub.CLAIM_MODE = True
+
+    def tearDown(self):
+        pub.CLAIM_MODE = False
+        pub.DRY_RUN    = False
+        pub.DRAIN_MODE = False
+        pub.write_buffer = None
+
+    def test_claim_chama_rpc_com_worker_e_lease(self):
+        self.supa.rpc.return_value.execute.return_value = MagicMock(data=[
+            {'id': 'b', 'agendado_para': '2026-01-01T10:00:00+00:00'},
+            {'id': 'a', 'agendado_para': '2026-01-01T09:00:00+00:00'},
+        ])
+        posts = pub.claim_due_posts(5)
+        name, params = self.supa.rpc.call_args[0]
+        self.assertEqual(name, 'claim_due_posts')
+        self.assertEqual(params['p_worker'], pub.WORKER_ID)
+        self.assertEqual(params['p_limit'], 5)
+        self.assertEqual(params['p_lease_seconds'], pub.LEASE_SECONDS)
+        self.assertEqual([p['id'] for p in posts], ['a', 'b'])
+
+    def test_run_normal_usa_claim(self):
+        with patch.object(pub, 'claim_due_posts', return_value=[]) as claim, \
+             patch.object(pub, 'get_due_posts') as get_due:
+            pub.due_post_pages()
+        claim.assert_called_once()
+        get_due.assert_not_called()
+
+    def test_dry_run_nao_reserva(self):
+        pub.DRY_RUN = True
+        with patch.object(pub, 'claim_due_posts') as claim, \
+             patch.object(pub, 'get_due_posts', return_value=[]):
+            pub.due_post_pages()
+        claim.assert_not_called()
+
+    def test_drain_reserva_paginas_ate_esvaziar(self):
+        pub.DRAIN_MODE = True
+        pages = [[{'id': 'a'}, {'id': 'b'}], [{'id': 'c'}, {'id': 'd'}], []]
+        with patch.object(pub, 'claim_due_posts', side_effect=pages), \
+             patch.object(pub, 'DRAIN_PAGE_SIZE', 2):
+            self.assertEqual(len(list(pub.due_post_pages())), 2)
+
+    def test_mark_post_liberta_lease_do_proprio_worker(self):
+        pub.mark_post('p1', 'publicado')
+        update = self.supa.table.return_value.update
+        data = update.call_args[0][0]
+        self.assertIsNone(data['lease_worker'])
+        self.assertIsNone(data['lease_expira_em'])
+        update.return_value.eq.return_value.eq.assert_called_once_with('lease_worker', pub.WORKER_ID)
+
+    def test_buffer_tambem_filtra_por_worker(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        buf.add_status('p1', {'status': 'publicado'})
+        buf.close()
+        in_ = self.supa.table.return_value.update.return_value.in_
+        in_.return_value.eq.assert_called_once_with('lease_worker', pub.WORKER_ID)
+
+    def test_post_sem_plataformas_volta_a_agendado(self):
+        self.assertEqual(pub.finish_post({'id': 'p1', 'plataformas': []}, []), (0, 0))
+        data = self.supa.table.return_value.update.call_args[0][0]
+        self.assertEqual(data['status'], 'agendado')
+
+
+# ── Testes: escalonador (prioridade, slot, rotação entre avatares) ─────────
+class TestScheduler(unittest.TestCase):
+
+    NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        pub.FAIR_BY_CAMPAIGN = False
+
+    def _post(self, post_id, avatar, minutes_late, **extra):
+        when = self.NOW - timedelta(minutes=minutes_late)
+        return {'id': post_id, 'avatar_id': avatar, 'agendado_para': when.isoformat(), **extra}
+
+    def _order(self, posts):
+        return [p['id'] for p in pub.schedule_posts(posts, self.NOW)]
+
+    def test_backlog_de_um_avatar_nao_bloqueia_os_outros(self):
+        backlog = [self._post(f'a{i}', 'A', 600 - i) for i in range(5)]
+        others  = [self._post('b0', 'B', 120), self._post('c0', 'C', 60)]
+        self.assertEqual(self._order(backlog + others), ['a0', 'b0', 'c0', 'a1', 'a2', 'a3', 'a4'])
+
+    def test_posts_a_tempo_passam_a_frente_do_backlog(self):
+        posts = [self._post(f'a{i}', 'A', 600 - i) for i in range(3)]
+        posts.append(self._post('a_slot', 'A', 1))
+        posts.append(self._post('b_slot', 'B', 5))
+        self.assertEqual(self._order(posts)[:2], ['b_slot', 'a_slot'])
+
+    def test_prioridade_antes_de_tudo(self):
+        posts = [self._post('slot', 'A', 1), self._post('urgente', 'B', 900, prioridade=2)]
+        self.assertEqual(self._order(posts), ['urgente', 'slot'])
+
+    def test_rotacao_entre_campanhas_opcional(self):
+        posts = [self._post(f'c{i}', 'A', 600 - i, campanha_id='camp') for i in range(3)]
+        posts.append(self._post('solto', 'A', 300))
+        self.assertEqual(self._order(posts), ['c0', 'c1', 'c2', 'solto'])
+        pub.FAIR_BY_CAMPAIGN = True
+        self.assertEqual(self._order(posts), ['c0', 'solto', 'c1', 'c2'])
+
+    def test_datas_invalidas_ficam_no_backlog(self):
+        posts = [{'id': 'x', 'agendado_para': 't1'}, {'id': 'y'}, self._post('z', 'A', 1)]
+        self.assertEqual(self._order(posts), ['z', 'y', 'x'])
+
+    def test_run_cycle_publica_pela_ordem_do_escalonador(self):
+        posts = [self._post('a0', 'A', 600), self._post('a1', 'A', 599), self._post('b0', 'B', 500)]
+        with patch.object(pub, 'publish_posts', return_value=(3, 0)) as publish:
+            pub.run_cycle([posts])
+        self.assertEqual([p['id'] for p in publish.call_args[0][0]], ['a0', 'b0', 'a1'])
+
+
+# ── Testes: modo daemon ──────────────────────────────────────────────────
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+
+    def tearDown(self):
+        pub.write_buffer = None
+
+    def _next_due(self, rows):
+        (self.supa.table.return_value.select.return_value.eq.return_value
+         .gt.return_value.order.return_value.limit.return_value
+         .execute.return_value) = MagicMock(data=rows)
+
+    def test_espera_ate_ao_proximo_agendado(self):
+        due = pub.datetime.now(pub.timezone.utc) + pub.timedelta(seconds=30)
+        self._next_due([{'agendado_para': due.isoformat()}])
+        wait = pub.seconds_until_next_due(60)
+        self.assertTrue(25 < wait <= 30, wait)
+
+    def test_espera_limitada_ao_poll_interval(self):
+        due = pub.datetime.now(pub.timezone.utc) + pub.timedelta(hours=3)
+        self._next_due([{'agendado_para': due.isoformat()}])
+        self.assertEqual(pub.seconds_until_next_due(60), 60)
+
+    def test_fila_vazia_espera_poll_interval(self):
+        self._next_due([])
+        self.assertEqual(pub.seconds_until_next_due(45), 45)
+
+    def test_sigterm_termina_o_daemon(self):
+        timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM))
+        with patch.object(pub, 'due_post_pages', return_value=[]), \
+             patch.object(pub, 'seconds_until_next_due', return_value=30):
+            timer.start()
+            started = time.monotonic()
+            pub.run_daemon(poll_interval=30)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertIsNone(pub.write_buffer)
+
+    def test_pagina_cheia_repete_sem_esperar(self):
+        limit = pub.DUE_POSTS_LIMIT
+        stop  = MagicMock(side_effect=lambda _: os.kill(os.getpid(), signal.SIGTERM) or 0)
+        with patch.object(pub, 'due_post_pages', return_value=[]), \
+             patch.object(pub, 'run_cycle', side_effect=[(limit, 0, limit), (3, 1, limit), (0, 0, 0)]), \
+             patch.object(pub, 'seconds_until_next_due', stop):
+            pub.run_daemon(poll_interval=1)
+        # Só consulta o próximo agendado depois de esvaziar a fila
+        stop.assert_called_once()
+
+    def test_pagina_cheia_sem_progresso_espera(self):
+        full = [[{'id': f'p{i}', 'plataformas': []} for i in range(pub.DUE_POSTS_LIMIT)]]
+        stop = MagicMock(side_effect=lambda _: os.kill(os.getpid(), signal.SIGTERM) or 0)
+        with patch.object(pub, 'due_post_pages', return_value=full) as pages, \
+             patch.object(pub, 'seconds_until_next_due', stop):
+            pub.run_daemon(poll_interval=1)
+        # Posts sem plataformas ficam 'agendado': não há ciclo seguido sobre a mesma página
+        self.assertEqual(pages.call_count, 1)
+        stop.assert_called_once()
+
+    def test_daemon_contra_postgrest_simulado(self):
+        limit  = pub.DUE_POSTS_LIMIT
+        app    = bench.PostgrestApp()
+        claims = []
+
+        def postgrest(method, path, query, headers, body):
+            if path.endswith('/rpc/claim_due_posts'):
+                claims.append(len(app._queue))
+            return app(method, path, query, headers, body)
+
+        server = bench.StubServer(postgrest).start()
+        self.addCleanup(server.stop)
+        # 1.ª página: publica tudo; 2.ª página: posts sem plataformas, que ficam 'agendado'
+        app.load([{'id': f'ok{i}', 'plataformas': ['facebook']} for i in range(limit)]
+                 + [{'id': f'vazio{i}', 'plataformas': []} for i in range(limit)])
+        next_due = pub.seconds_until_next_due
+        sleep    = MagicMock(side_effect=lambda wait: os.kill(os.getpid(), signal.SIGTERM) or next_due(wait))
+        with patch.object(pub, 'SUPABASE_URL', server.url), \
+             patch.object(pub, 'supabase', pub.LazyClient()), \
+             patch.object(pub, 'CLAIM_MODE', True), \
+             patch.dict(pub.PUBLISHERS, {'facebook': lambda post: True}), \
+             patch.object(pub, 'seconds_until_next_due', sleep):
+            pub.run_daemon(poll_interval=1)
+        self.assertEqual({app.statuses.get(f'ok{i}') for i in range(limit)}, {'publicado'})
+        # A página cheia que publicou repete logo; a que não andou dorme antes de nova consulta
+        self.assertEqual(claims, [2 * limit, limit])
+        sleep.assert_called_once_with(1)
+
+    def test_erro_no_ciclo_nao_mata_o_daemon(self):
+        timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM))
+        with patch.object(pub, 'due_post_pages', side_effect=[RuntimeError('rede'), []]) as pages, \
+             patch.object(pub, 'seconds_until_next_due', side_effect=[0, 30]):
+            timer.start()
+            pub.run_daemon(poll_interval=30)
+        self.assertEqual(pages.call_count, 2)
+
+
+# ── Testes: change feed (LISTEN/NOTIFY) ──────────────────────────────────
+class TestPostsChangeFeed(unittest.TestCase):
+
+    def _feed_with_conn(self, conn):
+        feed = pub.PostsChangeFeed('postgresql://local')
+        feed.conn = conn
+        return feed
+
+    def test_sem_psycopg2_cai_para_polling(self):
+        feed  = pub.PostsChangeFeed('postgresql://local')
+        stop  = MagicMock()
+        with patch.dict(sys.modules, {'psycopg2': None}):
+            self.assertFalse(feed.wait(5, stop))
+        stop.wait.assert_called_once_with(5)
+        self.assertFalse(feed.connected)
+
+    def test_notificacao_acorda_de_imediato(self):
+        conn = MagicMock(notifies=[MagicMock(payload='{"id": "p1"}')])
+        feed = self._feed_with_conn(conn)
+        with patch.object(pub.select, 'select', return_value=([conn], [], [])):
+            started = time.monotonic()
+            self.assertTrue(feed.wait(30, threading.Event()))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(conn.notifies, [])
+
+    def test_timeout_sem_notificacoes(self):
+        conn = MagicMock(notifies=[])
+        feed = self._feed_with_conn(conn)
+        with patch.object(pub.select, 'select', return_value=([], [], [])):
+            self.assertFalse(feed.wait(0.05, threading.Event()))
+
+    def test_ligacao_perdida_volta_a_polling(self):
+        conn = MagicMock()
+        feed = self._feed_with_conn(conn)
+        with patch.object(pub.select, 'select', side_effect=OSError('closed')):
+            self.assertFalse(feed.wait(0.01, threading.Event()))
+        self.assertFalse(feed.connected)
+        conn.close.assert_called_once()
+
+    def test_daemon_com_listen_usa_poll_longo(self):
+        feed = MagicMock(connected=True)
+        timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM))
+        with patch.object(pub, 'SUPABASE_DB_URL', 'postgresql://local'), \
+             patch.object(pub, 'PostsChangeFeed', return_value=feed), \
+             patch.object(pub, 'due_post_pages', return_value=[]), \
+             patch.object(pub, 'seconds_until_next_due', return_value=0.01) as next_due:
+            feed.wait.side_effect = lambda timeout, stop: stop.wait(0.5)
+            pub.supabase = MagicMock()
+            timer.start()
+            pub.run_daemon(poll_interval=60)
+        next_due.assert_called_with(pub.LISTEN_POLL_SECONDS)
+        feed.connect.assert_called_once()
+        feed.close.assert_called_once()
+
+
+@unittest.skipUnless(os.environ.get('TEST_POSTGRES_DSN'), 'TEST_POSTGRES_DSN não definido')
+class TestPostsChangeFeedPostgres(unittest.TestCase):
+    """Integração com um Postgres local: aplica o trigger e verifica o NOTIFY."""
+
+    MIGRATION = os.path.join(
+        os.path.dirname(__file__), '..', 'supabase', 'migrations',
+        '20261018110000_posts_notify_agendados.sql',
+    )
+
+    def setUp(self):
+        psycopg2 = __import__('psycopg2')
+        self.dsn  = os.environ['TEST_POSTGRES_DSN']
+        self.conn = psycopg2.connect(self.dsn)
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        cur.execute('CREATE SCHEMA IF NOT EXISTS publish_test')
+        cur.execute('SET search_path TO publish_test')
+        cur.execute('DROP TABLE IF EXISTS posts')
+        cur.execute('CREATE TABLE posts (id serial primary key, status text, agendado_para timestamptz)')
+        with open(self.MIGRATION) as f:
+            cur.execute(f.read())
+
+    def tearDown(self):
+        self.conn.cursor().execute('DROP SCHEMA publish_test CASCADE')
+        self.conn.close()
+
+    def test_agendar_post_acorda_o_listener(self):
+        feed = pub.PostsChangeFeed(self.dsn)
+        self.assertTrue(feed.connect())
+        try:
+            self.conn.cursor().execute(
+                "INSERT INTO posts (status, agendado_para) VALUES ('agendado', now())"
+            )
+            self.assertTrue(feed.wait(5, threading.Event()))
+            self.conn.cursor().execute("UPDATE posts SET status = 'publicado'")
+            self.assertFalse(feed.wait(0.5, threading.Event()))
+        finally:
+            feed.close()
+
+
+@unittest.skipUnless(os.environ.get('TEST_POSTGRES_DSN'), 'TEST_POSTGRES_DSN não definido')
+class TestDuePostsPostgres(unittest.TestCase):
+    """Integração com um Postgres local: due_posts() com um backlog maior que a página."""
+
+    MIGRATION = os.path.join(
+        os.path.dirname(__file__), '..', 'supabase', 'migrations',
+        '20261018170000_due_posts_escalonamento.sql',
+    )
+
+    def setUp(self):
+        psycopg2 = __import__('psycopg2')
+        self.conn = psycopg2.connect(os.environ['TEST_POSTGRES_DSN'])
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        cur.execute('CREATE SCHEMA IF NOT EXISTS publish_test')
+        cur.execute('SET search_path TO publish_test')
+        cur.execute('DROP TABLE IF EXISTS posts')
+        cur.execute('CREATE TABLE posts (id serial primary key, status text, agendado_para timestamptz, '
+                    'proxima_tentativa_em timestamptz, avatar_id text, campanha_id text, '
+                    'prioridade smallint NOT NULL DEFAULT 0)')
+        with open(self.MIGRATION) as f:
+            cur.execute(f.read())
+
+    def tearDown(self):
+        self.conn.cursor().execute('DROP SCHEMA publish_test CASCADE')
+        self.conn.close()
+
+    def _due(self, limit):
+        cur = self.conn.cursor()
+        cur.execute('SELECT avatar_id, status FROM due_posts(%s)', (limit,))
+        return cur.fetchall()
+
+    def test_backlog_maior_que_a_pagina_nao_esconde_os_outros_avatares(self):
+        cur = self.conn.cursor()
+        cur.execute("INSERT INTO posts (status, agendado_para, avatar_id) "
+                    "SELECT 'agendado', now() - interval '3 days' + g * interval '1 minute', 'a1' "
+                    "FROM generate_series(1, 50) g")
+        cur.execute("INSERT INTO posts (status, agendado_para, avatar_id) VALUES "
+                    "('agendado', now() - interval '1 day', 'a2'), "
+                    "('agendado', now() - interval '1 day', 'a3')")
+        due = self._due(5)
+        self.assertEqual(len(due), 5)
+        self.assertEqual({a for a, _ in due}, {'a1', 'a2', 'a3'})
+        self.assertEqual(self._due(5), due)
+        self.assertEqual({s for _, s in due}, {'agendado'})
+
+    def test_ignora_nova_tentativa_ainda_por_vir(self):
+        self.conn.cursor().execute(
+            "INSERT INTO posts (status, agendado_para, proxima_tentativa_em, avatar_id) VALUES "
+            "('agendado', now() - interval '1 hour', now() + interval '1 hour', 'a1')"
+        )
+        self.assertEqual(self._due(5), [])
+
+
+# ── Testes: retry com backoff e circuit breaker ──────────────────────────
+class TestRetryAndCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.session = pub.PublishSession(pool_size=2, retry_policy=pub.RetryPolicy(attempts=2, base=0.01))
+        self.sleep = patch.object(pub.time, 'sleep').start()
+        pub.supabase = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+        for breaker in pub.breakers.values():
+            breaker.record_success()
+
+    @staticmethod
+    def _resp(status, retry_after=None):
+        headers = {'Retry-After': retry_after} if retry_after is not None else {}
+        return MagicMock(status_code=status, headers=headers)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(pub.parse_retry_after('7'), 7.0)
+        self.assertIsNone(pub.parse_retry_after('amanhã'))
+        self.assertIsNone(pub.parse_retry_after(None))
+        future = (pub.datetime.now(pub.timezone.utc) + pub.timedelta(seconds=30))
+        http_date = future.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        self.assertTrue(25 < pub.parse_retry_after(http_date) <= 30)
+
+    def test_backoff_com_jitter_limitado(self):
+        policy = pub.RetryPolicy(attempts=5, base=1, max_delay=10)
+        for attempt in range(6):
+            self.assertLessEqual(policy.delay(attempt), min(10, 2 ** attempt))
+        self.assertEqual(policy.delay(3, retry_after=4.5), 4.5)
+
+    def test_get_repete_5xx_e_respeita_retry_after(self):
+        with patch('requests.Session.request') as req:
+            req.side_effect = [self._resp(503, '3'), self._resp(200)]
+            r = self.session.get('https://graph.facebook.com/v19.0/me')
+        self.assertEqual(r.status_code, 200)
+        self.sleep.assert_called_once_with(3.0)
+
+    def test_desiste_apos_tentativas_e_devolve_ultima_resposta(self):
+        with patch('requests.Session.request') as req:
+            req.return_value = self._resp(502)
+            r = self.session.get('https://x')
+        self.assertEqual(r.status_code, 502)
+        self.assertEqual(req.call_count, 3)
+
+    def test_erro_permanente_nao_repete(self):
+        with patch('requests.Session.request') as req:
+            req.return_value = self._resp(400)
+            self.session.get('https://x')
+        self.assertEqual(req.call_count, 1)
+
+    def test_post_nao_repete_500_mas_repete_429(self):
+        with patch('requests.Session.request') as req:
+            req.return_value = self._resp(500)
+            self.session.post('https://x/media_publish')
+            self.assertEqual(req.call_count, 1)
+            req.reset_mock()
+            req.side_effect = [self._resp(429), self._resp(200)]
+            self.assertEqual(self.session.post('https://x/media_publish').status_code, 200)
+
+    def test_retry_after_demasiado_longo_nao_espera(self):
+        with patch('requests.Session.request') as req:
+            req.return_value = self._resp(429, '3600')
+            self.session.get('https://x')
+        self.assertEqual(req.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_erro_de_rede_repete_e_depois_propaga(self):
+        with patch('requests.Session.request', side_effect=pub.requests.ConnectionError('reset')) as req:
+            with self.assertRaises(pub.requests.ConnectionError):
+                self.session.get('https://x')
+        self.assertEqual(req.call_count, 3)
+
+    def test_retry_false_desliga_repeticoes(self):
+        with patch('requests.Session.request') as req:
+            req.return_value = self._resp(503)
+            self.session.put('https://upload', retry=False)
+        self.assertEqual(req.call_count, 1)
+
+    def test_circuito_abre_apos_limite_e_fecha_com_sucesso(self):
+        breaker = pub.CircuitBreaker('tiktok', threshold=2, cooldown=60)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertTrue(breaker.is_open)
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+    def test_circuito_meio_aberto_apos_cooldown(self):
+        breaker = pub.CircuitBreaker('tiktok', threshold=3, cooldown=0)
+        for _ in range(3):
+            breaker.record_failure()
+        self.assertFalse(breaker.is_open)        # cooldown acabou: deixa testar
+        self.assertTrue(breaker.record_failure())  # nova falha volta a abrir
+
+    def test_falhas_do_publisher_contam_para_a_sua_plataforma(self):
+        def flaky_tiktok(post):
+            return self.session.post('https://open.tiktokapis.com/v2/x').ok
+
+        with patch('requests.Session.request', return_value=MagicMock(status_code=503, ok=False, headers={})), \
+             patch.dict(pub.PUBLISHERS, {'tiktok': flaky_tiktok}), \
+             patch.dict(pub.breakers, {'tiktok': pub.CircuitBreaker('tiktok', threshold=2)}):
+            posts = [{'id': f'p{i}', 'plataformas': ['tiktok']} for i in range(5)]
+            with patch.object(pub, 'PLATFORM_LIMITS', {'tiktok': 1}):
+                pub.publish_posts(posts)
+            # 2 falhas abrem o circuito; os restantes posts nem chegam a chamar a API
+            self.assertTrue(pub.breakers['tiktok'].is_open)
+        self.assertFalse(pub.breakers['instagram'].is_open)
+
+    def test_falhas_de_media_e_de_estado_nao_abrem_o_circuito(self):
+        breaker = pub.CircuitBreaker('youtube', threshold=1)
+        session = pub.PublishSession(pool_size=1, retry_policy=pub.RetryPolicy(attempts=0))
+        with patch('requests.Session.request', return_value=self._resp(503)), \
+             patch.dict(pub.breakers, {'youtube': breaker, 'tiktok': breaker}):
+            pub.run_in_context('youtube', session.get, 'https://cdn.example.com/video.mp4')
+            pub.run_in_context('tiktok', session.post, pub.TIKTOK_STATUS_URL, rate_scope='tiktok_status')
+            self.assertFalse(breaker.is_open)
+            pub.run_in_context('youtube', session.get, 'https://www.googleapis.com/youtube/v3/videos')
+            self.assertTrue(breaker.is_open)
+
+    def test_circuito_aberto_salta_plataforma_mas_nao_as_outras(self):
+        calls = []
+        open_breaker = pub.CircuitBreaker('youtube', threshold=1)
+        open_breaker.record_failure()
+        with patch.dict(pub.breakers, {'youtube': open_breaker}), \
+             patch.dict(pub.PUBLISHERS, {
+                 'youtube':  lambda post: calls.append('youtube') or True,
+                 'facebook': lambda post: calls.append('facebook') or True,
+             }):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['youtube', 'facebook']}])
+        self.assertEqual(calls, ['facebook'])
+        self.assertEqual((published, errors), (1, 0))
+
+
+# ── Testes: fila de novas tentativas entre runs ──────────────────────────
+class TestRetryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+
+    def _update(self):
+        return self.supa.table.return_value.update.call_args[0][0]
+
+    def test_primeira_falha_volta_a_agendado_com_backoff(self):
+        before = datetime.now(timezone.utc)
+        pub.fail_post({'id': 'p1', 'plataformas': ['tiktok']}, 'HTTP 500')
+        data = self._update()
+        self.assertEqual(data['status'], 'agendado')
+        self.assertEqual(data['tentativas'], 1)
+        self.assertEqual(data['error_msg'], 'HTTP 500')
+        next_at = datetime.fromisoformat(data['proxima_tentativa_em'])
+        self.assertGreaterEqual(next_at - before, timedelta(seconds=pub.RETRY_QUEUE_BASE * 0.9))
+
+    def test_backoff_duplica_e_tem_tecto(self):
+        with patch.object(pub.random, 'uniform', return_value=1.0):
+            self.assertEqual(pub.retry_delay(1), pub.RETRY_QUEUE_BASE)
+            self.assertEqual(pub.retry_delay(3), pub.RETRY_QUEUE_BASE * 4)
+            self.assertEqual(pub.retry_delay(50), pub.RETRY_QUEUE_MAX)
+
+    def test_esgota_tentativas_e_passa_a_erro(self):
+        pub.fail_post({'id': 'p1', 'tentativas': pub.MAX_ATTEMPTS - 1}, 'HTTP 500')
+        data = self._update()
+        self.assertEqual(data['status'], 'erro')
+        self.assertEqual(data['tentativas'], pub.MAX_ATTEMPTS)
+        self.assertIsNone(data['proxima_tentativa_em'])
+        self.assertIn(f'{pub.MAX_ATTEMPTS} tentativas', data['error_msg'])
+
+    def _publish_facebook(self, status):
+        post = {'id': 'p1', 'plataformas': ['facebook'], 'legenda': 'Olá', 'tentativas': 0}
+        resp = MagicMock(status_code=status, ok=False, headers={}, text='{"error": {}}')
+        with patch.object(pub, 'FACEBOOK_TOKEN', 'fb-token'), \
+             patch('requests.Session.request', return_value=resp):
+            return pub.publish_posts([post])
+
+    def test_400_da_graph_vai_logo_para_erro(self):
+        self.assertEqual(self._publish_facebook(400), (0, 1))
+        data = self._update()
+        self.assertEqual((data['status'], data['tentativas']), ('erro', 1))
+        self.assertIsNone(data['proxima_tentativa_em'])
+        self.assertEqual(data['error_msg'], 'facebook: HTTP 400')
+
+    def test_500_da_graph_volta_a_agendado(self):
+        self.assertEqual(self._publish_facebook(500), (0, 1))
+        data = self._update()
+        self.assertEqual((data['status'], data['tentativas']), ('agendado', 1))
+        self.assertIsNotNone(data['proxima_tentativa_em'])
+
+    def test_token_em_falta_nao_e_repetido(self):
+        with patch.object(pub, 'FACEBOOK_TOKEN', ''):
+            pub.publish_posts([{'id': 'p1', 'plataformas': ['facebook'], 'tentativas': 0}])
+        self.assertEqual(self._update()['status'], 'erro')
+
+    def test_plataforma_sem_suporte_nao_e_repetida(self):
+        published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['myspace']}])
+        self.assertEqual((published, errors), (0, 1))
+        self.assertEqual(self._update()['status'], 'erro')
+
+    def test_cursor_keyset_inclui_filtro_de_tentativas_em_cada_ramo(self):
+        pub.get_due_posts_page(after=('2026-01-01T00:00:00+00:00', 'id9'))
+        query = self.supa.table.return_value.select.return_value.eq.return_value.lte.return_value
+        cursor = query.or_.call_args[0][0]
+        self.assertEqual(cursor.count('or(proxima_tentativa_em.is.null'), 2)
+
+    def test_seconds_until_next_due_considera_proxima_tentativa(self):
+        soon = (datetime.now(timezone.utc) + timedelta(seconds=10)).isoformat()
+        later = (datetime.now(timezone.utc) + timedelta(seconds=50)).isoformat()
+        chain = self.supa.table.return_value.select.return_value.eq.return_value.gt.return_value
+        execute = chain.order.return_value.limit.return_value.execute
+        execute.side_effect = [MagicMock(data=[{'agendado_para': later}]),
+                               MagicMock(data=[{'proxima_tentativa_em': soon}])]
+        self.assertLessEqual(pub.seconds_until_next_due(60), 10)
+
+
+# ── Testes: limite de ritmo por plataforma/token ─────────────────────────
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.sleep = patch.object(pub.time, 'sleep').start()
+        self.clock = patch.object(pub.time, 'monotonic', return_value=1000.0).start()
+        pub._rate_limiters.clear()
+
+    def tearDown(self):
+        patch.stopall()
+        pub._rate_limiters.clear()
+        pub._publish_context.platform = None
+
+    @staticmethod
+    def _resp(status=200, headers=None, text=''):
+        return MagicMock(status_code=status, headers=headers or {}, text=text)
+
+    def test_rajada_ate_capacidade_e_depois_espera(self):
+        limiter = pub.RateLimiter('tiktok', rate=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.sleep.assert_not_called()
+        limiter.acquire()
+        self.sleep.assert_called_once_with(30.0)   # 2/min → 1 token a cada 30s
+
+    def test_repoe_tokens_com_o_tempo(self):
+        limiter = pub.RateLimiter('tiktok', rate=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.clock.return_value += 30
+        limiter.acquire()
+        self.sleep.assert_not_called()
+
+    def test_espera_demasiado_longa_falha_sem_gastar_token(self):
+        limiter = pub.RateLimiter('tiktok', rate=1)
+        limiter.acquire()
+        with self.assertRaises(pub.RateLimitExceeded):
+            limiter.acquire(max_wait=10)
+        self.assertEqual(limiter.tokens, 0)
+
+    def test_uso_alto_abranda_e_uso_critico_pausa(self):
+        limiter = pub.RateLimiter('facebook', rate=60)
+        limiter.observe_usage(50)
+        self.assertEqual(limiter.factor, 1.0)
+        limiter.observe_usage(85)
+        self.assertLess(limiter.factor, 1.0)
+        self.assertLessEqual(limiter.tokens, limiter.capacity)
+        limiter.observe_usage(99, regain=120)
+        self.assertEqual(limiter.factor, pub.RATE_MIN_FACTOR)
+        with self.assertRaises(pub.RateLimitExceeded):
+            limiter.acquire(max_wait=60)
+
+    def test_le_headers_de_uso_da_graph_api(self):
+        resp = self._resp(headers={
+            'X-App-Usage': json.dumps({'call_count': 40, 'total_cputime': 10, 'total_time': 12}),
+            'X-Business-Use-Case-Usage': json.dumps({'123': [{
+                'type': 'instagram', 'call_count': 88, 'total_cputime': 5,
+                'total_time': 7, 'estimated_time_to_regain_access': 3,
+            }]}),
+        })
+        self.assertEqual(pub.platform_usage(resp), (88, 180))
+        self.assertEqual(pub.platform_usage(self._resp(headers={'X-App-Usage': 'lixo'})), (None, None))
+
+    def test_token_do_pedido(self):
+        self.assertEqual(pub.request_token({'params': {'access_token': 'a'}}), 'a')
+        self.assertEqual(pub.request_token({'data': {'access_token': 'b'}}), 'b')
+        self.assertEqual(pub.request_token({'headers': {'Authorization': 'Bearer c'}}), 'c')
+        self.assertIsNone(pub.request_token({'headers': {'Content-Range': 'bytes 0-1/2'}}))
+
+    def test_limiter_partilhado_por_plataforma_e_token(self):
+        pub._publish_context.platform = 'instagram'
+        a = pub.current_limiter({'params': {'access_token': 'tok'}})
+        b = pub.current_limiter({'data': {'access_token': 'tok'}})
+        c = pub.current_limiter({'data': {'access_token': 'outro'}})
+        self.assertIs(a, b)
+        self.assertIsNot(a, c)
+        self.assertIsNone(pub.current_limiter({'data': {}}))
+        pub._publish_context.platform = None
+        self.assertIsNone(pub.current_limiter({'params': {'access_token': 'tok'}}))
+
+    def test_session_aplica_headers_de_uso_ao_limiter(self):
+        session = pub.PublishSession(pool_size=1)
+        pub._publish_context.platform = 'facebook'
+        usage = json.dumps({'call_count': 90, 'total_cputime': 0, 'total_time': 0})
+        with patch('requests.Session.request', return_value=self._resp(headers={'X-App-Usage': usage})):
+            session.post('https://graph.facebook.com/v19.0/me/feed', data={'access_token': 'fb'})
+        limiter = pub.get_rate_limiter('facebook', 'fb')
+        self.assertLess(limiter.factor, 0.5)
+
+    def test_quota_youtube_pausa_o_token(self):
+        session = pub.PublishSession(pool_size=1, retry_policy=pub.RetryPolicy(attempts=0))
+        pub._publish_context.platform = 'youtube'
+        resp = self._resp(403, text='{"error": {"errors": [{"reason": "quotaExceeded"}]}}')
+        with patch('requests.Session.request', return_value=resp):
+            session.post('https://www.googleapis.com/upload/youtube/v3/videos',
+                         headers={'Authorization': 'Bearer yt'})
+        limiter = pub.get_rate_limiter('youtube', 'yt')
+        self.assertEqual(limiter.paused_until, 1000.0 + pub.RATE_PAUSE_SECONDS)
+
+    def test_429_espera_so_a_pausa_do_limiter(self):
+        session = pub.PublishSession(pool_size=1)
+        pub._publish_context.platform = 'facebook'
+        with patch('requests.Session.request', side_effect=[
+                self._resp(429, headers={'Retry-After': '7'}), self._resp(200)]):
+            session.get('https://graph.facebook.com/v19.0/me', params={'access_token': 'fb'})
+        # sem o sleep do RetryPolicy por cima da pausa: uma só espera de 7s
+        self.sleep.assert_called_once_with(7.0)
+
+
+# ── Testes: estado por (post, plataforma) ────────────────────────────────
+class TestPlatformState(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+
+    def tearDown(self):
+        pub.write_buffer = None
+
+    def _already(self, rows):
+        chain = self.supa.table.return_value.select.return_value.eq.return_value.in_.return_value
+        chain.execute.return_value = MagicMock(data=rows)
+
+    def _states(self):
+        upsert = self.supa.table.return_value.upsert
+        return {(c[0][0]['plataforma'], c[0][0]['status']) for c in upsert.call_args_list}
+
+    def test_salta_plataformas_ja_publicadas(self):
+        self._already([{'post_id': 'p1', 'plataforma': 'instagram'}])
+        instagram, youtube = MagicMock(return_value=True), MagicMock(return_value=True)
+        with patch.dict(pub.PUBLISHERS, {'instagram': instagram, 'youtube': youtube}):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram', 'youtube']}])
+        self.assertEqual((published, errors), (1, 0))
+        instagram.assert_not_called()
+        youtube.assert_called_once()
+
+    def test_todas_ja_publicadas_marca_publicado_sem_chamadas(self):
+        self._already([{'post_id': 'p1', 'plataforma': 'facebook'}])
+        facebook = MagicMock(return_value=True)
+        with patch.dict(pub.PUBLISHERS, {'facebook': facebook}):
+            published, _ = pub.publish_posts([{'id': 'p1', 'plataformas': ['facebook']}])
+        self.assertEqual(published, 1)
+        facebook.assert_not_called()
+        self.assertEqual(self.supa.table.return_value.update.call_args[0][0]['status'], 'publicado')
+
+    def test_grava_estado_de_cada_plataforma(self):
+        self._already([])
+        with patch.dict(pub.PUBLISHERS, {'instagram': lambda post: True, 'tiktok': lambda post: False}):
+            pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram', 'tiktok']}])
+        self.assertEqual(self._states(), {('instagram', 'publicado'), ('tiktok', 'erro')})
+        upsert = self.supa.table.return_value.upsert
+        self.assertEqual(upsert.call_args[1], {'on_conflict': 'post_id,plataforma'})
+
+    def test_excepcao_fica_no_error_msg_da_plataforma(self):
+        self._already([])
+
+        def boom(post):
+            raise RuntimeError('timeout')
+
+        with patch.dict(pub.PUBLISHERS, {'tiktok': boom}):
+            pub.publish_posts([{'id': 'p1', 'plataformas': ['tiktok']}])
+        row = self.supa.table.return_value.upsert.call_args[0][0]
+        self.assertEqual((row['status'], row['error_msg']), ('erro', 'timeout'))
+
+    def test_leitura_falhada_publica_todas(self):
+        chain = self.supa.table.return_value.select.return_value.eq.return_value.in_.return_value
+        chain.execute.side_effect = RuntimeError('relation does not exist')
+        self.assertEqual(pub.published_platforms(['p1']), {})
+
+    def test_buffer_grava_estados_antes_do_status_do_post(self):
+        buf = pub.WriteBuffer(max_rows=100, interval=0)
+        pub.write_buffer = buf
+        pub.mark_platform('p1', 'instagram', 'publicado')
+        pub.mark_platform('p1', 'instagram', 'publicado')   # deduplicado por (post, plataforma)
+        pub.mark_post('p1', 'agendado')
+        self.supa.table.assert_not_called()
+        buf.close()
+        tables = [c[0][0] for c in self.supa.table.call_args_list]
+        self.assertEqual(tables, ['post_plataformas', 'posts'])
+        self.assertEqual(len(self.supa.table.return_value.upsert.call_args[0][0]), 1)
+
+
+# ── Testes: prazo da run e custo estimado ────────────────────────────────
+class TestRunBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        pub.write_buffer = None
+
+    def tearDown(self):
+        pub.run_budget = None
+
+    def _budget(self, remaining, grace=5):
+        budget = pub.RunBudget(600, grace=grace)
+        budget.deadline = time.monotonic() + remaining
+        return budget
+
+    def _platform_rows(self):
+        return [c[0][0] for c in self.supa.table.return_value.upsert.call_args_list]
+
+    def _post_updates(self):
+        return [c[0][0] for c in self.supa.table.return_value.update.call_args_list]
+
+    def test_custo_por_omissao_sem_historico(self):
+        base, per_mb = pub.DEFAULT_JOB_COSTS['youtube']
+        self.assertEqual(pub.JobCostModel().estimate('youtube', 100 * pub.MB), base + per_mb * 100)
+
+    def test_recta_ajustada_as_duracoes_por_tamanho(self):
+        costs = pub.JobCostModel()
+        for mb in range(1, 11):
+            costs.observe('youtube', 5 + 2 * mb, mb * pub.MB)
+        self.assertAlmostEqual(costs.estimate('youtube', 20 * pub.MB), 45, places=6)
+        self.assertAlmostEqual(costs.estimate('youtube'), 5 + 2 * 5.5, places=6)   # tamanho mediano
+
+    def test_load_le_historico_de_post_plataformas(self):
+        chain = (self.supa.table.return_value.select.return_value.eq.return_value
+                 .gte.return_value.order.return_value.limit.return_value)
+        chain.execute.return_value = MagicMock(data=[
+            {'plataforma': 'facebook', 'duracao_ms': 2000, 'media_bytes': None}] * 5)
+        costs = pub.JobCostModel().load()
+        self.supa.table.assert_called_with('post_plataformas')
+        self.assertEqual(costs.estimate('facebook'), 2.0)
+
+    def test_load_com_erro_usa_custos_por_omissao(self):
+        self.supa.table.side_effect = RuntimeError('column "duracao_ms" does not exist')
+        self.assertEqual(pub.JobCostModel().load().estimate('tiktok'),
+                         pub.DEFAULT_JOB_COSTS['tiktok'][0])
+
+    def test_plataforma_sem_tempo_fica_para_a_proxima_run(self):
+        pub.run_budget = self._budget(remaining=10)   # facebook (5s) cabe, youtube (15s) não
+        youtube = MagicMock(return_value=True)
+        with patch.dict(pub.PUBLISHERS, {'facebook': lambda post: True, 'youtube': youtube}):
+            totals = pub.publish_posts([{'id': 'p1', 'plataformas': ['facebook', 'youtube'], 'tentativas': 1}])
+        self.assertEqual(totals, (0, 0))
+        youtube.assert_not_called()
+        [row] = self._platform_rows()
+        self.assertEqual((row['plataforma'], row['status']), ('facebook', 'publicado'))
+        self.assertIsNotNone(row['duracao_ms'])
+        [update] = self._post_updates()
+        self.assertEqual(update['status'], 'agendado')
+        self.assertIn('youtube', update['error_msg'])
+        self.assertNotIn('tentativas', update)   # adiar não gasta tentativas
+
+    def test_chamada_que_nao_para_deixa_o_post_intocado(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        budget = pub.run_budget = self._budget(remaining=600, grace=0.1)
+        threading.Timer(0.1, budget.stop).start()
+        started = time.monotonic()
+        posts = [{'id': 'p1', 'plataformas': ['youtube']}, {'id': 'p2', 'plataformas': ['youtube']}]
+        with patch.dict(pub.PUBLISHERS, {'youtube': lambda post: release.wait(30)}), \
+             patch.dict(pub.PLATFORM_LIMITS, {'youtube': 1}):
+            pub.publish_posts(posts)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(budget.stranded, 1)
+        # p1 ainda pode ser publicado pela chamada abandonada: nem estado nem requeue
+        self.assertEqual(self._platform_rows(), [])
+        [update] = self._post_updates()
+        self.assertEqual(update['status'], 'agendado')
+        self.supa.table.return_value.update.return_value.eq.assert_called_once_with('id', 'p2')
+
+    def test_upload_youtube_para_entre_blocos_e_guarda_sessao(self):
+        pub.run_budget = self._budget(remaining=600)
+        progress = []
+
+        def put(url, **kw):
+            pub.run_budget.deadline = time.monotonic()   # o prazo acaba durante o 1.º bloco
+            return MagicMock(status_code=308, headers={'Range': 'bytes=0-3'})
+
+        with patch.object(pub.http, 'put', side_effect=put) as mock_put:
+            result = pub.youtube_upload_stream('https://upload', iter([b'abcd', b'efgh']), 'video/mp4', 8,
+                                               on_progress=progress.append)
+        self.assertIsInstance(result, pub.PostponedPublish)
+        self.assertEqual(mock_put.call_count, 1)
+        self.assertEqual(progress, [4])
+
+    def test_publisher_adiado_volta_a_fila_sem_erro(self):
+        pub.run_budget = self._budget(remaining=600)
+        postponed = pub.PostponedPublish('youtube', 'upload parado no byte 4')
+        with patch.dict(pub.PUBLISHERS, {'youtube': lambda post: postponed}):
+            self.assertEqual(pub.publish_posts([{'id': 'p1', 'plataformas': ['youtube']}]), (0, 0))
+        self.assertEqual(self._platform_rows(), [])
+        [update] = self._post_updates()
+        self.assertEqual(update['status'], 'agendado')
+
+    def test_estimativa_sem_tecto_excepto_uploads_resumiveis(self):
+        budget = self._budget(remaining=100)
+        with patch.dict(pub.DEFAULT_JOB_COSTS, {'instagram': (200, 0), 'youtube': (50, 1.0)}):
+            self.assertFalse(budget.fits('instagram'))
+            # 2 GB não cabem, mas o arranque e o primeiro bloco sim
+            self.assertTrue(budget.fits('youtube', 2048 * pub.MB))
+
+    def test_run_cycle_nao_le_paginas_sem_tempo(self):
+        pub.run_budget = self._budget(remaining=1)
+        pages = iter([[{'id': 'p1', 'plataformas': ['facebook']}]])
+        self.assertEqual(pub.run_cycle(pages), (0, 0, 0))
+        self.assertIsNotNone(next(pages, None))   # página não lida (nem reservada)
+
+    def test_segundo_sinal_sai_de_imediato(self):
+        budget = pub.run_budget = self._budget(remaining=600)
+        pub._stop_on_signal(signal.SIGTERM, None)
+        self.assertTrue(budget.stopped and budget.expired())
+        with self.assertRaises(SystemExit) as cm:
+            pub._stop_on_signal(signal.SIGTERM, None)
+        self.assertEqual(cm.exception.code, 128 + signal.SIGTERM)
+
+    def test_main_com_sigterm_grava_estado_e_sai(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        previous = signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+        posts = [{'id': 'p1', 'plataformas': ['tiktok']}, {'id': 'p2', 'plataformas': ['facebook']}]
+        with patch.object(pub, 'get_due_posts', return_value=posts), \
+             patch.object(pub, 'CHECKPOINT_GRACE', 0.1), \
+             patch.dict(pub.PUBLISHERS, {'tiktok': lambda post: release.wait(30),
+                                         'facebook': lambda post: release.wait(30)}), \
+             patch.object(pub.os, '_exit', side_effect=SystemExit) as hard_exit:
+            timer.start()
+            with self.assertRaises(SystemExit):
+                pub.main()
+        hard_exit.assert_called_once_with(0)   # sem esperar pelas threads abandonadas
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+        self.assertIsNone(pub.run_budget)
+        self.supa.table.return_value.upsert.assert_not_called()
+
+
+# ── Testes: Reels em duas fases (container → media_publish) ──────────────
+class TestInstagramContainerPolling(unittest.TestCase):
+
+    def setUp(self):
+        pub.supabase = MagicMock()
+        pub.INSTAGRAM_TOKEN = 'ig-token'
+        self.sleep = patch.object(pub.time, 'sleep').start()
+
+    def tearDown(self):
+        patch.stopall()
+        pub.INSTAGRAM_TOKEN = ''
+
+    def test_consulta_varios_containers_numa_chamada(self):
+        body = {
+            'c1': {'id': 'c1', 'status_code': 'FINISHED'},
+            'c2': {'id': 'c2', 'status_code': 'IN_PROGRESS'},
+            'c3': {'id': 'c3', 'status_code': 'ERROR', 'status': 'Error: 2207026'},
+        }
+        with patch.object(pub.http, 'get') as mock_get:
+            mock_get.return_value = MagicMock(ok=True, json=lambda: body)
+            states = pub.poll_instagram_containers(['c1', 'c2', 'c3'])
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args[1]['params']['ids'], 'c1,c2,c3')
+        self.assertIs(states['c1'], True)
+        self.assertIsNone(states['c2'])
+        self.assertIn('ERROR', states['c3'])
+
+    def test_divide_em_lotes(self):
+        ids = [f'c{i}' for i in range(pub.IG_CONTAINER_BATCH + 1)]
+        with patch.object(pub.http, 'get') as mock_get:
+            mock_get.return_value = MagicMock(ok=True, json=lambda: {})
+            pub.poll_instagram_containers(ids)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @staticmethod
+    def _pending(key, poll, complete=lambda: True, timeout=60, interval=0):
+        return pub.PendingPublish('instagram', key, poll=poll, complete=complete,
+                                  interval=interval, timeout=timeout)
+
+    def test_publica_cada_um_quando_fica_pronto(self):
+        calls = []
+
+        def poll(keys):
+            calls.append(list(keys))
+            return {'c1': True, 'c2': None} if len(calls) == 1 else {k: True for k in keys}
+
+        posts = [{'id': 'p1', 'plataformas': ['instagram']}, {'id': 'p2', 'plataformas': ['instagram']}]
+        publisher = lambda post: self._pending('c' + post['id'][1], poll, interval=0.2)
+        with patch.dict(pub.PUBLISHERS, {'instagram': publisher}):
+            published, errors = pub.publish_posts(posts)
+        self.assertEqual((published, errors), (2, 0))
+        self.assertEqual(sorted(calls[0]), ['c1', 'c2'])   # um poll para todos
+        self.assertEqual(calls[1], ['c2'])
+
+    def test_container_com_erro_falha_a_plataforma(self):
+        complete = MagicMock(return_value=True)
+        pending  = self._pending('c1', lambda keys: {'c1': 'container ERROR'}, complete)
+        with patch.dict(pub.PUBLISHERS, {'instagram': lambda post: pending}):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram']}])
+        self.assertEqual((published, errors), (0, 1))
+        complete.assert_not_called()
+
+    def test_completar_respeita_o_limite_da_plataforma(self):
+        lock, active, peak = threading.Lock(), [0], [0]
+
+        def slow_call(result, seconds=0.0):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            threading.Event().wait(seconds)
+            with lock:
+                active[0] -= 1
+            return result
+
+        pending   = self._pending('c1', lambda keys: {'c1': True}, complete=lambda: slow_call(True))
+        publisher = lambda post: pending if post['id'] == 'p1' else slow_call(True, 0.2)
+        posts     = [{'id': 'p1', 'plataformas': ['instagram']}, {'id': 'p2', 'plataformas': ['instagram']}]
+        with patch.dict(pub.PUBLISHERS, {'instagram': publisher}), \
+             patch.dict(pub.PLATFORM_LIMITS, {'instagram': 1}):
+            self.assertEqual(pub.publish_posts(posts), (2, 0))
+        self.assertEqual(peak[0], 1)   # o media_publish esperou pela vez do p2
+
+    def test_completar_com_circuito_aberto_falha_a_plataforma(self):
+        breaker  = pub.breakers['instagram']
+        complete = MagicMock(return_value=True)
+
+        def poll(keys):
+            breaker.opened_at = time.monotonic()   # abriu enquanto o container processava
+            return {'c1': True}
+
+        self.addCleanup(breaker.record_success)
+        pending = self._pending('c1', poll, complete)
+        with patch.dict(pub.PUBLISHERS, {'instagram': lambda post: pending}):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram']}])
+        self.assertEqual((published, errors), (0, 1))
+        complete.assert_not_called()
+
+    @staticmethod
+    def _budget(allows):
+        budget = MagicMock(stranded=0)
+        budget.abandon.return_value = False
+        budget.fits.side_effect     = [True, False]   # depois da 1.ª chamada já não cabe uma publicação inteira
+        budget.allows.return_value  = allows          # cabe (ou não) um pedido
+        return budget
+
+    def test_container_pronto_no_fim_do_prazo_e_publicado(self):
+        budget   = self._budget(allows=True)
+        complete = MagicMock(return_value=True)
+        pending  = self._pending('c1', lambda keys: {'c1': True}, complete)
+        with patch.object(pub, 'run_budget', budget), \
+             patch.dict(pub.PUBLISHERS, {'instagram': lambda post: pending}):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram']}])
+        self.assertEqual((published, errors), (1, 0))
+        complete.assert_called_once()
+        budget.allows.assert_called_once_with(pub.HTTP_TIMEOUT[1])
+
+    def test_completar_sem_tempo_fica_para_a_proxima_run(self):
+        budget   = self._budget(allows=False)
+        complete = MagicMock(return_value=True)
+        pending  = self._pending('c1', lambda keys: {'c1': True}, complete)
+        with patch.object(pub, 'run_budget', budget), \
+             patch.dict(pub.PUBLISHERS, {'instagram': lambda post: pending}):
+            published, errors = pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram']}])
+        self.assertEqual((published, errors), (0, 0))
+        complete.assert_not_called()
+        update = pub.supabase.table.return_value.update.call_args[0][0]
+        self.assertEqual(update['status'], 'agendado')
+
+    def test_prazo_esgotado_falha_a_plataforma(self):
+        pending = self._pending('c1', lambda keys: {'c1': None}, timeout=-1)
+        ready, failed, waiting = pub.poll_pending([(pending, {'id': 'p1'})])
+        self.assertEqual((ready, waiting), ([], []))
+        self.assertEqual(failed[0][2], 'Tempo de processamento esgotado')
+
+    def test_erro_no_poll_mantem_a_espera(self):
+        def poll(keys):
+            raise RuntimeError('rede')
+        pending = self._pending('c1', poll)
+        ready, failed, waiting = pub.poll_pending([(pending, {'id': 'p1'})])
+        self.assertEqual(len(waiting), 1)
+
+
+# ── Testes: estado das publicações TikTok ────────────────────────────────
+class TestTikTokStatusTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        pub.TIKTOK_TOKEN = 'tt-token'
+
+    def tearDown(self):
+        pub.TIKTOK_TOKEN = ''
+        pub.tiktok_tracker = None
+        pub.write_buffer = None
+
+    @staticmethod
+    def _status(data):
+        return MagicMock(ok=True, json=lambda: {'data': data, 'error': {'code': 'ok'}})
+
+    def _updates(self):
+        return [c[0][0] for c in self.supa.table.return_value.update.call_args_list]
+
+    def test_publish_tiktok_grava_processando_e_regista_no_tracker(self):
+        tracker = pub.TikTokStatusTracker()
+        pub.tiktok_tracker = tracker
+        with patch.object(pub.http, 'post') as mock_post:
+            mock_post.return_value = MagicMock(ok=True, json=lambda: {
+                'data': {'publish_id': 'pub_1'}, 'error': {'code': 'ok'}})
+            self.assertTrue(pub.publish_tiktok({'id': 'p1', 'video_url': 'http://vid.mp4'}))
+        row = self.supa.table.return_value.insert.call_args[0][0]
+        self.assertEqual((row['estado'], row['post_id_social']), ('processando', 'pub_1'))
+        self.assertEqual(tracker.pending, 1)
+
+    def test_publish_complete_grava_id_e_url_finais(self):
+        tracker = pub.TikTokStatusTracker()
+        tracker.track('pub_1', 'p1')
+        tracker.track('pub_2', 'p2')
+        responses = {
+            'pub_1': self._status({'status': 'PUBLISH_COMPLETE', 'publicaly_available_post_id': [7300]}),
+            'pub_2': self._status({'status': 'PROCESSING_DOWNLOAD'}),
+        }
+
+        def post(url, json=None, **kw):
+            if url == pub.TIKTOK_CREATOR_URL:
+                return MagicMock(ok=True, json=lambda: {'data': {'creator_username': 'avatar'}})
+            return responses[json['publish_id']]
+
+        with patch.object(pub.http, 'post', side_effect=post):
+            tracker.poll_once()
+        self.assertEqual(self._updates(), [{
+            'estado': 'publicado', 'post_id_social': '7300',
+            'url_post': 'https://www.tiktok.com/@avatar/video/7300',
+        }])
+        self.supa.table.return_value.update.return_value.eq.return_value.eq.assert_called_with(
+            'post_id_social', 'pub_1')
+        self.assertEqual(tracker.pending, 1)   # pub_2 continua pendente
+
+    def test_failed_marca_erro_na_plataforma(self):
+        tracker = pub.TikTokStatusTracker()
+        tracker.track('pub_1', 'p1')
+        with patch.object(pub.http, 'post', return_value=self._status(
+                {'status': 'FAILED', 'fail_reason': 'file_format_check_failed'})):
+            tracker.poll_once()
+        self.assertEqual(self._updates()[0], {'estado': 'falhou', 'erro': 'file_format_check_failed'})
+        state = self.supa.table.return_value.upsert.call_args[0][0]
+        self.assertEqual((state['plataforma'], state['status']), ('tiktok', 'erro'))
+        self.assertEqual(tracker.pending, 0)
+
+    def test_erro_de_rede_mantem_pendente(self):
+        tracker = pub.TikTokStatusTracker()
+        tracker.track('pub_1', 'p1')
+        with patch.object(pub.http, 'post', side_effect=pub.requests.ConnectionError('reset')):
+            tracker.poll_once()
+        self.assertEqual(tracker.pending, 1)
+        self.supa.table.return_value.update.assert_not_called()
+
+    def test_intervalo_cresce_por_publish_id(self):
+        tracker = pub.TikTokStatusTracker(interval=10, max_interval=20)
+        tracker.track('pub_1', 'p1')
+        with patch.object(pub.http, 'post', return_value=self._status(
+                {'status': 'PROCESSING_UPLOAD'})) as mock_post:
+            tracker.poll_once()
+            tracker.track('pub_2', 'p2')
+            tracker.poll_once()   # pub_1 só volta daqui a 10 s; pub_2 é novo
+            self.assertEqual([c.kwargs['json']['publish_id'] for c in mock_post.call_args_list],
+                             ['pub_1', 'pub_2'])
+        self.assertEqual(tracker._schedule['pub_1'][1], 15)
+        tracker._schedule['pub_1'] = (0, 15)
+        with patch.object(pub.http, 'post', return_value=self._status({'status': 'PROCESSING_UPLOAD'})):
+            tracker.poll_once()
+        self.assertEqual(tracker._schedule['pub_1'][1], 20)   # tecto max_interval
+        self.assertEqual(tracker.pending, 2)
+
+    def test_consulta_de_estado_tem_bucket_proprio(self):
+        kwargs = {'headers': {'Authorization': 'Bearer tt-token'}}
+        init   = pub.run_in_context('tiktok', pub.current_limiter, kwargs)
+        status = pub.run_in_context('tiktok', pub.current_limiter, kwargs, rate_scope='tiktok_status')
+        self.assertEqual((init.name, status.name), ('tiktok', 'tiktok_status'))
+        self.assertEqual(status.rate, pub.RATE_LIMITS['tiktok_status'])
+        self.assertIsNone(pub.current_limiter(kwargs))   # contexto limpo à saída
+
+    def test_retoma_pendentes_de_runs_anteriores(self):
+        chain = (self.supa.table.return_value.select.return_value
+                 .eq.return_value.eq.return_value.gte.return_value)
+        chain.execute.return_value = MagicMock(data=[{'post_id': 'p1', 'post_id_social': 'pub_9'}])
+        tracker = pub.TikTokStatusTracker()
+        tracker.load_pending()
+        self.assertEqual(tracker.pending, 1)
+
+    def test_em_modo_claim_so_retoma_os_pendentes_reservados(self):
+        self.supa.rpc.return_value.execute.return_value = MagicMock(
+            data=[{'post_id': 'p1', 'post_id_social': 'pub_9'}])
+        tracker = pub.TikTokStatusTracker()
+        with patch.object(pub, 'CLAIM_MODE', True), patch.object(pub, 'WORKER_ID', 'w1'):
+            tracker.load_pending()
+        self.supa.table.assert_not_called()
+        name, params = self.supa.rpc.call_args[0]
+        self.assertEqual((name, params['p_worker']), ('claim_tiktok_pending', 'w1'))
+        self.assertEqual(tracker.pending, 1)
+
+    def test_em_modo_claim_publicacao_processando_fica_reservada(self):
+        with patch.object(pub, 'CLAIM_MODE', True), patch.object(pub, 'WORKER_ID', 'w1'):
+            pub.save_published({'id': 'p1'}, 'tiktok', 'pub_9', state='processando')
+            pub.save_published({'id': 'p2'}, 'tiktok', 'v_2')
+        rows = [c[0][0] for c in self.supa.table.return_value.insert.call_args_list]
+        self.assertEqual(rows[0]['lease_worker'], 'w1')
+        self.assertIsNotNone(rows[0]['lease_expira_em'])
+        self.assertNotIn('lease_worker', rows[1])
+
+    def test_close_espera_pelos_pendentes_ate_ao_limite(self):
+        tracker = pub.TikTokStatusTracker(interval=0.01)
+        with patch.object(tracker, 'load_pending'):
+            tracker.start()
+        tracker.track('pub_1', 'p1')
+        with patch.object(pub.http, 'post', return_value=self._status({'status': 'PROCESSING_UPLOAD'})):
+            started = time.monotonic()
+            tracker.close(timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(tracker.pending, 1)
+
+
+# ── Testes: cache de media em disco ──────────────────────────────────────
+class TestMediaCache(unittest.TestCase):
+
+    URL = 'https://cdn.example.com/video.mp4'
+
+    def setUp(self):
+        self.tmp   = tempfile.TemporaryDirectory()
+        self.cache = pub.MediaCache(self.tmp.name, max_bytes=1024)
+
+    def tearDown(self):
+        pub.media_cache = None
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _resp(body=b'', status=200, etag=None, length=None):
+        headers = {'Content-Type': 'video/mp4'}
+        if etag:
+            headers['ETag'] = etag
+        if length is not None:
+            headers['Content-Length'] = str(length)
+        resp = MagicMock(status_code=status, headers=headers)
+        resp.iter_content = lambda chunk_size: iter([body[:3], body[3:]])
+        if status >= 400:
+            resp.raise_for_status.side_effect = pub.requests.HTTPError(str(status))
+        return resp
+
+    def _upload(self, url=URL, cache=None, offset=0):
+        """Lê o media como o upload YouTube (_open_media) e devolve os bytes enviados."""
+        pub.media_cache = cache or self.cache
+        chunks, _, _, close = pub._open_media(url, offset)
+        try:
+            return b''.join(chunks)
+        finally:
+            close()
+
+    def _cached(self, url=URL, cache=None):
+        cache = cache or self.cache
+        entry = cache._entry(url)
+        return cache._path(entry['sha256']) if entry else None
+
+    def test_descarrega_uma_vez_por_run(self):
+        with patch.object(pub.http, 'get', return_value=self._resp(b'abcdef')) as mock_get:
+            first  = self._upload()
+            second = self._upload()
+        mock_get.assert_called_once()
+        self.assertEqual((first, second), (b'abcdef', b'abcdef'))
+        self.assertEqual(self.cache._entry(self.URL)['size'], 6)
+
+    def test_grava_enquanto_o_upload_le(self):
+        pub.media_cache = self.cache
+        with patch.object(pub.http, 'get', return_value=self._resp(b'abcdef')):
+            chunks, _, _, close = pub._open_media(self.URL)
+        # o download não é feito antes do upload: nada na cache até ao último bloco
+        self.assertIsNone(self._cached())
+        self.assertEqual(b''.join(chunks), b'abcdef')
+        close()
+        with open(self._cached(), 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+    def test_upload_interrompido_nao_fica_na_cache(self):
+        pub.media_cache = self.cache
+        with patch.object(pub, 'YOUTUBE_CHUNK_SIZE', 3), \
+             patch.object(pub.http, 'get', return_value=self._resp(b'abcdef')):
+            chunks, _, _, close = pub._open_media(self.URL)
+            self.assertEqual(next(chunks), b'abc')
+            close()
+        self.assertIsNone(self._cached())
+        self.assertEqual(os.listdir(self.tmp.name), [])   # nem o ficheiro parcial
+        self.assertEqual(self.cache._downloading, set())
+
+    def test_media_maior_que_a_cache_nao_e_gravado(self):
+        cache = pub.MediaCache(self.tmp.name, max_bytes=4)
+        with patch.object(pub.http, 'get', side_effect=[self._resp(b'abcdef', length=6),
+                                                        self._resp(b'abcdef')]):
+            self.assertEqual(self._upload(cache=cache), b'abcdef')   # Content-Length acima do tecto
+            self.assertEqual(self._upload(cache=cache), b'abcdef')   # sem Content-Length: desiste a meio
+        self.assertIsNone(self._cached(cache=cache))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_enderecado_pelo_conteudo(self):
+        with patch.object(pub.http, 'get', side_effect=[self._resp(b'abcdef'), self._resp(b'abcdef')]):
+            self._upload()
+            self._upload('https://outro.example.com/copia.mp4')
+        path = self._cached()
+        self.assertEqual(path, self._cached('https://outro.example.com/copia.mp4'))
+        self.assertEqual(os.path.basename(path), pub.hashlib.sha256(b'abcdef').hexdigest())
+
+    def test_entre_runs_revalida_com_etag(self):
+        with patch.object(pub.http, 'get', return_value=self._resp(b'abcdef', etag='"v1"')):
+            self._upload()
+        next_run = pub.MediaCache(self.tmp.name, max_bytes=1024)
+        with patch.object(pub.http, 'get', return_value=self._resp(status=304)) as mock_get:
+            self.assertEqual(self._upload(cache=next_run), b'abcdef')
+        self.assertEqual(mock_get.call_args[1]['headers'], {'If-None-Match': '"v1"'})
+
+    def test_lru_apaga_o_menos_usado(self):
+        cache = pub.MediaCache(self.tmp.name, max_bytes=10)
+        with patch.object(pub.http, 'get', side_effect=[self._resp(b'aaaaaa'), self._resp(b'bbbbbb')]):
+            self._upload('https://x/a.mp4', cache)
+            old = self._cached('https://x/a.mp4', cache)
+            os.utime(old, (1, 1))
+            self._upload('https://x/b.mp4', cache)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(self._cached('https://x/b.mp4', cache)))
+        self.assertNotIn('https://x/a.mp4', cache._index)
+
+    def test_erro_http_nao_fica_na_cache(self):
+        with patch.object(pub.http, 'get', return_value=self._resp(status=404)):
+            with self.assertRaises(pub.requests.HTTPError):
+                self._upload()
+        self.assertEqual(self.cache._index, {})
+
+    def test_youtube_retoma_a_partir_da_cache(self):
+        with patch.object(pub.http, 'get', return_value=self._resp(b'abcdef')):
+            self._upload()
+        pub.media_cache = self.cache
+        chunks, content_type, total, close = pub._open_media(self.URL, offset=2)
+        try:
+            self.assertEqual(b''.join(chunks), b'cdef')
+            self.assertEqual((content_type, total), ('video/mp4', 6))
+        finally:
+            close()
+
+
+# ── Testes: validação prévia de media ────────────────────────────────────
+class TestPreflightMedia(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        pub.PREFLIGHT = True
+
+    def tearDown(self):
+        pub.PREFLIGHT = False
+
+    @staticmethod
+    def _head(status=200, content_type='video/mp4', size=1000, headers=None):
+        h = {'Content-Type': content_type}
+        if size is not None:
+            h['Content-Length'] = str(size)
+        h.update(headers or {})
+        return MagicMock(status_code=status, ok=status < 400, headers=h)
+
+    def test_media_usado_por_cada_plataforma(self):
+        post = {'imagem_url': 'https://i.jpg', 'video_url': 'https://v.mp4'}
+        self.assertEqual(pub.media_for(post, 'instagram'), ('video', 'https://v.mp4'))
+        self.assertEqual(pub.media_for(post, 'facebook'), ('image', 'https://i.jpg'))
+        self.assertIsNone(pub.media_for({'legenda': 'só texto'}, 'facebook'))
+
+    def test_probe_usa_range_quando_head_nao_serve(self):
+        ranged = self._head(206, size=None, headers={'Content-Range': 'bytes 0-0/5242880'})
+        with patch.object(pub.http, 'head', return_value=self._head(405)), \
+             patch.object(pub.http, 'get', return_value=ranged) as mock_get:
+            info = pub.probe_media('https://v.mp4')
+        self.assertEqual(mock_get.call_args[1]['headers'], {'Range': 'bytes=0-0'})
+        self.assertEqual(info, {'content_type': 'video/mp4', 'size': 5242880})
+
+    def test_probe_inconclusivo_em_erro_de_rede_ou_5xx(self):
+        with patch.object(pub.http, 'head', side_effect=pub.requests.ConnectionError('dns')):
+            self.assertIsNone(pub.probe_media('https://v.mp4'))
+        with patch.object(pub.http, 'head', return_value=self._head(503)):
+            self.assertIsNone(pub.probe_media('https://v.mp4'))
+
+    def test_limites_por_plataforma(self):
+        self.assertIsNone(pub.check_media('youtube', 'video', {'content_type': 'video/webm', 'size': 10}))
+        self.assertIn('não suportado', pub.check_media('instagram', 'video', {'content_type': 'video/webm'}))
+        self.assertIn('excede', pub.check_media('instagram', 'image',
+                                                {'content_type': 'image/jpeg', 'size': 9 * pub.MB}))
+        self.assertIn('HTTP 404', pub.check_media('tiktok', 'image', {'error': 'HTTP 404'}))
+        self.assertIsNone(pub.check_media('facebook', 'image', {'content_type': 'application/octet-stream'}))
+
+    def test_um_pedido_por_url_distinto(self):
+        jobs = {
+            'p1': ({'id': 'p1', 'video_url': 'https://v.mp4'}, ['instagram', 'youtube']),
+            'p2': ({'id': 'p2', 'video_url': 'https://v.mp4'}, ['tiktok']),
+        }
+        with patch.object(pub.http, 'head', return_value=self._head()) as mock_head:
+            self.assertEqual(pub.preflight_media(jobs), {})
+        mock_head.assert_called_once()
+
+    def test_post_com_media_invalido_falha_sem_chamar_o_publisher(self):
+        instagram = MagicMock(return_value=True)
+        post = {'id': 'p1', 'plataformas': ['instagram'], 'video_url': 'https://v.webm'}
+        with patch.object(pub.http, 'head', return_value=self._head(content_type='video/webm')), \
+             patch.dict(pub.PUBLISHERS, {'instagram': instagram}):
+            published, errors = pub.publish_posts([post])
+        self.assertEqual((published, errors), (0, 1))
+        instagram.assert_not_called()
+        data = self.supa.table.return_value.update.call_args[0][0]
+        self.assertEqual(data['status'], 'erro')   # não vale a pena repetir
+        self.assertIn('instagram: vídeo video/webm não suportado', data['error_msg'])
+
+    def test_so_a_plataforma_afectada_e_saltada(self):
+        youtube = MagicMock(return_value=True)
+        post = {'id': 'p1', 'plataformas': ['instagram', 'youtube'], 'video_url': 'https://v.webm'}
+        with patch.object(pub.http, 'head', return_value=self._head(content_type='video/webm')), \
+             patch.dict(pub.PUBLISHERS, {'instagram': MagicMock(), 'youtube': youtube}):
+            published, _ = pub.publish_posts([post])
+        self.assertEqual(published, 1)
+        youtube.assert_called_once()
+
+
+# ── Testes: cliente Supabase lazy e import rápido ────────────────────────
+class TestLazyImport(unittest.TestCase):
+
+    def test_import_nao_carrega_supabase_nem_exige_credenciais(self):
+        env = {k: v for k, v in os.environ.items() if not k.startswith('SUPABASE_')}
+        env['PYTHONPATH'] = os.path.dirname(_spec.origin)   # telemetry.py
+        code = ('import importlib.util, sys\n'
+                f'spec = importlib.util.spec_from_file_location("publish", {_spec.origin!r})\n'
+                'mod = importlib.util.module_from_spec(spec); spec.loader.exec_module(mod)\n'
+                'print("supabase" in sys.modules)')
+        import subprocess
+        res = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertEqual(res.stdout.strip(), 'False')
+
+    def test_cliente_criado_uma_vez_no_primeiro_uso(self):
+        fake = MagicMock()
+        client = pub.LazyClient()
+        with patch.dict(sys.modules, {'supabase': fake}):
+            fake.create_client.assert_not_called()
+            client.table('posts')
+            client.rpc('claim_due_posts', {})
+        fake.create_client.assert_called_once_with(pub.SUPABASE_URL, pub.SUPABASE_KEY)
+        fake.create_client.return_value.table.assert_called_once_with('posts')
+
+    def test_sem_credenciais_falha_so_no_uso(self):
+        client = pub.LazyClient()
+        with patch.object(pub, 'SUPABASE_URL', ''):
+            with self.assertRaises(RuntimeError):
+                client.table('posts')
+
+    def test_import_report(self):
+        lines = ['import time: self [us] | cumulative | imported package',
+                 'import time:       100 |        100 | encodings',
+                 'import time:       500 |        900 |     requests.compat',
+                 'import time:       200 |       1100 |   requests',
+                 'import time:        50 |         50 |   json',
+                 'import time:       300 |       1450 | publish']
+        with patch('subprocess.run', return_value=MagicMock(returncode=0, stderr='\n'.join(lines))), \
+             patch('builtins.print') as out:
+            self.assertEqual(pub.import_report(), 0)
+        printed = [c[0][0] for c in out.call_args_list]
+        self.assertIn('1.4 ms (3 módulos carregados)', printed[0])
+        self.assertTrue(printed[2].rstrip().endswith('requests'))
+        self.assertEqual(len(printed), 4)
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.supa = MagicMock()
+        pub.supabase = self.supa
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'trace.jsonl')
+        self._tracer = pub.tracer
+        pub.tracer = pub.Tracer('publish', path=self.path)
+
+    def tearDown(self):
+        pub.tracer = self._tracer
+        self.tmp.cleanup()
+
+    def _spans(self):
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        return json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    def _attrs(self, span):
+        return {a['key']: list(a['value'].values())[0] for a in span['attributes']}
+
+    def test_hierarquia_run_post_plataforma_http(self):
+        def instagram(post):
+            pub.http.get('https://graph.facebook.com/v19.0/17841400000000000/media?access_token=secreto')
+            return True
+
+        resp = MagicMock(status_code=200, headers={'Content-Length': '12'})
+        with patch('requests.Session.request', return_value=resp), \
+             patch.dict(pub.PUBLISHERS, {'instagram': instagram, 'tiktok': lambda post: False}):
+            with pub.tracer.span('publish run', root=True):
+                pub.publish_posts([{'id': 'p1', 'plataformas': ['instagram', 'tiktok']}])
+        pub.tracer.export()
+
+        spans = {s['name']: s for s in self._spans()}
+        run, post = spans['publish run'], spans['post']
+        self.assertNotIn('parentSpanId', run)
+        self.assertEqual(post['parentSpanId'], run['spanId'])
+        self.assertEqual(spans['publish instagram']['parentSpanId'], post['spanId'])
+        self.assertEqual(spans['publish tiktok']['status']['code'], 2)
+
+        http_span = spans['GET graph.facebook.com/v19.0/:id/media']
+        self.assertEqual(http_span['parentSpanId'], spans['publish instagram']['spanId'])
+        self.assertEqual(http_span['traceId'], run['traceId'])
+        attrs = self._attrs(http_span)
+        self.assertEqual(attrs['http.response.status_code'], '200')
+        self.assertEqual(attrs['http.response.body.size'], '12')
+        self.assertNotIn('secreto', json.dumps(http_span))
+        self.assertEqual(self._attrs(post)['platform.tiktok'], 'erro')
+
+    def test_pedidos_fora_de_spans_nao_sao_registados(self):
+        with patch('requests.Session.request', return_value=MagicMock(status_code=200, headers={})):
+            pub.http.get('https://graph.facebook.com/v19.0/me')
+        self.assertIsNone(pub.tracer.export())
+
+    def test_main_exporta_um_trace_por_run(self):
+        with patch.object(pub, 'due_post_pages', return_value=iter([])), \
+             patch.object(pub, 'DRY_RUN', True), \
+             self.assertRaises(SystemExit):
+            pub.main()
+        names = [s['name'] for s in self._spans()]
+        self.assertIn('publish run', names)
+        self.assertIn('supabase fetch posts', names)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
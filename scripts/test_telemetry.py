@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Testes unitários para scripts/telemetry.py
+
+Executa:
+  python scripts/test_telemetry.py
+  python -m pytest scripts/test_telemetry.py -v
+"""
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telemetry import Histogram, Metrics, Tracer, endpoint_label
+
+
+class TestEndpointLabel(unittest.TestCase):
+
+    def test_ids_trocados_em_hosts_de_api(self):
+        label = endpoint_label('https://graph.facebook.com/v19.0/17841400000000000/media?x=1',
+                               {'graph.facebook.com'})
+        self.assertEqual(label, 'graph.facebook.com/v19.0/:id/media')
+
+    def test_hosts_desconhecidos_agrupados_como_media(self):
+        self.assertEqual(endpoint_label('https://cdn.example.com/a/b/video.mp4', {'api.x'}), 'media')
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_cumulativos(self):
+        hist = Histogram(buckets=(1, 5))
+        for value in (0.5, 1, 3, 10):
+            hist.observe(value)
+        self.assertEqual(hist.cumulative(), [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual(hist.count, 4)
+        self.assertAlmostEqual(hist.sum, 14.5)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_formato_prometheus(self):
+        metrics = Metrics('job')
+        metrics.inc('posts_total', result='publicado')
+        metrics.inc('posts_total', result='publicado')
+        metrics.observe('http_request_duration_seconds', 0.2, platform='tiktok')
+        with metrics.phase('fetch'):
+            pass
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE job_posts_total counter', text)
+        self.assertIn('job_posts_total{result="publicado"} 2', text)
+        self.assertIn('# TYPE job_http_request_duration_seconds histogram', text)
+        self.assertIn('job_http_request_duration_seconds_bucket{platform="tiktok",le="0.25"} 1', text)
+        self.assertIn('job_http_request_duration_seconds_bucket{platform="tiktok",le="+Inf"} 1', text)
+        self.assertIn('job_http_request_duration_seconds_count{platform="tiktok"} 1', text)
+        self.assertIn('job_phase_seconds{phase="fetch"}', text)
+        self.assertEqual(text.count('# TYPE job_posts_total'), 1)
+
+    def test_labels_escapados(self):
+        metrics = Metrics('job')
+        metrics.inc('erros_total', reason='a "b"\\c')
+        self.assertIn('job_erros_total{reason="a \\"b\\"\\\\c"} 1', metrics.to_prometheus())
+
+    def test_export_escreve_prom_e_json(self):
+        metrics = Metrics('job')
+        metrics.inc('posts_total', 3, result='erro')
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = metrics.export(tmp)
+            self.assertEqual(sorted(os.path.basename(p) for p in paths), ['job.json', 'job.prom'])
+            with open(os.path.join(tmp, 'job.json')) as f:
+                data = json.load(f)
+            self.assertEqual(os.listdir(tmp).count('job.prom.tmp'), 0)
+        self.assertEqual(data['job'], 'job')
+        self.assertEqual(data['counters'], [{'name': 'posts_total', 'labels': {'result': 'erro'}, 'value': 3}])
+
+    def test_export_sem_directorio_nao_escreve(self):
+        with patch.dict(os.environ, {'METRICS_DIR': ''}):
+            self.assertEqual(Metrics('job').export(), [])
+
+
+class TestTracer(unittest.TestCase):
+
+    def test_spans_aninhados_e_bind_em_threads(self):
+        tracer = Tracer('job', path='unused')
+        with tracer.span('run', root=True) as run:
+            with tracer.span('post') as post:
+                post.add('bytes', 10)
+                tracer.add('bytes', 5)
+            def request():
+                with tracer.span('http'):
+                    pass
+            worker = threading.Thread(target=tracer.bind(request))
+            worker.start()
+            worker.join()
+        spans = {s['name']: s for s in tracer.to_otlp(tracer._finished)['resourceSpans'][0]
+                 ['scopeSpans'][0]['spans']}
+        self.assertEqual(spans['post']['parentSpanId'], run.span_id)
+        self.assertEqual(spans['http']['parentSpanId'], run.span_id)
+        self.assertEqual(spans['post']['attributes'], [{'key': 'bytes', 'value': {'intValue': '15'}}])
+        self.assertEqual({s['traceId'] for s in spans.values()}, {run.trace_id})
+
+    def test_excepcao_marca_erro(self):
+        tracer = Tracer('job', path='unused')
+        with self.assertRaises(ValueError):
+            with tracer.span('x'):
+                raise ValueError('falhou')
+        self.assertEqual(tracer._finished[0].to_otlp()['status'],
+                         {'code': 2, 'message': 'ValueError: falhou'})
+
+    def test_child_sem_span_activo_nao_cria_span(self):
+        tracer = Tracer('job', path='unused')
+        with tracer.child('x') as span:
+            self.assertIsNone(span)
+        self.assertEqual(tracer._finished, [])
+
+    def test_export_acrescenta_uma_linha_por_chamada(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sub', 'trace.jsonl')
+            tracer = Tracer('job', path=path)
+            for _ in range(2):
+                with tracer.span('run', root=True):
+                    pass
+                self.assertEqual(tracer.export(), path)
+            self.assertIsNone(tracer.export())
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        resource = lines[0]['resourceSpans'][0]['resource']['attributes']
+        self.assertEqual(resource, [{'key': 'service.name', 'value': {'stringValue': 'job'}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
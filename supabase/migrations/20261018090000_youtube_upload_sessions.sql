@@ -0,0 +1,20 @@
+-- ============================================================
+-- Sessões de upload resumível do YouTube por post
+-- ============================================================
+-- O publish.py guarda aqui o URL da sessão (header Location do
+-- init) e o último byte confirmado. Se a run for interrompida a
+-- meio do upload, a run seguinte consulta a sessão e continua em
+-- vez de reenviar o vídeo todo.
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS yt_upload_url          text;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS yt_upload_offset       bigint;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS yt_upload_iniciado_em  timestamptz;
+
+COMMENT ON COLUMN posts.yt_upload_url IS
+  'URL da sessão de upload resumível do YouTube em curso (null quando não há upload pendente).';
+
+COMMENT ON COLUMN posts.yt_upload_offset IS
+  'Bytes já confirmados pelo YouTube na sessão yt_upload_url.';
+
+COMMENT ON COLUMN posts.yt_upload_iniciado_em IS
+  'Início da sessão — o YouTube expira sessões resumíveis ao fim de uma semana.';
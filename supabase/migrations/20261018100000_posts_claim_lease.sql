@@ -0,0 +1,53 @@
+-- ============================================================
+-- Reserva (lease) atómica de posts para publicadores em paralelo
+-- ============================================================
+-- claim_due_posts() passa posts em atraso para 'publicando' com o
+-- ID do worker e um prazo de lease. FOR UPDATE SKIP LOCKED garante
+-- que dois workers nunca reservam o mesmo post; leases expirados
+-- (worker morto a meio) voltam a poder ser reservados.
+
+ALTER TABLE posts DROP CONSTRAINT IF EXISTS posts_status_check;
+ALTER TABLE posts ADD CONSTRAINT posts_status_check
+  CHECK (status IN ('rascunho','agendado','publicando','publicado','erro'));
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS lease_worker    text;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS lease_expira_em timestamptz;
+
+COMMENT ON COLUMN posts.lease_worker IS
+  'ID do processo publish.py que reservou o post (status = publicando).';
+
+COMMENT ON COLUMN posts.lease_expira_em IS
+  'Fim da reserva — depois disto outro worker pode voltar a reservar o post.';
+
+-- Índice para encontrar leases expirados sem varrer a tabela
+CREATE INDEX IF NOT EXISTS posts_lease_expira_idx
+  ON posts(lease_expira_em) WHERE status = 'publicando';
+
+CREATE OR REPLACE FUNCTION claim_due_posts(
+  p_worker        text,
+  p_limit         integer DEFAULT 20,
+  p_lease_seconds integer DEFAULT 1800
+)
+RETURNS SETOF posts
+LANGUAGE sql
+AS $$
+  WITH due AS (
+    SELECT id
+      FROM posts
+     WHERE (status = 'agendado'   AND agendado_para <= now())
+        OR (status = 'publicando' AND lease_expira_em < now())
+     ORDER BY agendado_para, id
+     LIMIT p_limit
+       FOR UPDATE SKIP LOCKED
+  )
+  UPDATE posts p
+     SET status          = 'publicando',
+         lease_worker    = p_worker,
+         lease_expira_em = now() + make_interval(secs => p_lease_seconds)
+    FROM due
+   WHERE p.id = due.id
+  RETURNING p.*;
+$$;
+
+COMMENT ON FUNCTION claim_due_posts(text, integer, integer) IS
+  'Reserva até p_limit posts em atraso (ou com lease expirado) para o worker p_worker.';
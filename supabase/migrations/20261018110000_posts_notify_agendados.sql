@@ -0,0 +1,32 @@
+-- ============================================================
+-- NOTIFY quando um post é agendado ou reagendado
+-- ============================================================
+-- O publish.py em modo daemon faz LISTEN neste canal para
+-- recalcular o próximo despertar de imediato, em vez de esperar
+-- pelo próximo poll. Payload: {"id": ..., "agendado_para": ...}.
+-- Nota: LISTEN precisa de uma ligação directa ou do pooler em
+-- modo sessão (o modo transacção não entrega notificações).
+
+CREATE OR REPLACE FUNCTION notify_posts_agendados()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.status = 'agendado' AND (
+       TG_OP = 'INSERT'
+       OR NEW.status        IS DISTINCT FROM OLD.status
+       OR NEW.agendado_para IS DISTINCT FROM OLD.agendado_para
+     ) THEN
+    PERFORM pg_notify(
+      'posts_agendados',
+      json_build_object('id', NEW.id, 'agendado_para', NEW.agendado_para)::text
+    );
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS posts_notify_agendados ON posts;
+CREATE TRIGGER posts_notify_agendados
+  AFTER INSERT OR UPDATE OF status, agendado_para ON posts
+  FOR EACH ROW EXECUTE FUNCTION notify_posts_agendados();
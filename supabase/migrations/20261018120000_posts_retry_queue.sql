@@ -0,0 +1,48 @@
+-- ============================================================
+-- Fila de novas tentativas para posts que falharam
+-- ============================================================
+-- Quando nenhuma plataforma publica um post, o publish.py volta a
+-- pô-lo em 'agendado' com proxima_tentativa_em no futuro (backoff
+-- exponencial). Ao fim de PUBLISH_MAX_ATTEMPTS tentativas o post
+-- fica em 'erro' (dead letter) e deixa de ser processado.
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS tentativas           integer NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS proxima_tentativa_em timestamptz;
+
+COMMENT ON COLUMN posts.tentativas IS
+  'Número de runs em que a publicação falhou em todas as plataformas.';
+
+COMMENT ON COLUMN posts.proxima_tentativa_em IS
+  'Antes desta hora o post não é publicado (null = sem nova tentativa pendente).';
+
+CREATE INDEX IF NOT EXISTS posts_proxima_tentativa_idx
+  ON posts(proxima_tentativa_em) WHERE status = 'agendado';
+
+-- claim_due_posts passa a respeitar proxima_tentativa_em
+CREATE OR REPLACE FUNCTION claim_due_posts(
+  p_worker        text,
+  p_limit         integer DEFAULT 20,
+  p_lease_seconds integer DEFAULT 1800
+)
+RETURNS SETOF posts
+LANGUAGE sql
+AS $$
+  WITH due AS (
+    SELECT id
+      FROM posts
+     WHERE (status = 'agendado'
+            AND agendado_para <= now()
+            AND (proxima_tentativa_em IS NULL OR proxima_tentativa_em <= now()))
+        OR (status = 'publicando' AND lease_expira_em < now())
+     ORDER BY agendado_para, id
+     LIMIT p_limit
+       FOR UPDATE SKIP LOCKED
+  )
+  UPDATE posts p
+     SET status          = 'publicando',
+         lease_worker    = p_worker,
+         lease_expira_em = now() + make_interval(secs => p_lease_seconds)
+    FROM due
+   WHERE p.id = due.id
+  RETURNING p.*;
+$$;
@@ -0,0 +1,27 @@
+-- ============================================================
+-- Estado de publicação por (post, plataforma)
+-- ============================================================
+-- O publish.py grava aqui o resultado de cada plataforma e, antes de
+-- publicar, salta as que já estão 'publicado'. Assim uma nova
+-- tentativa (fila de tentativas, lease expirado ou re-agendamento
+-- manual) só chama as plataformas que ainda faltam.
+
+CREATE TABLE IF NOT EXISTS post_plataformas (
+  post_id        uuid NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+  plataforma     text NOT NULL,
+  status         text NOT NULL CHECK (status IN ('publicado','erro')),
+  error_msg      text,
+  atualizado_em  timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (post_id, plataforma)
+);
+
+COMMENT ON TABLE post_plataformas IS
+  'Resultado da última tentativa de publicação de cada post em cada plataforma.';
+
+ALTER TABLE post_plataformas ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Authenticated users full access"
+  ON post_plataformas FOR ALL
+  TO authenticated
+  USING (true)
+  WITH CHECK (true);
@@ -0,0 +1,23 @@
+-- ============================================================
+-- Estado final das publicações assíncronas (TikTok)
+-- ============================================================
+-- O TikTok aceita o pedido (publish_id) e só depois vai buscar e
+-- publicar o media. O publish.py grava a linha como 'processando' e
+-- o TikTokStatusTracker actualiza-a para 'publicado' (com o ID e o
+-- URL finais do vídeo) ou 'falhou' (com o motivo em erro).
+
+ALTER TABLE publicados ADD COLUMN IF NOT EXISTS estado text NOT NULL DEFAULT 'publicado';
+ALTER TABLE publicados ADD COLUMN IF NOT EXISTS erro   text;
+
+ALTER TABLE publicados DROP CONSTRAINT IF EXISTS publicados_estado_check;
+ALTER TABLE publicados ADD CONSTRAINT publicados_estado_check
+  CHECK (estado IN ('processando','publicado','falhou'));
+
+CREATE INDEX IF NOT EXISTS publicados_processando_idx
+  ON publicados(plataforma, publicado_em) WHERE estado = 'processando';
+
+COMMENT ON COLUMN publicados.estado IS
+  'processando = aceite pela plataforma mas ainda não publicado; falhou = a plataforma rejeitou o media.';
+
+COMMENT ON COLUMN publicados.erro IS
+  'Motivo da falha reportado pela plataforma (ex.: fail_reason do TikTok).';
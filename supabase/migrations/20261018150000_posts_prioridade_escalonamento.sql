@@ -0,0 +1,78 @@
+-- ============================================================
+-- Prioridade e escalonamento justo entre avatares
+-- ============================================================
+-- Ordenar só por agendado_para deixava um avatar com um backlog
+-- grande (ex.: campanha de 200 posts) à frente dos posts a tempo de
+-- todos os outros. claim_due_posts() passa a escolher por:
+--   1. posts.prioridade (maior primeiro);
+--   2. posts a tempo do slot (devidos há menos de p_grace_seconds)
+--      antes do backlog;
+--   3. rotação entre avatares — a 1.ª vez de cada avatar, depois a
+--      2.ª, … — e, com p_fair_campaign, entre as campanhas de cada
+--      avatar; na mesma volta, o mais antigo primeiro.
+-- São as mesmas regras de schedule_posts() no publish.py.
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS prioridade smallint NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN posts.prioridade IS
+  'Prioridade de publicação (maior primeiro; default 0). Passa à frente de posts a tempo e do backlog.';
+
+CREATE INDEX IF NOT EXISTS posts_agendados_avatar_idx
+  ON posts(avatar_id, agendado_para) WHERE status = 'agendado';
+
+-- Novos parâmetros: substituir em vez de criar um overload ambíguo
+DROP FUNCTION IF EXISTS claim_due_posts(text, integer, integer);
+
+CREATE FUNCTION claim_due_posts(
+  p_worker        text,
+  p_limit         integer DEFAULT 20,
+  p_lease_seconds integer DEFAULT 1800,
+  p_grace_seconds integer DEFAULT 900,
+  p_fair_campaign boolean DEFAULT false
+)
+RETURNS SETOF posts
+LANGUAGE sql
+AS $$
+  WITH devidos AS (
+    SELECT id, avatar_id, campanha_id, prioridade, agendado_para,
+           agendado_para >= now() - make_interval(secs => p_grace_seconds) AS a_tempo
+      FROM posts
+     WHERE (status = 'agendado'
+            AND agendado_para <= now()
+            AND (proxima_tentativa_em IS NULL OR proxima_tentativa_em <= now()))
+        OR (status = 'publicando' AND lease_expira_em < now())
+  ),
+  por_campanha AS (
+    SELECT d.*,
+           row_number() OVER (PARTITION BY prioridade, a_tempo, avatar_id, campanha_id
+                              ORDER BY agendado_para, id) AS vez_campanha
+      FROM devidos d
+  ),
+  por_avatar AS (
+    SELECT id, prioridade, a_tempo, agendado_para,
+           row_number() OVER (PARTITION BY prioridade, a_tempo, avatar_id
+                              ORDER BY CASE WHEN p_fair_campaign THEN vez_campanha END,
+                                       agendado_para, id) AS vez
+      FROM por_campanha
+  ),
+  due AS (
+    SELECT p.id
+      FROM posts p
+      JOIN por_avatar o ON o.id = p.id
+     -- repetido em p para o FOR UPDATE reavaliar linhas já reservadas por outro worker
+     WHERE (p.status = 'agendado'
+            AND p.agendado_para <= now()
+            AND (p.proxima_tentativa_em IS NULL OR p.proxima_tentativa_em <= now()))
+        OR (p.status = 'publicando' AND p.lease_expira_em < now())
+     ORDER BY o.prioridade DESC, o.a_tempo DESC, o.vez, o.agendado_para, p.id
+     LIMIT p_limit
+       FOR UPDATE OF p SKIP LOCKED
+  )
+  UPDATE posts p
+     SET status          = 'publicando',
+         lease_worker    = p_worker,
+         lease_expira_em = now() + make_interval(secs => p_lease_seconds)
+    FROM due
+   WHERE p.id = due.id
+  RETURNING p.*;
+$$;
@@ -0,0 +1,22 @@
+-- ============================================================
+-- Duração das publicações por plataforma (prazo da run)
+-- ============================================================
+-- O publish.py grava quanto tempo demorou cada (post, plataforma),
+-- da 1.ª chamada até ficar publicado, e o tamanho do media. No
+-- arranque lê as durações recentes para estimar o custo de cada
+-- publicação e só começa as que ainda cabem no prazo da run
+-- (PUBLISH_RUN_BUDGET), antes de o workflow matar o job.
+
+ALTER TABLE post_plataformas ADD COLUMN IF NOT EXISTS duracao_ms  integer;
+ALTER TABLE post_plataformas ADD COLUMN IF NOT EXISTS media_bytes bigint;
+
+COMMENT ON COLUMN post_plataformas.duracao_ms IS
+  'Duração da última tentativa, em milissegundos (null = não medida, ex.: interrompida).';
+
+COMMENT ON COLUMN post_plataformas.media_bytes IS
+  'Tamanho do media publicado, em bytes, quando o servidor o indicou na pré-validação.';
+
+-- Histórico lido no arranque: publicações recentes com duração
+CREATE INDEX IF NOT EXISTS post_plataformas_duracao_idx
+  ON post_plataformas(atualizado_em DESC)
+  WHERE status = 'publicado' AND duracao_ms IS NOT NULL;
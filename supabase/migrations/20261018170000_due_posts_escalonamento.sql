@@ -0,0 +1,47 @@
+-- ============================================================
+-- Escalonamento justo também sem reservas (get_due_posts)
+-- ============================================================
+-- Sem PUBLISH_CLAIM, o publish.py lia os primeiros posts devidos por
+-- agendado_para e só depois os reordenava: com o backlog de um avatar
+-- maior que essa janela, os posts em atraso dos outros avatares nunca
+-- chegavam a ser lidos. due_posts() escolhe os p_limit posts com as
+-- mesmas regras de claim_due_posts() — prioridade, posts a tempo do
+-- slot e rotação entre avatares (e campanhas) —, mas só lê: não reserva
+-- nem altera o status.
+
+CREATE OR REPLACE FUNCTION due_posts(
+  p_limit         integer DEFAULT 20,
+  p_grace_seconds integer DEFAULT 900,
+  p_fair_campaign boolean DEFAULT false
+)
+RETURNS SETOF posts
+LANGUAGE sql
+STABLE
+AS $$
+  WITH devidos AS (
+    SELECT id, avatar_id, campanha_id, prioridade, agendado_para,
+           agendado_para >= now() - make_interval(secs => p_grace_seconds) AS a_tempo
+      FROM posts
+     WHERE status = 'agendado'
+       AND agendado_para <= now()
+       AND (proxima_tentativa_em IS NULL OR proxima_tentativa_em <= now())
+  ),
+  por_campanha AS (
+    SELECT d.*,
+           row_number() OVER (PARTITION BY prioridade, a_tempo, avatar_id, campanha_id
+                              ORDER BY agendado_para, id) AS vez_campanha
+      FROM devidos d
+  ),
+  por_avatar AS (
+    SELECT id, prioridade, a_tempo, agendado_para,
+           row_number() OVER (PARTITION BY prioridade, a_tempo, avatar_id
+                              ORDER BY CASE WHEN p_fair_campaign THEN vez_campanha END,
+                                       agendado_para, id) AS vez
+      FROM por_campanha
+  )
+  SELECT p.*
+    FROM posts p
+    JOIN por_avatar o ON o.id = p.id
+   ORDER BY o.prioridade DESC, o.a_tempo DESC, o.vez, o.agendado_para, p.id
+   LIMIT p_limit;
+$$;
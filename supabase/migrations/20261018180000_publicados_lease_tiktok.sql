@@ -0,0 +1,43 @@
+-- ============================================================
+-- Reserva (lease) das publicações TikTok em processamento
+-- ============================================================
+-- Com PUBLISH_CLAIM, cada worker retomava no arranque todas as linhas
+-- 'processando' de publicados e consultava-as em paralelo com os
+-- outros. A linha passa a ter o worker que a acompanha e um prazo:
+-- quem publica reserva-a logo no insert, e claim_tiktok_pending()
+-- entrega a cada worker só as linhas sem reserva, com a reserva
+-- expirada (worker que morreu) ou já suas.
+
+ALTER TABLE publicados ADD COLUMN IF NOT EXISTS lease_worker    text;
+ALTER TABLE publicados ADD COLUMN IF NOT EXISTS lease_expira_em timestamptz;
+
+COMMENT ON COLUMN publicados.lease_worker IS
+  'Worker que acompanha o estado desta publicação (só enquanto estado = processando).';
+
+COMMENT ON COLUMN publicados.lease_expira_em IS
+  'Fim da reserva; depois disso outro worker pode retomar a publicação.';
+
+CREATE OR REPLACE FUNCTION claim_tiktok_pending(
+  p_worker          text,
+  p_lease_seconds   integer DEFAULT 1800,
+  p_max_age_seconds integer DEFAULT 86400
+)
+RETURNS TABLE (post_id uuid, post_id_social text)
+LANGUAGE sql
+AS $$
+  WITH livres AS (
+    SELECT id
+      FROM publicados
+     WHERE plataforma = 'tiktok'
+       AND estado = 'processando'
+       AND publicado_em >= now() - make_interval(secs => p_max_age_seconds)
+       AND (lease_worker IS NULL OR lease_worker = p_worker OR lease_expira_em < now())
+       FOR UPDATE SKIP LOCKED
+  )
+  UPDATE publicados p
+     SET lease_worker    = p_worker,
+         lease_expira_em = now() + make_interval(secs => p_lease_seconds)
+    FROM livres
+   WHERE p.id = livres.id
+  RETURNING p.post_id, p.post_id_social;
+$$;
@@ -1,2 +1,6 @@
 -- Dados de exemplo para desenvolvimento local
 -- Este ficheiro é carregado automaticamente pelo `supabase db reset`
+--
+-- Dados sintéticos em volume (benchmarks / testes de carga), depois do reset:
+--   python scripts/gen_workload.py --scale 100 -o /tmp/load.sql
+--   psql "$SUPABASE_DB_URL" -f /tmp/load.sql